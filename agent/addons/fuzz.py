@@ -1,5 +1,29 @@
 import requests
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
+
+from addons import request
+
+
+def _request_with_proxy(method, url, data, headers, proxies):
+    """通过代理发送单个请求，返回与request.run相同格式的结果"""
+    try:
+        response = requests.request(
+            method=method,
+            url=url,
+            headers=headers,
+            data=data if data else None,
+            proxies=proxies,
+            verify=False,
+            timeout=10
+        )
+    except Exception as e:
+        return {'content': "", 'error': str(e)}
+    return {
+        'status': response.status_code,
+        'header': dict(response.headers),
+        'content': response.text
+    }
+
 
 def run(params):
     """
@@ -58,68 +82,84 @@ def run(params):
         param_has_fuzz = any(isinstance(v, str) and '{fuzz}' in v for v in post_data.values())
         header_has_fuzz = any(isinstance(v, str) and '{fuzz}' in v for v in headers.values())
         
-        # 对每个payload进行测试
+        # 构造每个payload的请求
+        cases = []
         for payload in payloads:
-            try:
-                encoded_payload = quote(payload)
-                
-                # 处理URL中的fuzz
-                current_url = params['url']
-                if url_has_fuzz:
-                    current_url = current_url.replace('{fuzz}', encoded_payload)
-                
-                # 处理POST参数中的fuzz
-                current_data = {}
-                if param_has_fuzz:
-                    for key, value in post_data.items():
-                        if isinstance(value, str):
-                            current_data[key] = value.replace('{fuzz}', encoded_payload)
-                        else:
-                            current_data[key] = value
-                else:
-                    current_data = post_data
+            encoded_payload = quote(payload)
 
-                # 处理header中的fuzz
-                current_headers = {}
-                if header_has_fuzz:
-                    for key, value in headers.items():
-                        if isinstance(value, str):
-                            current_headers[key] = value.replace('{fuzz}', encoded_payload)
-                        else:
-                            current_headers[key] = value
-                else:
-                    current_headers = headers
-                
-                # 发送请求
-                response = requests.request(
-                    method=params.get('method', 'GET'),
-                    url=current_url,
-                    headers=current_headers,
-                    data=current_data if current_data else None,
-                    proxies=proxies,
-                    verify=False,
-                    timeout=10
-                )
-                
-                # 记录结果
-                results.append({
-                    '发送payload': payload,
-                    'url': current_url,
-                    '发送参数': current_data,
-                    '发送头': current_headers,
-                    '页面响应': response.status_code,
-                    '页面返回头': dict(response.headers),
-                    '页面响应内容': response.text,
+            # 处理URL中的fuzz
+            current_url = params['url']
+            if url_has_fuzz:
+                current_url = current_url.replace('{fuzz}', encoded_payload)
+
+            # 处理POST参数中的fuzz
+            current_data = {}
+            if param_has_fuzz:
+                for key, value in post_data.items():
+                    if isinstance(value, str):
+                        current_data[key] = value.replace('{fuzz}', encoded_payload)
+                    else:
+                        current_data[key] = value
+            else:
+                current_data = post_data
+
+            # 处理header中的fuzz
+            current_headers = {}
+            if header_has_fuzz:
+                for key, value in headers.items():
+                    if isinstance(value, str):
+                        current_headers[key] = value.replace('{fuzz}', encoded_payload)
+                    else:
+                        current_headers[key] = value
+            else:
+                current_headers = headers
+
+            cases.append((payload, current_url, current_data, current_headers))
+
+        if proxies:
+            # request引擎不支持代理，设置代理时逐个发送
+            responses = [_request_with_proxy(params.get('method', 'GET'), url, data, case_headers, proxies)
+                         for _, url, data, case_headers in cases]
+        else:
+            # 在一个事件循环中并发发送所有请求，拿到flag后停止
+            batch = []
+            for _, url, data, case_headers in cases:
+                case_headers = dict(case_headers)
+                # 与requests发送字典参数一致，POST参数按表单提交
+                if data and not any(key.lower() == 'content-type' for key in case_headers):
+                    case_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+                batch.append({
+                    'url': url,
+                    'method': params.get('method', 'GET'),
+                    'header': case_headers,
+                    'raw': urlencode(data) if data else None,
+                    'timeout': 10,
+                    'history': False
                 })
-                
-            except Exception as e:
+            responses = request.run_batch(batch)
+
+        # 记录结果
+        for (payload, current_url, current_data, current_headers), response in zip(cases, responses):
+            if response is None:
+                continue
+            if response.get('error'):
                 results.append({
                     'payload': payload,
-                    'url': current_url if 'current_url' in locals() else None,
-                    'data': current_data if 'current_data' in locals() else None,
-                    'headers': current_headers if 'current_headers' in locals() else None,
-                    'error': str(e)
+                    'url': current_url,
+                    'data': current_data,
+                    'headers': current_headers,
+                    'error': response['error']
                 })
+                continue
+            results.append({
+                '发送payload': payload,
+                'url': current_url,
+                '发送参数': current_data,
+                '发送头': current_headers,
+                '页面响应': response['status'],
+                '页面返回头': response['header'],
+                '页面响应内容': response['content'],
+            })
                 
         return results
         
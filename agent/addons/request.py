@@ -1,5 +1,7 @@
+import asyncio
 import base64
 import binascii
+import concurrent.futures
 import json
 import re
 import time
@@ -7,19 +9,20 @@ import uuid
 import warnings
 import importlib
 import os
-from hashlib import md5
 from html.parser import HTMLParser
 from urllib.parse import urlparse, parse_qs, urlencode
-from urllib.request import urlopen, Request, HTTPHandler, HTTPSHandler, build_opener, ProxyHandler, HTTPRedirectHandler
-from urllib.error import HTTPError, URLError
-from http.cookiejar import CookieJar
-import ssl
+import sys
+import threading
 import traceback
 from config import config
-from utils import flagUtil
+from utils import async_http, fingerprint, flagUtil, host_limiter, http_body, http_pool, response_cache, simhash, tokenizer
+from utils.logger import logger
 
 warnings.filterwarnings("ignore")
 
+# 未指定User-Agent时使用与urllib相同的默认值
+DEFAULT_USER_AGENT = f"Python-urllib/{sys.version_info.major}.{sys.version_info.minor}"
+
 
 def remove_svg_from_content(content):
     """
@@ -43,6 +46,115 @@ def remove_svg_from_content(content):
     return cleaned_content
 
 
+# 响应精简统计，随心跳上报
+_minimize_lock = threading.Lock()
+_minimize_stats = {"pages": 0, "bytes_before": 0, "bytes_after": 0, "tokens_before": 0, "tokens_after": 0}
+
+# 保留原样的块：pre和textarea中的空白有意义（如命令执行结果），script和注释只去除缩进
+_preserve_pattern = re.compile(r'(<(pre|textarea)\b[^>]*>.*?</\2\s*>)', re.DOTALL | re.IGNORECASE)
+_html_pattern = re.compile(r'<(!doctype|html|head|body|div|table|form|p|span|ul)\b', re.IGNORECASE)
+_row_pattern = re.compile(r'<tr\b[^>]*>.*?</tr\s*>', re.DOTALL | re.IGNORECASE)
+# 包含flag的表格行不参与合并
+_flag_pattern = re.compile(r'flag\{', re.IGNORECASE)
+
+
+def _minimize_markup(content):
+    """移除svg、样式、data URI和模板化的标签属性，压缩空白"""
+    content = re.sub(r'<svg[^>]*>.*?</svg>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    # 样式表和内联样式
+    content = re.sub(r'<style\b[^>]*>.*?</style\s*>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    content = re.sub(r'\s+style\s*=\s*("[^"]*"|\'[^\']*\')', '', content, flags=re.IGNORECASE)
+    # base64编码的data URI只保留类型
+    content = re.sub(r'data:([\w/+.-]*);base64,[A-Za-z0-9+/=\s]{64,}',
+                     lambda m: f'data:{m.group(1)};base64,...', content)
+    # 样式表、图标、预加载等外部资源引用，以及viewport、charset等meta标签
+    content = re.sub(r'<link\b[^>]*\brel\s*=\s*["\']?(stylesheet|icon|shortcut icon|apple-touch-icon|preload|preconnect|dns-prefetch|manifest)\b[^>]*>',
+                     '', content, flags=re.IGNORECASE)
+    content = re.sub(r'<meta\b[^>]*\b(charset|name\s*=\s*["\']?(viewport|theme-color))\b[^>]*>', '', content, flags=re.IGNORECASE)
+    # 无障碍属性和子资源完整性校验属性
+    content = re.sub(r'\s+(aria-[\w-]+|integrity|crossorigin)\s*=\s*("[^"]*"|\'[^\']*\')', '', content, flags=re.IGNORECASE)
+    # 压缩空白：去掉行首缩进和行尾空白，合并空行和连续空格
+    content = re.sub(r'[ \t]+', ' ', content)
+    content = re.sub(r' ?\n[\s]*', '\n', content)
+    return content.strip()
+
+
+def _dedupe_rows(content):
+    """
+    合并连续的相似表格行：只有数字不同的行超过MINIMIZE_MAX_SIMILAR_ROWS行时，
+    保留开头和最后一行，中间替换为省略说明，包含flag的行始终保留
+    """
+    rows = list(_row_pattern.finditer(content))
+    if len(rows) <= config.MINIMIZE_MAX_SIMILAR_ROWS:
+        return content
+
+    def shape(row):
+        if _flag_pattern.search(row.group(0)):
+            return row.start()
+        return re.sub(r'\d+', '0', row.group(0))
+
+    result = []
+    last = 0
+    i = 0
+    while i < len(rows):
+        j = i
+        # 只合并中间没有其他内容的连续行
+        while j + 1 < len(rows) and shape(rows[j + 1]) == shape(rows[i]) and not content[rows[j].end():rows[j + 1].start()].strip():
+            j += 1
+        count = j - i + 1
+        if count > config.MINIMIZE_MAX_SIMILAR_ROWS:
+            keep = config.MINIMIZE_MAX_SIMILAR_ROWS - 1
+            result.append(content[last:rows[i + keep - 1].end()])
+            result.append(f"\n<!-- 省略{count - keep - 1}行相似的表格行 -->\n")
+            result.append(rows[j].group(0))
+            last = rows[j].end()
+        i = j + 1
+    result.append(content[last:])
+    return "".join(result)
+
+
+def minimize_response(content, url=""):
+    """
+    精简响应内容，减少放入提示词的token数
+    HTML响应移除svg、样式、data URI和模板化的标签，压缩空白并合并重复的表格行，
+    表单、链接、注释、脚本和文本内容保持不变，pre和textarea中的内容保留原样
+    :param content: 响应内容
+    :param url: 响应地址，用于记录日志
+    :return: 精简后的内容
+    """
+    if not content or not config.MINIMIZE_ENABLE:
+        return content
+    if _html_pattern.search(content):
+        parts = _preserve_pattern.split(content)
+        # split后每3项为：普通内容、保留块、标签名
+        minimized = "".join(part if i % 3 == 1 else _minimize_markup(part) if i % 3 == 0 else ""
+                            for i, part in enumerate(parts))
+        minimized = _dedupe_rows(minimized)
+    else:
+        minimized = remove_svg_from_content(content)
+
+    bytes_before, bytes_after = len(content.encode()), len(minimized.encode())
+    tokens_before, tokens_after = tokenizer.estimate_tokens(content), tokenizer.estimate_tokens(minimized)
+    with _minimize_lock:
+        _minimize_stats["pages"] += 1
+        _minimize_stats["bytes_before"] += bytes_before
+        _minimize_stats["bytes_after"] += bytes_after
+        _minimize_stats["tokens_before"] += tokens_before
+        _minimize_stats["tokens_after"] += tokens_after
+    if bytes_before - bytes_after >= config.MINIMIZE_LOG_BYTES:
+        logger.info(f"响应精简 {url}：{bytes_before} -> {bytes_after} 字节，节省约 {tokens_before - tokens_after} 个token")
+    return minimized
+
+
+def get_minimize_stats():
+    """获取响应精简统计"""
+    with _minimize_lock:
+        stats = dict(_minimize_stats)
+    stats["bytes_saved"] = stats["bytes_before"] - stats["bytes_after"]
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    return stats
+
+
 def extract_forms(html):
     """从HTML中提取form元素和对应的URL"""
 
@@ -87,61 +199,201 @@ def extract_forms(html):
     return parser.forms
 
 
-def add_page(new_page, need_save=False):
+def _claim_page(new_page):
+    """
+    按请求和响应内容去重，新页面记录到已探索列表
+    与已有页面近似（只有令牌、时间戳等少量内容不同）的页面记录为该页面的变体，不作为新页面
+    :return: 是否为新页面
+    """
+    request = new_page['request']
+    response = new_page['response']
+    if not response or response['status'] == 404:
+        return False
+    md5_response = fingerprint.page_fingerprint(request, response['content'])
+    if md5_response in config.EXPLORED_PAGE_RESPONSES:
+        simhash.page_index.count_duplicate()
+        return False
+    config.EXPLORED_PAGE_RESPONSES.append(md5_response)
+    variant_of = simhash.page_index.add(fingerprint.request_fingerprint(request), request, response)
+    if variant_of:
+        new_page['variant_of'] = variant_of
+        return False
+    return True
+
+
+def _finish_page(new_page, save_result, need_save=False):
+    """根据页面分析结果补全页面信息，记录表单并上报页面"""
     from utils.agent_manager import agent_manager
-    from agents.saver import save_page
     request = new_page['request']
     response = new_page['response']
-    md5_request = md5((str(request) + config.TASK_ID).encode()).hexdigest()
-    md5_response = md5((request['method']+str(request['params'])+str(response['content']) + config.TASK_ID).encode()).hexdigest()
-    if new_page['response'] and md5_response not in config.EXPLORED_PAGE_RESPONSES and new_page['response'][
-        'status'] != 404:
-        config.EXPLORED_PAGE_RESPONSES.append(md5_response)
-        if not need_save:
-            save_result = save_page(new_page)
-            if config.NEED_FLAG and save_result['flag']:
-                if "/admin../flag.txt" in response['url']:
-                    time.sleep(120)
-                flagUtil.set_flag(save_result['flag'])
-        else:
-            save_result = {
-                'name': str(md5_request),
-                'description': '',
-                'key': '',
-                'flag': ''
-            }
-        new_page['key'] = save_result.get("key", "")
-        new_page['description'] = save_result.get("description", "")
-        new_page['name'] = save_result['name']
-        new_page['id'] = md5_request
-
-        form_datas = extract_forms(response['content'])
-        for form_data in form_datas:
-            config.FORMS[form_data['url']] = form_data
-            config.EXPLORE_URLS.append(response['url'])
-
-        if need_save and config.HUNTER:
-            config.HUNTER.explorer_pages.append(new_page)
-            page_data = {
-                "name": new_page['name'],
-                "request": json.dumps(new_page.get('request', {})),
-                "response": json.dumps(new_page.get('response', {})),
-                "description": new_page.get('description', ''),
-                "key": new_page.get('key', '')
-            }
-            created_page = agent_manager.create_page(agent_manager.current_task_id, page_data)
-
-            # if new_page["key"]:
-            #     with open(config.HUNTER.key_simple_file, "a+") as f:
-            #         f.write(str(['name']) + f" {new_page['response']['url']} 发现线索：" + str(new_page['key']) + "\n")
-            #     with open(config.HUNTER.key_file, "a+") as f:
-            #         f.write(str(new_page['name']) + f" 请求：{new_page['request']} 发现线索：" + str(new_page['key']) + "\n")
-
-
-
-        return new_page
+    md5_request = fingerprint.request_fingerprint(request)
+    if not need_save:
+        if config.NEED_FLAG and save_result['flag']:
+            if "/admin../flag.txt" in response['url']:
+                time.sleep(120)
+            flagUtil.set_flag(save_result['flag'])
     else:
+        save_result = {
+            'name': str(md5_request),
+            'description': '',
+            'key': '',
+            'flag': ''
+        }
+    new_page['key'] = save_result.get("key", "")
+    new_page['description'] = save_result.get("description", "")
+    new_page['name'] = save_result['name']
+    new_page['id'] = md5_request
+
+    form_datas = extract_forms(response['content'])
+    for form_data in form_datas:
+        config.FORMS[form_data['url']] = form_data
+        config.EXPLORE_URLS.append(response['url'])
+
+    if need_save and config.HUNTER:
+        config.HUNTER.explorer_pages.append(new_page)
+        page_data = {
+            "name": new_page['name'],
+            "request": json.dumps(new_page.get('request', {})),
+            "response": json.dumps(new_page.get('response', {})),
+            "description": new_page.get('description', ''),
+            "key": new_page.get('key', '')
+        }
+        created_page = agent_manager.create_page(agent_manager.current_task_id, page_data)
+
+        # if new_page["key"]:
+        #     with open(config.HUNTER.key_simple_file, "a+") as f:
+        #         f.write(str(['name']) + f" {new_page['response']['url']} 发现线索：" + str(new_page['key']) + "\n")
+        #     with open(config.HUNTER.key_file, "a+") as f:
+        #         f.write(str(new_page['name']) + f" 请求：{new_page['request']} 发现线索：" + str(new_page['key']) + "\n")
+
+    return new_page
+
+
+def add_page(new_page, need_save=False):
+    from agents.saver import save_page
+    if not _claim_page(new_page):
+        return None
+    save_result = save_page(new_page) if not need_save else None
+    return _finish_page(new_page, save_result, need_save)
+
+
+def add_pages(new_pages, need_save=False):
+    """
+    批量添加页面，去重后的新页面通过save_pages合并分析
+    :param new_pages: 页面列表
+    :param need_save: 是否直接保存页面而不进行分析
+    :return: 新页面列表，已存在或分析失败的页面不返回
+    """
+    from agents.saver import save_pages
+    claimed = [new_page for new_page in new_pages if _claim_page(new_page)]
+    if not claimed:
+        return []
+    save_results = save_pages(claimed) if not need_save else [None] * len(claimed)
+    return [_finish_page(new_page, save_result, need_save)
+            for new_page, save_result in zip(claimed, save_results)
+            if need_save or save_result]
+
+
+# 任务级会话存储：任务ID -> 身份名称 -> 主机 -> {"cookies": {名称: 值}, "auth": {请求头: 值}}
+# 请求通过session参数开启后，自动携带该身份在同一主机上获得的cookie和认证头，并保存响应设置的cookie
+_sessions_lock = threading.Lock()
+_sessions = {}
+
+
+def _session_identity(params):
+    """
+    获取请求使用的会话身份
+    :return: 身份名称，未开启会话时返回None
+    """
+    session = params.get('session')
+    if session is None:
+        return "default" if config.REQUEST_SESSION_DEFAULT else None
+    session = str(session).strip()
+    if not session or session.lower() == "false":
         return None
+    return "default" if session.lower() == "true" else session
+
+
+def _session_host(url):
+    # cookie不区分端口，按主机名保存
+    return (urlparse(url).hostname or "").lower()
+
+
+def _get_session(identity, url):
+    with _sessions_lock:
+        hosts = _sessions.setdefault(config.TASK_ID, {}).setdefault(identity, {})
+        return hosts.setdefault(_session_host(url), {"cookies": {}, "auth": {}})
+
+
+def _parse_cookie_header(value):
+    cookies = {}
+    for part in str(value or "").split(';'):
+        if '=' in part:
+            name, cookie_value = part.split('=', 1)
+            cookies[name.strip()] = cookie_value.strip()
+    return cookies
+
+
+def _apply_session(identity, url, request_headers):
+    """
+    将会话中保存的cookie和认证头加入请求，请求中显式设置的值优先
+    同时保存请求中显式携带的cookie和认证头，供之后的请求使用
+    """
+    session = _get_session(identity, url)
+    auth_headers = {name.lower() for name in config.REQUEST_SESSION_AUTH_HEADERS}
+    with _sessions_lock:
+        # 请求中显式携带的cookie同样保存到会话，请求头名称不区分大小写
+        for name in [name for name in request_headers if name.lower() == 'cookie']:
+            session["cookies"].update(_parse_cookie_header(request_headers.pop(name)))
+        cookies = session["cookies"]
+        if cookies:
+            request_headers['Cookie'] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+        for name, value in list(request_headers.items()):
+            if name.lower() in auth_headers and value:
+                for saved in [saved for saved in session["auth"] if saved.lower() == name.lower()]:
+                    del session["auth"][saved]
+                session["auth"][name] = value
+        present = {name.lower() for name in request_headers}
+        for name, value in session["auth"].items():
+            if name.lower() not in present:
+                request_headers[name] = value
+
+
+def _capture_session(identity, url, set_cookie_values):
+    """保存响应设置的cookie，Max-Age=0或值为空时删除"""
+    session = _get_session(identity, url)
+    with _sessions_lock:
+        for cookie_value in set_cookie_values:
+            parts = cookie_value.split(';')
+            if '=' not in parts[0]:
+                continue
+            name, value = parts[0].split('=', 1)
+            name, value = name.strip(), value.strip()
+            expired = any(attr.strip().lower().replace(' ', '') == 'max-age=0' for attr in parts[1:])
+            if expired or not value:
+                session["cookies"].pop(name, None)
+            else:
+                session["cookies"][name] = value
+
+
+def get_session(identity="default", url=None):
+    """
+    查看当前任务中某个身份保存的会话
+    :param identity: 身份名称
+    :param url: 为None时返回所有主机
+    :return: {"cookies": {...}, "auth": {...}}或{主机: 会话}
+    """
+    with _sessions_lock:
+        hosts = _sessions.get(config.TASK_ID, {}).get(identity, {})
+        if url is None:
+            return json.loads(json.dumps(hosts))
+        return json.loads(json.dumps(hosts.get(_session_host(url), {"cookies": {}, "auth": {}})))
+
+
+def clear_sessions(task_id=None):
+    """清除某个任务（默认为当前任务）的所有会话"""
+    with _sessions_lock:
+        _sessions.pop(config.TASK_ID if task_id is None else task_id, None)
 
 
 def process_addon_templates(text) -> str:
@@ -195,26 +447,14 @@ def process_addon_templates(text) -> str:
     
     return re.sub(pattern, replace_addon, text)
 
-class NoRedirectHandler(HTTPRedirectHandler):
-    def redirect_request(self, req, fp, code, msg, headers, newurl):
-        return None  # 禁止重定向
-
-def run(params):
+def _exchange(params):
     """
-    进行网络请求的主函数，自动记录重定向过程中的所有cookies
-    params: 字典类型，包含以下键值:
-        - url: 请求URL
-        - method: 请求方法(GET/POST等)
-        - header: 请求头(字典类型)
-        - proxy: 代理设置
-        - param: 请求参数(字典类型)
-        - files: 文件上传参数(字典类型)
-        - no_url_encode: 是否禁用URL编码(布尔类型，默认False)
+    一次完整请求过程（参数处理、重定向和cookie记录）的生成器，不直接进行网络IO
+    每次需要发送请求时产出(method, url, headers, body, timeout)，由调用方发送后通过send传回响应，
+    发送失败时通过throw传回异常，结束时通过StopIteration返回结果
+    同步的run和异步的arun共用同一套请求逻辑
     """
     try:
-        # 设置代理
-        proxy_handler = None
-
         # 设置请求头和参数
         headers = params.get('header', {})
         request_param_list = params.get('params', [])
@@ -231,6 +471,11 @@ def run(params):
         files_config = params.get('files', {})
 
         need_history = params.get('history', True)
+        timeout = float(params.get('timeout', 60))
+        session_identity = _session_identity(params)
+        # 发起请求的阶段，用于统计响应缓存命中率
+        stage = params.get('stage', 'default')
+        no_cache = str(params.get('no_cache', False)).lower() == 'true'
 
         if not headers:
             headers = {}
@@ -273,23 +518,6 @@ def run(params):
         if raw_data and isinstance(raw_data, str):
             raw_data = process_addon_templates(raw_data)
         
-        # 创建cookie jar和opener
-        cookie_jar = CookieJar()
-        
-        # 创建SSL上下文，忽略证书验证
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # 创建HTTPS handler
-        https_handler = HTTPSHandler(context=ssl_context)
-        
-        # 创建opener
-        if proxy_handler:
-            opener = build_opener(proxy_handler, https_handler)
-        else:
-            opener = build_opener(https_handler)
-
         # 处理GET请求URL中的重复参数
         url = params['url']
         if method == 'GET' and '?' in url:
@@ -455,25 +683,44 @@ def run(params):
 
         while redirect_count <= max_redirects:
             try:
-                # 创建请求对象
-                req = Request(url, data=request_data, headers=headers, method=method)
+                # 与urllib.request.Request一致：请求头名称按capitalize()规范化，同名的头后设置的覆盖先设置的
+                request_headers = {key.capitalize(): value for key, value in headers.items()}
 
                 # 添加cookies到请求头
                 if current_cookies:
-                    req.add_header('Cookie', current_cookies)
+                    request_headers['Cookie'] = current_cookies
                 headers['Cookie'] = current_cookies
 
-
-
-
-                openera = build_opener(NoRedirectHandler)
-
-                # 发送请求
-                response = openera.open(req, timeout=60)
-                
-                # 读取响应
-                response_content = response.read()
-                response_text = response_content.decode('utf-8', errors='ignore')
+                # 补全urllib默认添加的请求头，不再发送Connection: close，连接由连接池复用
+                if request_data is not None and 'Content-type' not in request_headers:
+                    request_headers['Content-type'] = 'application/x-www-form-urlencoded'
+                request_headers.setdefault('User-agent', DEFAULT_USER_AGENT)
+                if config.REQUEST_ACCEPT_COMPRESSION:
+                    request_headers.setdefault('Accept-encoding', http_body.ACCEPT_ENCODING)
+
+                # 携带会话中保存的cookie和认证头
+                if session_identity:
+                    _apply_session(session_identity, url, request_headers)
+
+                # 发送请求，重定向由下面的循环手动处理，幂等请求优先使用同一任务内的缓存响应
+                cache_key, response = response_cache.lookup(method, url, request_headers, request_data, stage, no_cache)
+                if response is None:
+                    response = yield method, url, request_headers, request_data, timeout
+                    response_cache.store(cache_key, response, stage)
+
+                # 读取响应，按Content-Encoding解压
+                response_content, truncated = http_body.decode_body(response.body, response.headers.get('Content-Encoding'))
+                truncated = truncated or response.truncated
+                response_type = response.headers.get('Content-Type', '')
+                # 二进制内容保存到文件，不解码成文本放进提示词
+                is_binary = http_body.is_binary(response_content, response_type)
+                if is_binary:
+                    binary_path = http_body.save_binary(response_content)
+                    response_text = f"[二进制内容 {response_type or '未知类型'}，{len(response_content)} 字节{'（已截断）' if truncated else ''}，已保存到 {binary_path}]"
+                else:
+                    response_text = response_content.decode('utf-8', errors='ignore')
+                    if truncated:
+                        response_text += f"\n[响应体超过 {config.REQUEST_MAX_BODY} 字节，后续内容已截断]"
                 # 正确处理多个相同名称的头（如多个Set-Cookie）
                 response_headers = {}
                 for header_name, header_value in response.headers.items():
@@ -487,28 +734,8 @@ def run(params):
                         response_headers[header_name.lower()] = header_value
                 response_url = response.url
                 status_code = response.status
-                
-            except HTTPError as e:
-                # HTTP错误也要处理响应
-                response_content = e.read() if hasattr(e, 'read') else b''
-                response_text = response_content.decode('utf-8', errors='ignore')
-                # 正确处理多个相同名称的头（如多个Set-Cookie）
-                response_headers = {}
-                if hasattr(e, 'headers'):
-                    for header_name, header_value in e.headers.items():
-                        if header_name.lower() in response_headers:
-                            # 如果头已存在，将值合并（用于Set-Cookie等可能重复的头）
-                            if isinstance(response_headers[header_name.lower()], list):
-                                response_headers[header_name.lower()].append(header_value)
-                            else:
-                                response_headers[header_name.lower()] = [response_headers[header_name.lower()], header_value]
-                        else:
-                            response_headers[header_name.lower()] = header_value
-                response_url = e.url if hasattr(e, 'url') else url
-                status_code = e.code
-                response = e
-                
-            except URLError as e:
+
+            except OSError as e:
                 return {
                     'content': "",
                     'error': f"URL Error: {str(e)}"
@@ -538,10 +765,15 @@ def run(params):
                     'url': response_url,
                     'status': status_code,
                     'header': response_headers,
-                    'content': remove_svg_from_content(response_text)
+                    'content': response_text if is_binary else minimize_response(response_text, response_url)
                 }
             })
 
+            # 保存响应设置的cookie到会话
+            if session_identity:
+                set_cookie_value = response_headers.get('set-cookie', [])
+                _capture_session(session_identity, url, set_cookie_value if isinstance(set_cookie_value, list) else [set_cookie_value])
+
             # 处理Set-Cookie响应头
             set_cookie_headers = []
             for header_name, header_value in response_headers.items():
@@ -615,7 +847,8 @@ def run(params):
         if all_set_cookies:
             final_headers['Set-Cookie'] = ', '.join(all_set_cookies)
         
-        save_path = ""
+        # 最终响应是二进制内容时直接返回其保存路径
+        save_path = binary_path if is_binary else ""
 
         if 'needSave' in params and params['needSave'] == 'True':
             save_path = config.TEMP_PATH + "/" + uuid.uuid4().hex + "-" + params['saveName']
@@ -646,4 +879,152 @@ def run(params):
         return {
             'content': "",
             'error': str(e)
-        }
\ No newline at end of file
+        }
+
+
+def run(params):
+    """
+    进行网络请求的主函数，自动记录重定向过程中的所有cookies
+    params: 字典类型，包含以下键值:
+        - url: 请求URL
+        - method: 请求方法(GET/POST等)
+        - header: 请求头(字典类型)
+        - proxy: 代理设置
+        - param: 请求参数(字典类型)
+        - files: 文件上传参数(字典类型)
+        - no_url_encode: 是否禁用URL编码(布尔类型，默认False)
+        - timeout: 单次请求超时（秒），默认60
+        - session: 会话身份，True为默认身份，也可以是身份名称（如userA），开启后自动携带并保存cookie和认证头
+    """
+    steps = _exchange(params)
+    try:
+        step = next(steps)
+        while True:
+            method, url, headers, body, timeout = step
+            host = urlparse(url).netloc
+            if config.HOST_LIMIT_ENABLE:
+                host_limiter.limiter.acquire(host)
+            started = time.time()
+            status, error, retry_after = None, None, None
+            try:
+                response = http_pool.request(method, url, headers, body, timeout)
+                status, retry_after = response.status, response.headers.get("Retry-After")
+            except Exception as e:
+                error = e
+            finally:
+                if config.HOST_LIMIT_ENABLE:
+                    host_limiter.limiter.release(host, time.time() - started, status, error, retry_after)
+            step = steps.throw(error) if error else steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def arun(params, pool=None):
+    """
+    run的异步版本，使用异步连接发送请求
+    :param params: 同run
+    :param pool: 异步连接池，为None时使用一次性连接
+    :return: 同run
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = async_http.AsyncConnectionPool(config.HTTP_POOL_MAX_PER_HOST, config.HTTP_POOL_IDLE_TIMEOUT)
+    steps = _exchange(params)
+    try:
+        step = next(steps)
+        while True:
+            method, url, headers, body, timeout = step
+            host = urlparse(url).netloc
+            if config.HOST_LIMIT_ENABLE:
+                await host_limiter.limiter.aacquire(host)
+            started = time.time()
+            status, error, retry_after = None, None, None
+            try:
+                if http_pool.get_proxy(url):
+                    # 异步连接不支持代理，设置了代理环境变量时在线程中使用同步连接池发送
+                    response = await asyncio.wait_for(
+                        asyncio.to_thread(http_pool.request, method, url, headers, body, timeout), timeout)
+                else:
+                    response = await asyncio.wait_for(pool.request(method, url, headers, body), timeout)
+                status, retry_after = response.status, response.headers.get("Retry-After")
+            except asyncio.TimeoutError:
+                async_http.count("timeouts")
+                error = TimeoutError(f"请求超时（{timeout}秒）")
+            except Exception as e:
+                error = e
+            finally:
+                if config.HOST_LIMIT_ENABLE:
+                    host_limiter.limiter.release(host, time.time() - started, status, error, retry_after)
+            step = steps.throw(error) if error else steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        steps.close()
+        if own_pool:
+            pool.close()
+
+
+async def run_many(requests, concurrency=None, timeout=None):
+    """
+    在一个事件循环中并发发送大量请求，按完成顺序返回结果
+    config.FLAG被设置（已经拿到flag）时停止发送并取消进行中的请求
+    :param requests: run的参数列表
+    :param concurrency: 最大并发数，默认为config.HTTP_BATCH_CONCURRENCY
+    :param timeout: 单次请求超时（秒），参数中未指定timeout时使用
+    :return: 异步生成器，依次返回(请求序号, 结果)
+    """
+    concurrency = concurrency or config.HTTP_BATCH_CONCURRENCY
+    pool = async_http.AsyncConnectionPool(config.HTTP_POOL_MAX_PER_HOST, config.HTTP_POOL_IDLE_TIMEOUT)
+    pending = set()
+    queue = iter(enumerate(requests))
+
+    async def send(index, params):
+        if timeout is not None and 'timeout' not in params:
+            params = dict(params, timeout=timeout)
+        return index, await arun(params, pool)
+
+    def fill():
+        while len(pending) < concurrency and not config.FLAG:
+            item = next(queue, None)
+            if item is None:
+                return
+            pending.add(asyncio.ensure_future(send(*item)))
+
+    try:
+        fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+            if config.FLAG:
+                break
+            fill()
+    finally:
+        if pending:
+            async_http.count("cancelled", len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        pool.close()
+
+
+def run_batch(requests, concurrency=None, timeout=None):
+    """
+    run_many的同步封装，在当前线程中运行事件循环，调用方所在线程已有事件循环时在新线程中运行
+    :return: 与requests顺序一致的结果列表，因config.FLAG被取消的请求结果为None
+    """
+    requests = list(requests)
+
+    async def collect():
+        results = [None] * len(requests)
+        async for index, result in run_many(requests, concurrency, timeout):
+            results[index] = result
+        return results
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(collect())
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, collect()).result()
@@ -15,28 +15,13 @@ import re
 from utils.logger import logger
 from agents import vulner
 
+# 系统提示词只包含固定内容，页面信息和漏洞规范作为上下文消息依次放在后面，
+# 同一页面的多个检测思路共享相同的前缀，可以命中服务商的提示词前缀缓存
 prompt_template = """
 你是一个ctf解题专家，你需要根据目标检测思路和当前页面来决定调用的工具请求。
 你必须遵循对应漏洞测试规范进行按步骤测试，发现漏洞就进行总结，如果发现存在某些限制或过滤，也立刻停止利用并总结，后续会提供给你绕过方式。
 如果提供了测试工具，必须先使用工具进行验证，然后再进行深入测试。
-
-CTF描述：
-{ctf_desc}
-
-原始页面信息如下：
-请求：
-{request}
-
-响应：
-{response}
-
-当前关键信息：
-{key}
-
-你需要检测的漏洞为：
-{vuln}
-对于该漏洞的检测方法和调用工具代码时需要注意的规范如下：
-{prompt_detect}
+CTF描述、原始页面信息、当前关键信息、需要检测的漏洞和漏洞规范会在对话开始时提供。
 
 你需要根据漏洞规范中的要求构造xml数据，除此之外，如果你想进行手动漏洞探测或网页请求，请直接进行request工具调用，调用格式如下：
 <request>
@@ -75,6 +60,29 @@ CTF描述：
 """
 
 
+page_context_template = """
+CTF描述：
+{ctf_desc}
+
+原始页面信息如下：
+请求：
+{request}
+
+响应：
+{response}
+
+当前关键信息：
+{key}
+"""
+
+vuln_context_template = """
+你需要检测的漏洞为：
+{vuln}
+对于该漏洞的检测方法和调用工具代码时需要注意的规范如下：
+{prompt_detect}
+"""
+
+
 # 你可以利用漏洞库中的已知漏洞，首先必须查看漏洞的详细信息，查看方式如下：
 # <info>
 #     <id>漏洞id</id>
@@ -138,7 +146,11 @@ knowledge_base = config.get_knowledge("get_flag")
 
 
 
-def execute_solution(solution, page, key, explorer_pages, vuln_db):
+def execute_solution(solution, page, key, explorer_pages, vuln_db, stop_event=None):
+    """
+    执行一个漏洞检测思路
+    :param stop_event: 调用方超时后设置，检测在下一步开始前结束
+    """
     try:
         # vuln_db = [{'id': '0dc52cfd-22e1-454a-9c33-e0962e6cae0b', 'task_id': '03a02a6a-b3f7-46a4-81a2-afc151cd4301', 'vuln_type': 'UPLOAD', 'desc': '存在文件上传漏洞。上传的 PHP 文件可以被访问，但没有被正确解析为 PHP 代码。请求 URL 为 http://172.20.10.13:55226/posts/upload-article.php，请求方法为 POST，请求参数包括 name 和 email，上传文件参数名为 articleFile，文件内容为 【】，文件名为 test.php，文件类型为 text/plain。上传后的文件可以通过 http://172.20.10.13:55226/posts/uploads/test.php 访问。', 'request_json': {'url': 'http://172.20.10.13:55226/posts/upload-article.php', 'method': 'POST', 'header': {'User-Agent': 'python-requests/2.32.3', 'Accept-Encoding': 'gzip, deflate, zstd', 'Accept': '*/*', 'Connection': 'keep-alive'}, 'param': {'name': 'John Doe', 'email': 'john.doe@example.com'}, 'files': {'articleFile': ('example_article.txt', 'This is a sample article for testing purposes.', 'text/plain')}}}]
         global knowledge_base
@@ -182,7 +194,11 @@ def execute_solution(solution, page, key, explorer_pages, vuln_db):
             # vuln_module = __import__(f"agents.vulns.{vuln}", fromlist=["simple_detect", "prompt_detect", "need_detect"])
         simple_detect = getattr(vuln_module, "simple_detect")
         prompt_detect = getattr(vuln_module, "prompt_detect")
-        prompt = prompt_template.format(ctf_desc=config.CTF_DESC, request=page['request'], response=page['response'], vuln=vuln, prompt_detect=prompt_detect, request_desc=config.get_addon("request_vuln"), vuln_db_desc=vuln_db_desc, key=key)
+        prompt = prompt_template.format(request_desc=config.get_addon("request_vuln"))
+        context = [
+            page_context_template.format(ctf_desc=config.CTF_DESC, request=page['request'], response=page['response'], key=key),
+            vuln_context_template.format(vuln=vuln, prompt_detect=prompt_detect)
+        ]
     except Exception as e:
         traceback.print_exc()
         return
@@ -200,13 +216,13 @@ def execute_solution(solution, page, key, explorer_pages, vuln_db):
         while True:
 
             step_count += 1
-            if (step_count > 30 and vuln == 'OTHER') or config.FLAG:
+            if (step_count > 30 and vuln == 'OTHER') or config.FLAG or (stop_event and stop_event.is_set()):
                 summary = {"vuln":"False", "findFlag":"False", "desc":"", "flag":""}
                 break
             # 在每次循环开始前检查进程状态
             check_process_status(session_id)
 
-            response = chat(prompt, session_id)
+            response = chat(prompt, session_id, stage="action", context=context)
             detect_xmls = re.findall(r'(<detect>.*?</detect>)', response, re.DOTALL)
             tool_xmls = re.findall(r'(<tool>.*?</tool>)', response, re.DOTALL)
             request_xmls = re.findall(r'(<request>.*?</request>)', response, re.DOTALL)
@@ -256,6 +272,7 @@ def execute_solution(solution, page, key, explorer_pages, vuln_db):
                     try:
                         new_request = xmltodict.parse(request_xml)['request']['value']
                         new_request['history'] = False
+                        new_request['stage'] = "action"
                         result = execute_tool('request', new_request)
                         add_message("网络请求响应如下：" + str(result) + "，请继续探索或总结", session_id)
                     except Exception as e:
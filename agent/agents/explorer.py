@@ -1,14 +1,15 @@
+import asyncio
 import re
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from hashlib import md5
 
 import urllib3.util
 import xmltodict
 
-from addons.request import add_page
+from addons.request import add_pages
 from agents.executor import execute_tool
-from utils.chatbot import add_message, chat
+from utils.chatbot import add_message, chat, aadd_message, achat_stream
 from config import config
+from utils import fingerprint
 from utils.logger import logger
 from addons import request
 
@@ -132,11 +133,11 @@ def guess_path(url):
     # 创建线程池进行并发请求
     def check_path(p):
         url = f"{root_url}{p}"
-        request_json = {"method":"OPTIONS", "url": url}
+        request_json = {"method":"OPTIONS", "url": url, "stage": "guess_path"}
         result = request.run(request_json)
         if result['status'] == 200 or result['status'] == 405:
             if len(result['content']) == 0 or result['status'] == 405:
-                result = request.run({"method":"GET", "url": url})
+                result = request.run({"method":"GET", "url": url, "stage": "guess_path"})
                 if result['status'] in [404, 403] or result['content'] == 0:
                     return
             logger.info(f"发现新路径：{url}")
@@ -211,10 +212,10 @@ def explore_all_js(page):
     def _fetch_single_js(u):
         """抓取单个 JS 并返回 (url, 接口信息)"""
         try:
-            result = request.run({"method": "GET", "url": u.strip()})
+            result = request.run({"method": "GET", "url": u.strip(), "stage": "js"})
             sid = add_message(message_api.format(url=u.strip(), response=result['content']), session_id=None)
             model_type = "large" if len(result.get("content", "")) > 100000 else "normal"
-            response = chat(prompt_api, sid, type=model_type, limit=100000)
+            response = chat(prompt_api, sid, type=model_type, limit=100000, cache=True, stage="js")
             return u, response
         except Exception as e:
             logger.error(f"请求JS文件 {u} 失败: {str(e)}")
@@ -234,20 +235,20 @@ def explore_all_js(page):
 
 
 
-def explore_page(page, key, vuln, session_id):
+async def explore_page(page, key, vuln, session_id):
     """
-    探索页面
+    探索页面，LLM对话使用流式的achat_stream，每个步骤生成完成后立即执行，阻塞的网络请求放到线程中执行
     :param page: 页面
     :return: 动作
     """
 
     if not page.get("request"):
-        add_message("访问提供的初始url", session_id)
+        await aadd_message("访问提供的初始url", session_id)
     else:
-        js_info = explore_all_js(page)
+        js_info = await asyncio.to_thread(explore_all_js, page)
         js_info = "\n".join([f"js文件url：{url}\n该js中的接口说明：{info}" for url, info in js_info.items()])
 
-        add_message(message.format(url=page.get("response", "")['url'], response=page.get("response", "")['content'], key=key, vuln=vuln, js_info=js_info), session_id=session_id)
+        await aadd_message(message.format(url=page.get("response", "")['url'], response=page.get("response", "")['content'], key=key, vuln=vuln, js_info=js_info), session_id=session_id)
     if 'vuln' in page:
         page_desc = "尽可能多的访问新网页或对api发送网络请求，当前页面存在漏洞，必须使用已经探测到的漏洞信息进行更多页面的发现，不可以更改载荷"
     else:
@@ -256,9 +257,34 @@ def explore_page(page, key, vuln, session_id):
     prompt = prompt_template.format(CTF_URL=config.CTF_URL, page_desc=page_desc, request_desc=config.get_addon("request"))
 
 
-    response = chat(prompt, session_id)
-    # print(response)
-    response_xml = re.findall("(<step>.*?</step>)", response, re.DOTALL)
+    async def run_step(step_xml):
+        """执行单个步骤，返回新发现的页面"""
+        step = xmltodict.parse(step_xml)['step']
+        tool_name = step['tool']
+        value = step['value']
+        # 提取URL路径部分（去除查询参数）来检查扩展名
+        url_path = value['url'].split('?')[0].split('#')[0]
+        if any(url_path.endswith(ext) for ext in black_ext) or any(p in url_path for p in back_path):
+            return []
+        # 严格模式：只改了cookie、认证头或请求头的越权探测请求不能被当成已探索
+        md5_request = fingerprint.request_fingerprint(value, strict=True)
+        if md5_request in config.EXPLORED_PAGES:
+            return []
+        config.EXPLORED_PAGES.append(md5_request)
+        value['stage'] = "explore"
+        result = await asyncio.to_thread(execute_tool, tool_name, value)
+        return await asyncio.to_thread(add_pages, result['history'])
+
+    async def stream_steps():
+        """流式对话，每个<step>生成完成后立即开始执行，不等待整个回复结束"""
+        tasks = []
+        async for step_xml in achat_stream(prompt, session_id, stage="explore"):
+            if config.FLAG:
+                continue
+            tasks.append(asyncio.create_task(run_step(step_xml)))
+        return tasks
+
+    step_tasks = await stream_steps()
 
     step_count = 0
     new_pages = []
@@ -267,58 +293,42 @@ def explore_page(page, key, vuln, session_id):
     flag = False
 
     if not page.get("request"):
-        all_pages = guess_path(config.CTF_URL)
-        for new_page in all_pages:
+        all_pages = await asyncio.to_thread(guess_path, config.CTF_URL)
+        if all_pages:
             flag = True
-            new_page = add_page(new_page)
-            if new_page:
-                new_pages.append(new_page)
-                new_page_info = f"url：{new_page['response']['url']} header：{new_page['response']['header']} response：{new_page['response']['content']} 关键线索：{new_page['key']}"
-                add_message(f"爆破路径访问到页面：{new_page_info}", session_id)
+        # 爆破出的页面合并分析，减少save_page的对话次数
+        for new_page in await asyncio.to_thread(add_pages, all_pages):
+            new_pages.append(new_page)
+            new_page_info = f"url：{new_page['response']['url']} header：{new_page['response']['header']} response：{new_page['response']['content']} 关键线索：{new_page['key']}"
+            await aadd_message(f"爆破路径访问到页面：{new_page_info}", session_id)
 
     stop_flag = False
 
-    while response_xml:
+    while step_tasks:
         if config.FLAG:
             break
         explore_pages = []
-        for step_xml in response_xml:
-            try:
-                step = xmltodict.parse(step_xml)['step']
-                tool_name = step['tool']
-                value = step['value']
-                # 提取URL路径部分（去除查询参数）来检查扩展名
-                url_path = value['url'].split('?')[0].split('#')[0]
-                if any(url_path.endswith(ext) for ext in black_ext) or any(p in url_path for p in back_path):
-                    continue
-                md5_request = md5((str(value)+config.TASK_ID).encode()).hexdigest()
-                if md5_request not in config.EXPLORED_PAGES:
-                    config.EXPLORED_PAGES.append(md5_request)
-                    result = execute_tool(tool_name, value)
-                    pages = result['history']
-                    for new_page in pages:
-                        new_page = add_page(new_page)
-                        if new_page:
-                            flag = True
-
-                            new_page_info = f"url：{new_page['response']['url']} header：{new_page['response']['header']} response：{new_page['response']['content']} 关键线索：{new_page['key']}"
-                            new_pages.append(new_page)
-                            explore_pages.append(new_page_info)
-                            if new_page['response']['status'] in config.WRONG_STATUS_LIST:
-                                wrong_page_info = f"访问出错页面：{new_page['name']} 请求体：{new_page['request']} 响应码：{new_page['response']['status']}"
-                                add_message(f"上一轮访问出错的页面：{wrong_page_info}", session_id)
-                                wrong_page.append(wrong_page_info)
-
-                            else:
-                                add_message(f"上一轮访问成功的页面：{new_page_info}", session_id)
+        # 回复保存后再按步骤顺序写入执行结果，保证对话历史的顺序
+        for step_result in await asyncio.gather(*step_tasks, return_exceptions=True):
+            if isinstance(step_result, Exception):
+                logger.warning(f"执行探索步骤失败: {step_result}")
+                continue
+            for new_page in step_result:
+                flag = True
 
+                new_page_info = f"url：{new_page['response']['url']} header：{new_page['response']['header']} response：{new_page['response']['content']} 关键线索：{new_page['key']}"
+                new_pages.append(new_page)
+                explore_pages.append(new_page_info)
+                if new_page['response']['status'] in config.WRONG_STATUS_LIST:
+                    wrong_page_info = f"访问出错页面：{new_page['name']} 请求体：{new_page['request']} 响应码：{new_page['response']['status']}"
+                    await aadd_message(f"上一轮访问出错的页面：{wrong_page_info}", session_id)
+                    wrong_page.append(wrong_page_info)
 
+                else:
+                    await aadd_message(f"上一轮访问成功的页面：{new_page_info}", session_id)
 
-            except Exception as e:
-                print(e)
-                break
         if not flag:
-            add_message("上一轮没有访问到有效页面", session_id)
+            await aadd_message("上一轮没有访问到有效页面", session_id)
 
         step_count += 1
         flag = False
@@ -334,20 +344,19 @@ def explore_page(page, key, vuln, session_id):
                 if not has_explored:
                     new_forms.append(config.FORMS[form_url])
             if new_forms:
-                add_message(form_message.format(forms="\n".join([f['form'] for f in new_forms])), session_id)
+                await aadd_message(form_message.format(forms="\n".join([f['form'] for f in new_forms])), session_id)
             stop_flag = True
             config.FORMS = {}
 
         else:
-            add_message("\n请你：1. 修正访问出错的页面，如果是405错误，必须修改为更合适的方法重新访问，比如POST需要换为GET，注意提交的参数不要改变"
+            await aadd_message("\n请你：1. 修正访问出错的页面，如果是405错误，必须修改为更合适的方法重新访问，比如POST需要换为GET，注意提交的参数不要改变"
                                 + "2. 根据新的访问成功页面结合已有信息继续进行探索", session_id)
 
 
         try:
-            response = chat(prompt, session_id)
-            response_xml = re.findall("(<step>.*?</step>)", response, re.DOTALL)
+            step_tasks = await stream_steps()
         except Exception as e:
-            print(e)
+            logger.warning(f"获取探索步骤失败: {e}")
             break
 
     return new_pages
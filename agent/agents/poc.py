@@ -5,12 +5,13 @@ import uuid
 import json
 import xmltodict
 import re
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin
 
 from utils.chatbot import add_message, chat
 from utils.logger import logger
-from utils import sql_helper
+from utils import fingerprint, sql_helper
 from config import config
 from utils.agent_manager import agent_manager
 from addons.request import run
@@ -47,6 +48,17 @@ message_template = """
 
 """
 
+# 任务ID -> 已经完成POC扫描的目标指纹，POC请求只由目标URL决定，等价的目标只扫描一次
+_scanned_lock = threading.Lock()
+_scanned_targets = {}
+
+
+def clear_scanned_targets(task_id):
+    """清除某个任务已扫描的目标记录"""
+    with _scanned_lock:
+        _scanned_targets.pop(task_id, None)
+
+
 class Scanner:
 
     def poc_scan(self, page, key, task_id):
@@ -61,6 +73,13 @@ class Scanner:
         Returns:
             dict: 汇总的扫描结果 {"漏洞名称": 漏洞结果}
         """
+        target_url = page.get("request")['url']
+        target_fingerprint = fingerprint.fingerprint("GET", target_url, scope=task_id)
+        with _scanned_lock:
+            if target_fingerprint in _scanned_targets.get(task_id, ()):
+                logger.info(f"跳过POC扫描: {page['name']}，等价的目标 {target_url} 已经扫描过")
+                return {}
+
         logger.info(f"开始POC扫描: {page['name']}")
 
         # 发送开始扫描的pure消息
@@ -96,11 +115,12 @@ class Scanner:
         # 并发执行POC扫描
         results = {}
         vulnerabilities = []  # 收集发现的漏洞
+        failed_count = 0  # 执行异常的POC数量，有异常时目标可以重新扫描
 
         with ThreadPoolExecutor(max_workers=5) as executor:
             # 提交所有POC任务
             future_to_poc = {
-                executor.submit(self.execute_poc, poc_file, page.get("request")['url']): poc_file
+                executor.submit(self.execute_poc, poc_file, target_url): poc_file
                 for poc_file in poc_files
             }
 
@@ -167,6 +187,7 @@ class Scanner:
                             logger.debug(f"未发现漏洞: {vuln_name}")
 
                 except Exception as e:
+                    failed_count += 1
                     logger.error(f"POC {poc_file} 执行异常: {str(e)}")
 
         # 统计结果
@@ -194,6 +215,10 @@ class Scanner:
                 status_text
             )
 
+        # 所有POC都正常执行完才记录为已扫描
+        if not failed_count:
+            with _scanned_lock:
+                _scanned_targets.setdefault(task_id, set()).add(target_fingerprint)
         return results
 
     def get_poc_files(self):
@@ -380,8 +405,7 @@ class Scanner:
         # 设置默认headers
         default_headers = {
             'User-Agent': 'Mozilla/5.0 (compatible; POC-Scanner/1.0)',
-            'Accept': '*/*',
-            'Connection': 'close'
+            'Accept': '*/*'
         }
         default_headers.update(headers)
 
@@ -392,7 +416,8 @@ class Scanner:
             'header': default_headers,
             'params': query,  # 使用POC中定义的query参数
             'files': {},
-            'history': False  # POC扫描不需要历史记录
+            'history': False,  # POC扫描不需要历史记录
+            'stage': "poc"
         }
 
         # 如果有请求体数据，使用raw参数
@@ -707,7 +732,7 @@ class Flagger:
             add_message(poc_message, pure_id)
         
         # 开始AI测试
-        result = chat(poc_prompt.format(request_desc=config.get_addon('request'), poc_file=open(poc_file, "r").read()), pure_id)
+        result = chat(poc_prompt.format(request_desc=config.get_addon('request'), poc_file=open(poc_file, "r").read()), pure_id, stage="hunt_flag")
         
         # 循环处理result，直到遇到summary标签
         while True:
@@ -738,16 +763,16 @@ class Flagger:
                         add_message(f"执行结果: {request_result}", pure_id)
                         
                         # 继续对话，获取下一步结果
-                        result = chat(poc_prompt, pure_id)
+                        result = chat(poc_prompt, pure_id, stage="hunt_flag")
                         
                     except Exception as e:
                         logger.error(f"处理value标签时出错: {str(e)}")
                         # 如果处理value标签失败，直接继续对话
-                        result = chat(poc_prompt, pure_id)
+                        result = chat(poc_prompt, pure_id, stage="hunt_flag")
                 else:
                     # 如果没有value标签也没有summary标签，继续对话
                     logger.debug("未找到value或summary标签，继续对话")
-                    result = chat(poc_prompt, pure_id)
+                    result = chat(poc_prompt, pure_id, stage="hunt_flag")
                     
             except Exception as e:
                 logger.error(f"处理漏洞利用结果时出错: {str(e)}")
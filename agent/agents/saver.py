@@ -1,6 +1,9 @@
 import re
+import threading
+from concurrent.futures import Future
 
 from utils.chatbot import add_message, chat
+from utils.logger import logger
 from config import config
 import xmltodict
 
@@ -35,14 +38,158 @@ message = """
 """
 
 
+batch_prompt = f"""
+你专注于从页面请求和响应中提取关键信息，你会收到多个页面，每个页面带有编号
+你需要对每个页面分别仔细分析响应页面中的关键信息和请求包中的参数信息给出最终的分析结果，比如注册时提交的用户名密码等键值和页面的响应信息
+你需要为每个页面返回一个xml格式结果，index为页面编号，不能遗漏任何页面，格式如下：
+<result>
+    <index>页面编号</index>
+    <name>页面简单命名（10个字以内）</name>
+    <description><![CDATA 页面描述，描述该页面的具体功能和可以显示的信息]]></description>
+    <key><![CDATA 需要当前页面获取的关键线索（用户名、密码、令牌等），如果没有可以不填，使用自然语言描述，越详细越好，对于令牌需要描述该令牌传入方式，是header还是cookie，并写清楚键值，尽可能详细的写]]></key>
+    {flag_result}
+</result>
+<result>
+    <index>页面编号</index>
+    ...
+</result>
+
+注意：
+* 每个页面的关键线索必须是该页面响应中发现的内容，而且必须是敏感信息，不是凭空猜测的内容，不同页面的信息不要混淆
+* 描述需要足够精炼，但具体参数值必须给出
+* key中不可以携带任何关于漏洞或漏洞提示的信息
+* 如果有多个set-cookie，都要写清楚
+"""
+
+batch_message = """
+第{index}个页面如下：
+请求包：
+{request}
+响应包：
+{response}
+"""
+
+# 等待合并分析的页面：(页面, Future)
+_pending = []
+_pending_lock = threading.Lock()
+_timer = None
+
+
+def _save_single(page):
+    session_id = add_message(message.format(request=page.get("request", ""), response=page.get("response", "")))
+    response = chat(prompt.format(CTF_DESC=config.CTF_DESC), session_id, cache=True, stage="save_page")
+    # print(page, response)
+    result = xmltodict.parse(re.findall("(<result>.*?</result>)", response, re.DOTALL)[0])['result']
+    return result
+
+
+def _save_batch(pages):
+    """
+    一次对话分析多个页面，每个页面作为一条单独的消息，模型按编号返回<result>列表
+    未返回结果的页面单独重新分析，单独分析失败时只影响该页面
+    :param pages: 页面列表
+    :return: 与pages一一对应的分析结果，单独分析失败的页面为对应的异常
+    """
+    if len(pages) == 1:
+        return [_save_single(pages[0])]
+
+    session_id = None
+    for index, page in enumerate(pages, 1):
+        session_id = add_message(batch_message.format(index=index, request=page.get("request", ""), response=page.get("response", "")), session_id)
+    response = chat(batch_prompt.format(CTF_DESC=config.CTF_DESC), session_id, cache=True, stage="save_page")
+
+    results = {}
+    for result_xml in re.findall("(<result>.*?</result>)", response, re.DOTALL):
+        try:
+            result = xmltodict.parse(result_xml)['result']
+            results[int(result.pop('index'))] = result
+        except Exception as e:
+            logger.warn(f"解析批量页面分析结果失败: {e}")
+
+    missing = [index for index in range(1, len(pages) + 1) if index not in results]
+    if missing:
+        logger.warn(f"批量页面分析缺少 {len(missing)} 个结果，单独重新分析")
+    for index in missing:
+        try:
+            results[index] = _save_single(pages[index - 1])
+        except Exception as e:
+            logger.warn(f"单独分析第{index}个页面失败: {e}")
+            results[index] = e
+    return [results[index] for index in range(1, len(pages) + 1)]
+
+
+def save_pages(pages):
+    """
+    批量保存页面，开启批量分析时按SAVE_BATCH_SIZE分组，每组只进行一次对话，否则逐个分析
+    :param pages: 页面列表
+    :return: 与pages一一对应的分析结果，分析失败的页面为None
+    """
+    results = []
+    if not config.SAVE_BATCH_ENABLE:
+        for page in pages:
+            try:
+                results.append(_save_single(page))
+            except Exception as e:
+                logger.warn(f"分析页面失败: {e}")
+                results.append(None)
+        return results
+    for i in range(0, len(pages), config.SAVE_BATCH_SIZE):
+        batch = pages[i:i + config.SAVE_BATCH_SIZE]
+        try:
+            results.extend(None if isinstance(result, Exception) else result for result in _save_batch(batch))
+        except Exception as e:
+            logger.warn(f"批量分析页面失败: {e}")
+            results.extend([None] * len(batch))
+    return results
+
+
+def _flush():
+    """取出所有等待中的页面进行合并分析，并将结果交给各自的Future"""
+    global _timer
+    with _pending_lock:
+        batch = _pending[:config.SAVE_BATCH_SIZE]
+        del _pending[:config.SAVE_BATCH_SIZE]
+        if _timer:
+            _timer.cancel()
+        _timer = None
+        if _pending:
+            _timer = threading.Timer(config.SAVE_BATCH_WINDOW, _flush)
+            _timer.daemon = True
+            _timer.start()
+    if not batch:
+        return
+    try:
+        results = _save_batch([page for page, _ in batch])
+    except Exception as e:
+        for _, future in batch:
+            future.set_exception(e)
+        return
+    for (_, future), result in zip(batch, results):
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+
 def save_page(page):
     """
     保存页面
+    开启批量分析时，页面会等待SAVE_BATCH_WINDOW秒或凑够SAVE_BATCH_SIZE个后与其他线程的页面合并分析
     :param page: 页面
     :return: 动作
     """
-    session_id = add_message(message.format(request=page.get("request", ""), response=page.get("response", "")))
-    response = chat(prompt.format(CTF_DESC=config.CTF_DESC), session_id)
-    # print(page, response)
-    result = xmltodict.parse(re.findall("(<result>.*?</result>)", response, re.DOTALL)[0])['result']
-    return result
+    if not config.SAVE_BATCH_ENABLE:
+        return _save_single(page)
+
+    global _timer
+    future = Future()
+    with _pending_lock:
+        _pending.append((page, future))
+        full = len(_pending) >= config.SAVE_BATCH_SIZE
+        if not full and _timer is None:
+            _timer = threading.Timer(config.SAVE_BATCH_WINDOW, _flush)
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        _flush()
+    return future.result()
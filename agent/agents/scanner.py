@@ -1,4 +1,6 @@
+import asyncio
 import json
+import threading
 import traceback
 import uuid
 from agents.actioner import execute_solution
@@ -9,7 +11,26 @@ from config import config
 
 import concurrent.futures
 
-def vuln_scan(page, key, simple_key, explorer_pages, task_id):
+
+async def run_in_worker(executor, timeout, fn, *args):
+    """
+    在线程池中执行函数，超时时间从线程开始执行时计算，排队等待空闲线程的时间不计入
+    :param executor: 线程池
+    :param timeout: 开始执行后最多等待的秒数
+    :return: 函数的返回值，超时抛出asyncio.TimeoutError
+    """
+    loop = asyncio.get_running_loop()
+    started = asyncio.Event()
+
+    def worker():
+        loop.call_soon_threadsafe(started.set)
+        return fn(*args)
+
+    future = asyncio.wrap_future(executor.submit(worker))
+    await started.wait()
+    return await asyncio.wait_for(future, timeout=timeout)
+
+async def vuln_scan(page, key, simple_key, explorer_pages, task_id):
     from utils.agent_manager import agent_manager
 
     # 发送 pure 消息，开始获取漏洞检测思路（running状态）
@@ -21,7 +42,7 @@ def vuln_scan(page, key, simple_key, explorer_pages, task_id):
     session_id = solution_message.get('id')
     
     try:
-        solutions = get_solutions(page, simple_key, session_id=session_id)
+        solutions = await get_solutions(page, simple_key, session_id=session_id)
         
         # 更新消息状态为获取漏洞检测思路完成
         if solution_message:
@@ -39,19 +60,29 @@ def vuln_scan(page, key, simple_key, explorer_pages, task_id):
         all_results = []
         vulns = task_helper.get_all_vulns(task_id)
 
-        # 创建线程池执行器
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            # 创建任务列表
-            future_to_solution = {
-                executor.submit(execute_solution, s, page, key, {str(uuid.uuid4()):explorer_pages[i] for i in range(len(explorer_pages))}, vulns): s
-                for s in solutions
-            }
+        # 创建线程池执行器，检测思路在线程中执行，通过asyncio等待结果，不阻塞事件循环
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+        # 线程无法强制结束，超时后通过停止标志让检测思路在下一步开始前退出
+        stop_events = []
+
+        async def run_solution(s):
+            stop_event = threading.Event()
+            stop_events.append(stop_event)
+            try:
+                # 单个检测思路最多执行1200秒，从线程开始执行时计时
+                return s, await run_in_worker(executor, 1200, execute_solution, s, page, key, {str(uuid.uuid4()):explorer_pages[i] for i in range(len(explorer_pages))}, vulns, stop_event)
+            except asyncio.TimeoutError:
+                logger.error(f"检测思路 【{s}】执行超时 (1200秒)")
+                return s, None
+            finally:
+                stop_event.set()
 
-            # 获取执行结果
-            for future in concurrent.futures.as_completed(future_to_solution, timeout=3600):
-                s = future_to_solution[future]
+        tasks = [asyncio.ensure_future(run_solution(s)) for s in solutions]
+        try:
+            # 获取执行结果，整体最多执行3600秒
+            for task in asyncio.as_completed(tasks, timeout=3600):
                 try:
-                    result = future.result(timeout=1200)
+                    s, result = await task
                     # vuln_result = f"是否存在漏洞：{result['vuln']} 是否需要深入利用：{result['needDeep']} 说明：{result['key']}"
                     logger.info(f"检测思路 【{s}】结果：{result}")
                     if result and 'result' in result and result['result']:
@@ -69,18 +100,23 @@ def vuln_scan(page, key, simple_key, explorer_pages, task_id):
                                 }
                             )
 
-                except concurrent.futures.TimeoutError:
-                    logger.error(f"检测思路 【{s}】执行超时 (1200秒)")
-                    continue
+                except asyncio.TimeoutError:
+                    raise
                 except Exception as e:
                     traceback.print_exc()
                     logger.error(f"执行漏洞检测思路异常: {str(e)}")
                     # 如果有异常，更新执行消息为错误状态
                     continue
+        finally:
+            for task in tasks:
+                task.cancel()
+            for stop_event in stop_events:
+                stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
 
 
             
-    except concurrent.futures.TimeoutError:
+    except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
         logger.error(f"漏洞扫描整体执行超时 (3600秒)")
         if solution_message:
             agent_manager.update_pure_message_status(
@@ -1,6 +1,6 @@
 from config import config
 from utils import page_helper
-from utils.chatbot import add_message, chat
+from utils.chatbot import aadd_message, achat
 from utils.logger import logger
 import xmltodict
 import re
@@ -75,7 +75,7 @@ def parse_solutions(response):
         pass
     return solutions
 
-def get_solutions(page, key, session_id):
+async def get_solutions(page, key, session_id):
     """
     漏洞扫描
     :param page: 页面信息
@@ -83,8 +83,8 @@ def get_solutions(page, key, session_id):
     """
     # 构建提示词
     # 调用OpenAI API获取回复
-    add_message(message_template.format(key=key, request=page["request"], response=page["response"]), session_id=session_id)
-    response = chat(prompt.format(CTF_DESC=config.CTF_DESC), session_id=session_id)
+    await aadd_message(message_template.format(key=key, request=page["request"], response=page["response"]), session_id=session_id)
+    response = await achat(prompt.format(CTF_DESC=config.CTF_DESC), session_id=session_id, stage="solution")
     logger.info(f"{page['name']} 获取漏洞检测思路：{response}")
     # 解析漏洞检测思路
     solutions = parse_solutions(response)
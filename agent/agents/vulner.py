@@ -38,12 +38,13 @@ message_template = """
 def exploit_vuln(request, vuln, desc, message):
     prompt = prompt_template.format(request_desc=config.get_addon("request"))
     session_id = chatbot.add_message(message=message_template.format(request=request, vuln=vuln, desc=desc, message=message))
-    response = chatbot.chat(prompt=prompt, session_id=session_id)
+    response = chatbot.chat(prompt=prompt, session_id=session_id, stage="vuln")
     while True:
         request_xml = re.search(r"(<request>.*?</request>)", response, re.DOTALL)
         summary_xml = re.search(r"(<summary>.*?</summary>)", response, re.DOTALL)
         if request_xml:
             request_json = xmltodict.parse(request_xml.group(1))["request"]
+            request_json['stage'] = "vuln"
             result = request.run(request_json)
             message = f"请求响应：{result}"
             chatbot.add_message(message=message, session_id=session_id)
@@ -4,9 +4,6 @@ from hmac import new
 import json
 from operator import ne
 from addons import request
-import concurrent.futures
-from threading import Lock
-from config import config
 
 
 prompt_detect = """
@@ -123,52 +120,38 @@ def simple_detect(request_json, response, param=None):
                 # 存储测试结果
                 results = {}
                 result_info = []
-                results_lock = Lock()
-                
-                def test_jwt_value(test_value):
 
-                    if config.FLAG:
-                        return
+                def build_jwt_request(test_value):
+                    # 修改payload中的目标参数
+                    new_payload = decoded_jwt['payload'].copy()
+                    new_payload[param['param']] = test_value
+
+                    # 重新编码payload
+                    new_payload_b64 = base64.b64encode(json.dumps(new_payload).encode()).decode().rstrip('=')
+                    new_payload_b64 = new_payload_b64.replace('+', '-').replace('/', '_')
+
+                    # 构造新的JWT令牌
+                    new_token = f"{base64.b64encode(json.dumps(decoded_jwt['header']).encode()).decode().rstrip('=').replace('+', '-').replace('/', '_')}.{new_payload_b64}.{decoded_jwt['signature']}"
+                    if authorized_pre:
+                        new_token = f"{authorized_pre} {new_token}"
+
+                    return json.loads(param['request'].replace("'", '"').replace("{FUZZ}", new_token))
+
+                test_requests = []
+                for test_value in test_values[:500]:
                     try:
-                        # 修改payload中的目标参数
-                        new_payload = decoded_jwt['payload'].copy()
-                        new_payload[param['param']] = test_value
-                        
-                        # 重新编码payload
-                        new_payload_b64 = base64.b64encode(json.dumps(new_payload).encode()).decode().rstrip('=')
-                        new_payload_b64 = new_payload_b64.replace('+', '-').replace('/', '_')
-                        
-                        # 构造新的JWT令牌
-                        new_token = f"{base64.b64encode(json.dumps(decoded_jwt['header']).encode()).decode().rstrip('=').replace('+', '-').replace('/', '_')}.{new_payload_b64}.{decoded_jwt['signature']}"
-                        if authorized_pre:
-                            new_token = f"{authorized_pre} {new_token}"
-                        
-                        # 发送请求并获取响应
-                        new_request = json.loads(param['request'].replace("'", '"').replace("{FUZZ}", new_token))
-                        new_response = request.run(new_request)
-                        
-                        # 简化响应内容，将测试值替换为{payload}
-                        simplify_content = new_response['content'].replace(str(test_value), "{payload}")
-                        
-                        # 线程安全地更新结果
-                        with results_lock:
-                            response_found = False
-                            for existing_response, values in results.items():
-                                if simplify_content == existing_response:
-                                    results[existing_response].append(str(test_value))
-                                    response_found = True
-                                    break
-                            
-                            # 如果是新的响应，创建新条目
-                            if not response_found:
-                                results[simplify_content] = [str(test_value)]
+                        test_requests.append((test_value, build_jwt_request(test_value)))
                     except Exception as e:
                         print(f"JWT测试值 {test_value} 出错: {str(e)}")
-                
-                # 使用10并发进行模糊测试
-                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                    futures = [executor.submit(test_jwt_value, test_value) for test_value in test_values[:500]]
-                    concurrent.futures.wait(futures)
+
+                # 在一个事件循环中并发发送所有请求，拿到flag后停止
+                responses = request.run_batch([r for _, r in test_requests])
+                for (test_value, _), new_response in zip(test_requests, responses):
+                    if new_response is None:
+                        continue
+                    # 简化响应内容，将测试值替换为{payload}，相同响应的载荷合并
+                    simplify_content = new_response['content'].replace(str(test_value), "{payload}")
+                    results.setdefault(simplify_content, []).append(str(test_value))
                 
                 # 格式化结果信息
                 for k in results:
@@ -196,41 +179,22 @@ def simple_detect(request_json, response, param=None):
                 # 存储测试结果
                 results = {}
                 result_info = []
-                results_lock = Lock()
 
-                def test_normal_value(test_value):
-                    if config.FLAG:
-                        return
+                test_requests = []
+                for test_value in test_values[:500]:
                     try:
-                        # 构造新的请求
-                        new_request = json.loads(param['request'].replace("'", '"').replace("{FUZZ}", str(test_value)))
-
-                        # 发送请求并获取响应
-                        new_response = request.run(new_request)
-
-                        # 简化响应内容，将测试值替换为{payload}
-                        simplify_content = new_response['content'].replace(str(test_value), "{payload}")
-                        
-                        # 线程安全地更新结果
-                        with results_lock:
-                            response_found = False
-                            for existing_response, values in results.items():
-                                if simplify_content == existing_response:
-                                    results[existing_response].append(str(test_value))
-                                    response_found = True
-                                    break
-
-                            # 如果是新的响应，创建新条目
-                            if not response_found:
-                                results[simplify_content] = [str(test_value)]
+                        test_requests.append((test_value, json.loads(param['request'].replace("'", '"').replace("{FUZZ}", str(test_value)))))
                     except Exception as e:
                         print(f"Normal测试值 {test_value} 出错: {str(e)}")
 
-                # 使用10并发进行模糊测试
-                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                    futures = [executor.submit(test_normal_value, test_value) for test_value in test_values[:500]]
-                    concurrent.futures.wait(futures)
-
+                # 在一个事件循环中并发发送所有请求，拿到flag后停止
+                responses = request.run_batch([r for _, r in test_requests])
+                for (test_value, _), new_response in zip(test_requests, responses):
+                    if new_response is None:
+                        continue
+                    # 简化响应内容，将测试值替换为{payload}，相同响应的载荷合并
+                    simplify_content = new_response['content'].replace(str(test_value), "{payload}")
+                    results.setdefault(simplify_content, []).append(str(test_value))
 
                 for k in results:
                     result_info.append(f"载荷 【{','.join(results[k])}】: {k}\n")
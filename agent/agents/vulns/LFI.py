@@ -1,7 +1,5 @@
 import json
 import urllib3.util
-import concurrent.futures
-from threading import Lock
 from addons import request
 from config import config
 
@@ -85,40 +83,22 @@ def simple_detect(request_json, response, param=None):
             # 存储测试结果
             results = {}
             result_info = []
-            results_lock = Lock()
-            
-            def test_lfi_payload(test_payload):
-                if config.FLAG:
-                    return
+
+            test_requests = []
+            for test_payload in payload:
                 try:
-                    # 构造新的请求
-                    new_request = json.loads(param['request'].replace("{LFI}", str(test_payload)))
-                    
-                    # 发送请求并获取响应
-                    new_response = request.run(new_request)
-                    
-                    # 简化响应内容，将测试值替换为{payload}
-                    simplify_content = new_response['content'].replace(str(test_payload), "{payload}")
-                    
-                    # 线程安全地更新结果
-                    with results_lock:
-                        response_found = False
-                        for existing_response, values in results.items():
-                            if simplify_content == existing_response:
-                                results[existing_response].append(str(test_payload))
-                                response_found = True
-                                break
-                        
-                        # 如果是新的响应，创建新条目
-                        if not response_found:
-                            results[simplify_content] = [str(test_payload)]
+                    test_requests.append((test_payload, json.loads(param['request'].replace("{LFI}", str(test_payload)))))
                 except Exception as e:
                     print(f"LFI测试载荷 {test_payload} 出错: {str(e)}")
-            
-            # 使用10并发进行模糊测试
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                futures = [executor.submit(test_lfi_payload, test_payload) for test_payload in payload]
-                concurrent.futures.wait(futures)
+
+            # 在一个事件循环中并发发送所有请求，拿到flag后停止
+            responses = request.run_batch([r for _, r in test_requests])
+            for (test_payload, _), new_response in zip(test_requests, responses):
+                if new_response is None:
+                    continue
+                # 简化响应内容，将测试值替换为{payload}，相同响应的载荷合并
+                simplify_content = new_response['content'].replace(str(test_payload), "{payload}")
+                results.setdefault(simplify_content, []).append(str(test_payload))
             
             # 格式化结果信息
             for k in results:
@@ -150,40 +130,22 @@ def simple_detect(request_json, response, param=None):
             # 存储测试结果
             results = {}
             result_info = []
-            results_lock = Lock()
-            
-            def test_url_payload(test_payload):
-                if config.FLAG:
-                    return
+
+            test_requests = []
+            for test_payload in payload:
                 try:
-                    # 构造新的请求
-                    new_request = json.loads(param['request'].replace("{LFI}", str(test_payload)))
-                    
-                    # 发送请求并获取响应
-                    new_response = request.run(new_request)
-                    
-                    # 简化响应内容，将测试值替换为{payload}
-                    simplify_content = new_response['content'].replace(str(test_payload), "{payload}")
-                    
-                    # 线程安全地更新结果
-                    with results_lock:
-                        response_found = False
-                        for existing_response, values in results.items():
-                            if simplify_content == existing_response:
-                                results[existing_response].append(str(test_payload))
-                                response_found = True
-                                break
-                        
-                        # 如果是新的响应，创建新条目
-                        if not response_found:
-                            results[simplify_content] = [str(test_payload)]
+                    test_requests.append((test_payload, json.loads(param['request'].replace("{LFI}", str(test_payload)))))
                 except Exception as e:
                     print(f"URL测试载荷 {test_payload} 出错: {str(e)}")
-            
-            # 使用10并发进行模糊测试
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                futures = [executor.submit(test_url_payload, test_payload) for test_payload in payload]
-                concurrent.futures.wait(futures)
+
+            # 在一个事件循环中并发发送所有请求，拿到flag后停止
+            responses = request.run_batch([r for _, r in test_requests])
+            for (test_payload, _), new_response in zip(test_requests, responses):
+                if new_response is None:
+                    continue
+                # 简化响应内容，将测试值替换为{payload}，相同响应的载荷合并
+                simplify_content = new_response['content'].replace(str(test_payload), "{payload}")
+                results.setdefault(simplify_content, []).append(str(test_payload))
             
             # 格式化结果信息
             for k in results:
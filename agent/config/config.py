@@ -15,7 +15,7 @@ DEEPSEEK_API_MODEL_ACTION = "deepseek-chat"
 TENCENT_API_URL = "https://api.lkeap.cloud.tencent.com/v1"
 TENCENT_API_KEY = ""
 TENCENT_API_MODEL_ACTION = "deepseek-v3.1-terminus"
-TENCENT_API_RANDOM_KEY = random.choice(API_KEYS)
+TENCENT_API_RANDOM_KEY = random.choice(API_KEYS) if API_KEYS else TENCENT_API_KEY
 
 
 SILCON_API_URL = "https://api.siliconflow.cn/v1"
@@ -51,6 +51,115 @@ TEMP_PATH = os.path.join(BASE_PATH, "temp/")
 
 POC_PATH = os.path.join(BASE_PATH, "pocs/")
 
+# LLM响应缓存配置（调用方通过chat(cache=True)显式开启）
+LLM_CACHE_ENABLE = False  # 全局开关
+LLM_CACHE_PATH = os.path.join(BASE_PATH, "llm_cache.db")
+LLM_CACHE_MAX_ENTRIES = 5000  # 最大缓存条目数
+LLM_CACHE_MAX_BYTES = 200 * 1024 * 1024  # 最大缓存总大小（字节）
+LLM_CACHE_MAX_AGE = 7 * 24 * 3600  # 缓存有效期（秒）
+
+LLM_STANDIN_PATH = os.path.join(BASE_PATH, "llm_fixtures.db")  # LLM替身服务的录制夹具库
+
+# LLM客户端连接池配置，所有线程共享
+LLM_POOL_MAX_CONNECTIONS = 50  # 每个(base_url, api_key)的最大连接数
+LLM_POOL_MAX_KEEPALIVE = 20  # 最大保活连接数
+LLM_POOL_KEEPALIVE_EXPIRY = 60  # 空闲连接保活时间（秒）
+
+# LLM多密钥调度配置，请求失败的密钥按指数退避（带随机抖动）暂停使用
+LLM_DISPATCH_ENABLE = False  # 开启后在多个服务商和密钥之间分配请求，关闭时只使用API_URL/API_KEY
+LLM_DISPATCH_PROVIDERS = ["deepseek", "tencent", "silcon"]  # 参与调度的服务商，tencent同时使用API_KEYS中的所有密钥
+LLM_BACKOFF_BASE = 1  # 退避基础时间（秒）
+LLM_BACKOFF_MAX = 60  # 最大退避时间（秒）
+LLM_MAX_IN_FLIGHT = 16  # 进程内同时进行的LLM请求上限，超出后按调用阶段公平排队
+
+# LLM路由配置：调用阶段 -> 路由，未配置的阶段使用默认接口（API_URL或调度池）
+# 阶段：save_page、explore、js、solution、action、vuln、hunt_flag、compact
+# provider：deepseek/tencent/silcon/glm/default，model为空时使用服务商默认模型
+# timeout：单次请求超时时间（秒），fallback：请求失败后重试使用的服务商
+LLM_ROUTES = {
+    # "save_page": {"provider": "silcon", "model": "Qwen/Qwen2.5-7B-Instruct", "timeout": 60, "fallback": "default"},
+    # "js": {"provider": "silcon", "model": "Qwen/Qwen2.5-7B-Instruct", "timeout": 60, "fallback": "default"},
+}
+
+# LLM对冲请求配置，主请求超过该阶段耗时分位数仍未返回时向备用服务商发起相同请求
+LLM_HEDGE_ENABLE = False
+LLM_HEDGE_PROVIDER = "silcon"  # 对冲请求使用的服务商
+LLM_HEDGE_PERCENTILE = 95  # 截止时间使用的耗时分位数
+LLM_HEDGE_MIN_SAMPLES = 20  # 计算分位数需要的最少样本数量
+LLM_HEDGE_DEFAULT_DELAY = 30  # 样本不足时的截止时间（秒）
+LLM_HEDGE_MIN_DELAY = 3  # 截止时间下限（秒）
+
+# LLM调用统计配置，按任务、阶段和模型汇总后随心跳上报
+LLM_STATS_MAX_SAMPLES = 1000  # 每组统计保留的耗时样本数量，用于计算分位数
+LLM_STATS_MAX_KEYS = 500  # 最多保留的统计分组数量
+
+# 页面分析批量配置，多个页面合并为一次save_page对话
+SAVE_BATCH_ENABLE = False  # 合并分析会让每个页面多等待SAVE_BATCH_WINDOW秒，多页面共用一次回复也可能混淆线索，默认关闭
+SAVE_BATCH_SIZE = 8  # 每次对话最多分析的页面数量
+SAVE_BATCH_WINDOW = 0.5  # 等待其他页面加入批次的时间（秒）
+
+HISTORY_CACHE_MAX_SESSIONS = 500  # 内存中缓存的会话历史数量，超出后淘汰最久未使用的会话
+
+# 会话压缩配置，超出预算时将较早的消息替换为摘要
+COMPACT_ENABLE = False  # 摘要会丢失较早消息的细节，且每次压缩多一次模型调用，默认关闭
+COMPACT_TOKEN_BUDGET = 40000  # 单次对话（系统提示词+历史消息）的估算token预算
+COMPACT_KEEP_MESSAGES = 8  # 压缩时保留原文的最近消息数量
+
+# 提示词装箱配置，按模型的上下文窗口装入系统提示词和历史消息，优先保留最新的消息
+LLM_CONTEXT_TOKENS = {
+    "deepseek-chat": 64000,
+    "deepseek-v3.1-terminus": 128000,
+    "Pro/deepseek-ai/DeepSeek-V3.1-Terminus": 128000,
+    "glm-4-long": 1000000
+}  # 模型上下文窗口（token）
+LLM_DEFAULT_CONTEXT_TOKENS = 32000  # 未配置的模型使用的上下文窗口
+LLM_REPLY_RESERVE_TOKENS = 8000  # 为模型回复预留的token数
+PACK_STUB_TOKENS = 300  # 超出预算的较早消息截断后保留的token数
+
+# 响应精简配置，页面响应放入提示词前移除样式、data URI等无关内容
+MINIMIZE_ENABLE = False  # 精简会删除部分响应内容（svg、样式、data URI、重复的表格行），可能丢失线索，默认关闭
+MINIMIZE_MAX_SIMILAR_ROWS = 3  # 连续相似表格行超过该数量时合并
+MINIMIZE_LOG_BYTES = 2048  # 单个页面节省超过该字节数时记录日志
+
+# 内容存储配置，较长的响应和消息按sha256摘要压缩保存，页面文件和消息表中只保存引用
+BLOB_STORE_PATH = os.path.join(BASE_PATH, "blobs.db")
+BLOB_INLINE_BYTES = 4096  # 短于该长度的内容直接保存原文
+BLOB_MEMORY_MAX_BYTES = 64 * 1024 * 1024  # 内存中缓存的最近使用内容的总大小
+
+# 目标站点HTTP连接池配置，request工具按主机复用长连接
+# 与urllib一致，遵循http_proxy、https_proxy和no_proxy环境变量，https经代理时通过CONNECT建立隧道
+HTTP_POOL_MAX_PER_HOST = 10  # 每个主机保留的空闲连接数量
+HTTP_POOL_IDLE_TIMEOUT = 30  # 空闲连接的最长保留时间（秒），超过后关闭
+HTTP_BATCH_CONCURRENCY = 20  # 批量请求（模糊测试）在一个事件循环中的最大并发数
+REQUEST_ACCEPT_COMPRESSION = True  # 请求时声明支持gzip/deflate（安装brotli后还有br）压缩，响应自动解压
+REQUEST_MAX_BODY = 10 * 1024 * 1024  # 响应体（解压后）的最大字节数，超出部分丢弃
+
+# 目标主机自适应限流（AIMD），所有request工具的请求共享
+HOST_LIMIT_ENABLE = False  # 初始并发上限低于不限流时的并发，开启后目标正常时也要逐步增长，默认关闭
+HOST_LIMIT_INITIAL = 8  # 初始并发上限
+HOST_LIMIT_MIN = 1
+HOST_LIMIT_MAX = 64
+HOST_LIMIT_DECREASE = 0.5  # 出现过载状态码、超时或连接错误时上限乘以该系数
+HOST_LIMIT_OVERLOAD_STATUS = [429, 503]  # 视为目标过载的状态码，500通常是请求触发的程序错误，不计入
+HOST_LIMIT_MAX_RETRY_AFTER = 60  # 遵循Retry-After暂停发送的最长时间（秒）
+HOST_LIMIT_LATENCY_FACTOR = 3  # 平均延迟超过基线的倍数时停止增长
+
+# 页面近似去重（SimHash），同一路径下只有令牌、时间戳等少量内容不同的页面作为已有页面的变体，不再重复分析
+PAGE_SIMHASH_ENABLE = False  # 近似页面不再分析，只有少量差异的页面可能被漏掉，默认关闭
+PAGE_SIMHASH_THRESHOLD = 3  # 64位SimHash的汉明距离不超过该值时视为近似页面
+PAGE_SIMHASH_MIN_FEATURES = 30  # 特征数少于该值的页面（如简短的接口响应）不做近似判断
+
+# request工具的任务级响应缓存，同一任务内相同的GET/HEAD/OPTIONS请求在有效期内直接复用响应
+RESPONSE_CACHE_ENABLE = False
+RESPONSE_CACHE_TTL = 30  # 缓存有效期（秒）
+RESPONSE_CACHE_MAX_ENTRIES = 2000
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 缓存响应体的总大小
+RESPONSE_CACHE_LOG_INTERVAL = 200  # 每查询多少次输出一次各阶段命中率
+
+# request工具的任务级会话，开启后按身份和主机保存cookie和认证头
+REQUEST_SESSION_DEFAULT = False  # 未指定session参数的请求是否使用默认身份
+REQUEST_SESSION_AUTH_HEADERS = ["Authorization", "X-Auth-Token", "X-Access-Token", "X-Api-Key", "X-CSRF-Token", "Token"]  # 会话中保存的认证头
+
 BASE_URL = "http://10.0.0.6:8000"
 
 HUNTER = None
@@ -15,7 +15,7 @@ from agents.explorer import explore_page
 from agents.poc import Scanner, Flagger
 from agents.scanner import vuln_scan
 from config import config
-from utils import page_helper, flagUtil
+from utils import blob_store, page_helper, flagUtil, chatbot
 from utils.logger import logger
 from utils.agent_manager import agent_manager
 
@@ -88,7 +88,7 @@ class FlagHunter():
                     )
                     session_id = explore_message['id']
                     try:
-                        step_pages = explore_page(pp, key=open(self.key_file, "r").read(), vuln=open(self.vuln_file, "r").read(), session_id=session_id)
+                        step_pages = await explore_page(pp, key=open(self.key_file, "r").read(), vuln=open(self.vuln_file, "r").read(), session_id=session_id)
                     except Exception as e:
                         traceback.print_exc()
                         break
@@ -104,7 +104,7 @@ class FlagHunter():
                         if os.path.exists(page_path):
                             page_path = f"{self.task_page_path}/{p['name']}-{uuid.uuid4()}.json"
                         with open(page_path, "w") as pf:
-                            pf.write(json.dumps(p))
+                            pf.write(json.dumps(blob_store.dehydrate_page(p)))
                         if "path" in pp:
                             if not page_helper.get_parent_page(p['id']):
                                 page_helper.insert_page_parent(pp['path'], p['id'])
@@ -261,8 +261,8 @@ class FlagHunter():
                             return 0
         return len(poc_results)
 
-    def llm_scan(self, page):
-        results = vuln_scan(page, key=open(self.key_file, "r").read(), simple_key=open(self.key_simple_file, "r").read(), explorer_pages=self.explorer_pages,
+    async def llm_scan(self, page):
+        results = await vuln_scan(page, key=open(self.key_file, "r").read(), simple_key=open(self.key_simple_file, "r").read(), explorer_pages=self.explorer_pages,
                             task_id=self.task_id)
         if results:
             print(results)
@@ -337,9 +337,9 @@ class FlagHunter():
                     logger.info(f"检测页面：{p['name']}")
                     if p['response']['status'] not in config.IGNORE_STATUS_LIST:
                         vuln_count = 0
-                        vuln_count += self.poc_scan(p)
+                        vuln_count += await asyncio.to_thread(self.poc_scan, p)
                         if not config.FLAG or not config.NEED_FLAG:
-                            vuln_count += self.llm_scan(p)
+                            vuln_count += await self.llm_scan(p)
                         if vuln_count:
                             self.new_vuln = True
                     self.detect_pages.append(p)
@@ -387,6 +387,7 @@ class FlagHunter():
 
         finally:
             # 清理事件循环
+            loop.run_until_complete(chatbot.close_async_clients())
             loop.close()
             asyncio.set_event_loop(None)
 
@@ -452,6 +453,9 @@ def main(name=None, challenge_code=None, api_token=None, mode=None):
             config.API_URL = config.TENCENT_API_URL
             config.API_KEY = config.TENCENT_API_RANDOM_KEY
             config.API_MODEL_ACTION = config.TENCENT_API_MODEL_ACTION
+            # 在腾讯云的所有密钥之间调度请求
+            config.LLM_DISPATCH_ENABLE = True
+            config.LLM_DISPATCH_PROVIDERS = ["tencent"]
 
     """主函数，处理agent注册和心跳"""
     logger.info("ctfSolver启动中...")
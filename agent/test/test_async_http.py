@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试异步请求引擎的请求编码和响应读取，使用本地原始socket服务构造响应，不依赖真实目标
+"""
+
+import asyncio
+import http.client
+import os
+import socketserver
+import sys
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from utils import async_http
+
+RESPONSES = {
+    "/chunked": b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n",
+    "/big": b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n" + b"a" * 100,
+    "/eof": b"HTTP/1.1 200 OK\r\n\r\nread until close",
+    "/continue": b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok",
+    "/stale": b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nfresh",
+}
+
+
+class RawHandler(socketserver.StreamRequestHandler):
+    """按路径返回预先构造的响应，/stale在同一连接的第二个请求时直接断开，模拟服务端关闭空闲连接"""
+
+    def handle(self):
+        served = 0
+        while True:
+            head = []
+            while True:
+                line = self.rfile.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                head.append(line)
+            if not head:
+                return
+            length = 0
+            for line in head[1:]:
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            raw = b"".join(head) + b"\r\n" + self.rfile.read(length)
+            path = head[0].split()[1].decode()
+            if path == "/stale" and served:
+                return
+            served += 1
+            response = RESPONSES.get(path, b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(raw), raw))
+            self.wfile.write(response)
+            self.wfile.flush()
+            if path == "/eof":
+                return
+
+
+def start_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RawHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_encode_request():
+    """补全Host、Accept-Encoding和Content-Length，已有的请求头原样发送，路径中的控制字符被拒绝"""
+    data = async_http.encode_request("POST", "example.com", 8080, "http", "/a?b=1", {"X-Test": "1"}, b"k=v")
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    assert lines[0] == "POST /a?b=1 HTTP/1.1"
+    assert "Host: example.com:8080" in lines and "Content-Length: 3" in lines and "X-Test: 1" in lines
+    assert "Accept-Encoding: identity" in lines and body == b"k=v"
+
+    data = async_http.encode_request("GET", "example.com", 443, "https", "/", {"host": "other", "Accept-Encoding": "gzip"}, None)
+    lines = data.decode().split("\r\n")
+    assert "host: other" in lines and "Accept-Encoding: gzip" in lines
+    assert not any(line.startswith(("Host:", "Content-Length")) for line in lines)
+    assert "Content-Length: 0" in async_http.encode_request("POST", "h", 80, "http", "/", {}, None).decode()
+
+    try:
+        async_http.encode_request("GET", "h", 80, "http", "/a b", {}, None)
+        assert False, "路径中的空格应当被拒绝"
+    except http.client.InvalidURL:
+        pass
+    print("请求编码测试通过")
+
+
+def test_read_response():
+    """chunked、截断、读到连接关闭、100 Continue和空闲连接失效重试"""
+    server = start_server()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    async def main():
+        pool = async_http.AsyncConnectionPool()
+        try:
+            response = await pool.request("POST", base + "/echo", {"X-Test": "1"}, b"k=v")
+            assert response.status == 200 and response.body.endswith(b"\r\n\r\nk=v")
+            assert b"X-Test: 1" in response.body
+
+            response = await pool.request("GET", base + "/chunked")
+            assert response.body == b"hello world" and not response.truncated
+            response = await pool.request("GET", base + "/chunked", max_body=7)
+            assert response.body == b"hello w" and response.truncated
+
+            response = await pool.request("GET", base + "/big", max_body=10)
+            assert response.body == b"a" * 10 and response.truncated
+            response = await pool.request("GET", base + "/eof")
+            assert response.body == b"read until close"
+            response = await pool.request("GET", base + "/continue")
+            assert response.status == 200 and response.body == b"ok"
+
+            # 关闭空闲连接，保证第一个/stale请求使用新连接
+            pool.close()
+            stale = async_http.get_stats()["stale_retries"]
+            assert (await pool.request("GET", base + "/stale")).body == b"fresh"
+            assert (await pool.request("GET", base + "/stale")).body == b"fresh"
+            assert async_http.get_stats()["stale_retries"] == stale + 1
+
+            # 服务端可能已经处理了POST请求，连接失效时不重发
+            pool.close()
+            assert (await pool.request("POST", base + "/stale", body=b"k=v")).body == b"fresh"
+            try:
+                await pool.request("POST", base + "/stale", body=b"k=v")
+                assert False, "POST请求不应重试"
+            except (http.client.RemoteDisconnected, ConnectionError, asyncio.IncompleteReadError):
+                pass
+            assert async_http.get_stats()["stale_retries"] == stale + 1
+        finally:
+            pool.close()
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.shutdown()
+    print("响应读取测试通过")
+
+
+if __name__ == '__main__':
+    test_encode_request()
+    test_read_response()
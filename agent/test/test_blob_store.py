@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+测试内容存储的引用和任务结束时的回收，使用临时数据库和任务目录
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from utils import blob_store
+
+
+def test_collect():
+    """任务结束时只回收消息表、页面文件和其他任务都不再引用的内容"""
+    tmp = tempfile.mkdtemp()
+    with mock.patch.object(config, "DB_PATH", os.path.join(tmp, "chat.db")), \
+            mock.patch.object(config, "BLOB_STORE_PATH", os.path.join(tmp, "blobs.db")), \
+            mock.patch.object(config, "TASK_PATH", os.path.join(tmp, "tasks")), \
+            mock.patch.object(config, "TASK_ID", "blob-test-1"), \
+            mock.patch.object(blob_store, "_initialized", False):
+        conn = sqlite3.connect(config.DB_PATH)
+        conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, session_id TEXT, role TEXT, content TEXT, status TEXT)")
+        conn.commit()
+
+        kept, dropped, shared, paged = ("x" * config.BLOB_INLINE_BYTES + str(i) for i in range(4))
+        kept_ref = blob_store.ref(kept)
+        dropped_ref = blob_store.ref(dropped)
+        blob_store.ref(shared)
+        assert kept_ref == blob_store.ref_of(kept) and blob_store.ref_of("short") == "short"
+        conn.execute("INSERT INTO messages (session_id, role, content, status) VALUES ('s', 'user', ?, 'default')", (kept_ref,))
+        conn.commit()
+        conn.close()
+
+        # 页面文件中保存的是引用，读取时还原
+        page = {"id": "p", "response": {"status": 200, "content": paged}}
+        page_dir = os.path.join(config.TASK_PATH, "blob-test-1", "pages")
+        os.makedirs(page_dir)
+        with open(os.path.join(page_dir, "p.json"), "w") as f:
+            f.write(json.dumps(blob_store.dehydrate_page(page)))
+
+        config.TASK_ID = "blob-test-2"
+        blob_store.ref(shared)
+
+        assert blob_store.collect("blob-test-1") == 1
+        assert blob_store.resolve(kept_ref) == kept
+        assert blob_store.resolve(dropped_ref) == dropped_ref
+        assert blob_store.resolve(blob_store.ref_of(shared)) == shared
+        with open(os.path.join(page_dir, "p.json")) as f:
+            assert blob_store.hydrate_page(json.loads(f.read()))["response"]["content"] == paged
+        assert blob_store.collect("blob-test-2") == 1
+        assert blob_store.resolve(blob_store.ref_of(shared)) == blob_store.ref_of(shared)
+    print("内容回收测试通过")
+
+
+if __name__ == '__main__':
+    test_collect()
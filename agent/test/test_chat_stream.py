@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+测试流式回复的增量xml解析，以及调用方提前停止迭代时回复仍保存到对话历史
+使用模拟的流式回复，不调用模型
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from utils import chatbot, llm_dispatcher
+
+
+def feed_all(parser, chunks):
+    blocks = []
+    for chunk in chunks:
+        blocks.extend(parser.feed(chunk))
+    return blocks
+
+
+def test_split_tags():
+    """标签被拆分到多个片段中时，闭合标签到达后才返回完整的块"""
+    parser = chatbot.XmlBlockParser(("step",))
+    assert parser.feed("思考过程<st") == []
+    assert parser.feed("ep><url>/a</url></st") == []
+    assert parser.feed("ep>\n<step><url>/b</url>") == ["<step><url>/a</url></step>"]
+    assert parser.feed("</step>") == ["<step><url>/b</url></step>"]
+    # 已经返回的块不会重复返回
+    assert parser.feed("结束") == []
+
+    text = "<step>1</step><other>x</other><summary>s</summary>"
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+    assert feed_all(chatbot.XmlBlockParser(("step", "summary")), chunks) == ["<step>1</step>", "<summary>s</summary>"]
+    print("标签拆分测试通过")
+
+
+def test_cdata():
+    """CDATA中的闭合标签不结束块，CDATA未闭合时等待后续内容"""
+    parser = chatbot.XmlBlockParser(("step",))
+    assert parser.feed("<step><code><![CDATA[echo '</step>'") == []
+    assert parser.feed(" ]]></code>") == []
+    assert parser.feed("</step>") == ["<step><code><![CDATA[echo '</step>' ]]></code></step>"]
+
+    text = "<step><![CDATA[a]]>b<![CDATA[</step>]]></step><step>c</step>"
+    chunks = [text[i:i + 4] for i in range(0, len(text), 4)]
+    assert feed_all(chatbot.XmlBlockParser(("step",)), chunks) == ["<step><![CDATA[a]]>b<![CDATA[</step>]]></step>", "<step>c</step>"]
+    print("CDATA测试通过")
+
+
+class FakeStream:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for text in self.texts:
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def test_early_stop_saves_reply():
+    """调用方收到第一个块后停止迭代，已收到的回复仍保存到对话历史，且不写入缓存"""
+    endpoint = llm_dispatcher.Endpoint("fake", "http://fake", "key", "fake-model")
+    saved = []
+
+    async def create(**kwargs):
+        return FakeStream(["<step>1</step>", "<step>2</step>", "<step>3</step>"])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def aacquire(*args):
+        return endpoint
+
+    async def main():
+        stream = chatbot.achat_stream("prompt", "session")
+        async for block in stream:
+            assert block == "<step>1</step>"
+            break
+        await stream.aclose()
+
+    with mock.patch.object(chatbot, "_prepare_chat", return_value=([], "cache-key", None)), \
+            mock.patch.object(chatbot, "_finish_chat", lambda *args: saved.append(args)), \
+            mock.patch.object(chatbot, "get_async_client", return_value=client), \
+            mock.patch.object(llm_dispatcher, "get_endpoints", return_value=[endpoint]), \
+            mock.patch.object(llm_dispatcher, "aacquire", aacquire), \
+            mock.patch.object(llm_dispatcher, "release") as release:
+        asyncio.run(main())
+    assert len(saved) == 1
+    ai_response, _, session_id, _, _, cache_key, _ = saved[0]
+    assert ai_response.startswith("<step>1</step>") and session_id == "session" and cache_key is None
+    release.assert_called_once_with(endpoint)
+    print("提前停止迭代测试通过")
+
+
+if __name__ == '__main__':
+    test_split_tags()
+    test_cdata()
+    test_early_stop_saves_reply()
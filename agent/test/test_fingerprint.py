@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试请求规范化指纹，等价请求得到相同指纹
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from utils import fingerprint
+
+
+def test_equivalent_requests():
+    """参数顺序、请求头大小写、cookie顺序和json键顺序不影响指纹"""
+    a = {
+        "url": "HTTP://Example.com:80/search?b=2&a=1#top",
+        "method": "get",
+        "header": {"Cookie": "session=abc; theme=dark", "User-Agent": "A"},
+        "params": {"x-param": [{"x-name": "c", "x-value": "3"}]}
+    }
+    b = {
+        "method": "GET",
+        "url": "http://example.com/search?a=1&b=2",
+        "header": {"cookie": "theme=dark; session=abc"},
+        "params": {"c": "3"}
+    }
+    assert fingerprint.request_fingerprint(a, scope="t") == fingerprint.request_fingerprint(b, scope="t")
+
+    json_a = {"url": "http://example.com/api", "method": "POST", "header": {"Content-Type": "application/json"},
+              "raw": '{"user": "admin", "id": 1}'}
+    json_b = dict(json_a, raw='{"id":1,"user":"admin"}')
+    assert fingerprint.request_fingerprint(json_a, scope="t") == fingerprint.request_fingerprint(json_b, scope="t")
+
+    # 页面记录的params中混有URL中的查询参数
+    form_a = {"url": "http://example.com/login?next=/", "method": "POST", "params": {"user": "a", "pass": "b"}}
+    form_b = {"url": "http://example.com/login?next=/", "method": "POST", "params": {"pass": "b", "next": "/", "user": "a"}}
+    assert fingerprint.request_fingerprint(form_a, scope="t") == fingerprint.request_fingerprint(form_b, scope="t")
+    print("等价请求测试通过")
+
+
+def test_different_requests():
+    """方法、路径、参数值、cookie、认证头不同或作用范围不同的请求指纹不同"""
+    base = {"url": "http://example.com/file?name=a.txt", "method": "GET", "header": {"Cookie": "session=1"}}
+    variants = [
+        dict(base, method="POST"),
+        dict(base, url="http://example.com/file/?name=a.txt"),
+        dict(base, url="http://example.com/static/../file?name=a.txt"),
+        dict(base, url="http://example.com/file?name=b.txt"),
+        dict(base, url="https://example.com/file?name=a.txt"),
+        dict(base, header={"Cookie": "admin=1"}),
+        dict(base, header={"Cookie": "session=2"}),
+        dict(base, header={"Cookie": "session=1; role=admin"}),
+        dict(base, header={"Cookie": "session=1", "Authorization": "Bearer forged"}),
+    ]
+    fingerprints = {fingerprint.request_fingerprint(r, scope="t") for r in [base] + variants}
+    assert len(fingerprints) == len(variants) + 1
+    assert fingerprint.request_fingerprint(base, scope="t1") != fingerprint.request_fingerprint(base, scope="t2")
+
+    # 严格模式（响应缓存）区分cookie值，不合并编码不同的查询参数
+    strict_a = fingerprint.fingerprint("GET", "http://example.com/?q=%2F", {"Cookie": "s=1"}, strict=True, scope="t")
+    strict_b = fingerprint.fingerprint("GET", "http://example.com/?q=%2F", {"Cookie": "s=2"}, strict=True, scope="t")
+    strict_c = fingerprint.fingerprint("GET", "http://example.com/?q=/", {"Cookie": "s=1"}, strict=True, scope="t")
+    assert len({strict_a, strict_b, strict_c}) == 3
+    print("不同请求测试通过")
+
+
+def test_page_fingerprint():
+    """不同路径返回相同内容的页面视为同一页面"""
+    a = {"url": "http://example.com/a", "method": "GET", "params": {}}
+    b = {"url": "http://example.com/b", "method": "GET", "params": {}}
+    assert fingerprint.page_fingerprint(a, "not found", scope="t") == fingerprint.page_fingerprint(b, "not found", scope="t")
+    assert fingerprint.page_fingerprint(a, "page a", scope="t") != fingerprint.page_fingerprint(b, "page b", scope="t")
+    print("页面指纹测试通过")
+
+
+if __name__ == '__main__':
+    test_equivalent_requests()
+    test_different_requests()
+    test_page_fingerprint()
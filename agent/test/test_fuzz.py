@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+测试fuzz工具通过批量请求引擎发送的请求，使用本地HTTP服务，不依赖真实目标
+"""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from addons import fuzz
+
+received = []
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        received.append(("GET", self.path, self.headers.get("Content-Type"), b""))
+        self._reply(b"ok")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        received.append(("POST", self.path, self.headers.get("Content-Type"), body))
+        self._reply(b"ok")
+
+
+def test_fuzz_post_form():
+    """POST参数按表单提交，请求头中已有Content-Type时不覆盖"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        received.clear()
+        results = fuzz.run({"url": base + "/login", "method": "POST", "payload": "a,b",
+                            "param": {"user": "admin", "pass": "{fuzz}"}})
+        assert len(results) == 2 and all(r["页面响应"] == 200 for r in results)
+        assert sorted(r[3] for r in received) == [b"user=admin&pass=a", b"user=admin&pass=b"]
+        assert all(r[2] == "application/x-www-form-urlencoded" for r in received)
+
+        received.clear()
+        fuzz.run({"url": base + "/api", "method": "POST", "payload": "1", "header": {"content-type": "text/xml"},
+                  "param": {"id": "{fuzz}"}})
+        assert received[0][2] == "text/xml"
+
+        received.clear()
+        fuzz.run({"url": base + "/item?id={fuzz}", "method": "GET", "payload": "1-3"})
+        assert sorted(r[1] for r in received) == ["/item?id=1", "/item?id=2", "/item?id=3"]
+        assert all(r[2] is None for r in received)
+    finally:
+        server.shutdown()
+    print("fuzz表单请求测试通过")
+
+
+if __name__ == '__main__':
+    test_fuzz_post_form()
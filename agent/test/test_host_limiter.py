@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+测试按主机自适应的并发上限（AIMD）
+"""
+
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from utils import host_limiter
+
+
+def release(limiter, status=None, error=None, retry_after=None, latency=0.01):
+    limiter.acquire("t")
+    limiter.release("t", latency, status, error, retry_after)
+
+
+def test_increase_decrease():
+    """正常响应时上限缓慢增长，过载时减半且同一窗口只减一次，普通500不降低上限"""
+    limiter = host_limiter.HostLimiter()
+    initial = config.HOST_LIMIT_INITIAL
+    for _ in range(initial * 4):
+        release(limiter, 200)
+    grown = limiter.get_stats()["t"]["limit"]
+    assert grown > initial
+
+    for _ in range(5):
+        release(limiter, 500)
+    assert limiter.get_stats()["t"]["limit"] == grown
+
+    release(limiter, 503)
+    release(limiter, error=TimeoutError())
+    stats = limiter.get_stats()["t"]
+    assert stats["limit"] == int(grown * config.HOST_LIMIT_DECREASE)
+    assert stats["overloads"] == 2 and stats["in_flight"] == 0
+
+    with mock.patch.object(config, "HOST_LIMIT_OVERLOAD_STATUS", [500]):
+        limiter.hosts["t"].last_decrease = 0
+        release(limiter, 500)
+    assert limiter.get_stats()["t"]["limit"] < stats["limit"]
+    print("并发上限调整测试通过")
+
+
+def test_limit_blocks():
+    """达到上限的请求等待名额释放"""
+    limiter = host_limiter.HostLimiter()
+    limiter.hosts["t"] = host_limiter._HostState()
+    limiter.hosts["t"].limit = 1
+    limiter.acquire("t")
+    acquired = threading.Event()
+    threading.Thread(target=lambda: (limiter.acquire("t"), acquired.set()), daemon=True).start()
+    assert not acquired.wait(0.2)
+    limiter.release("t", 0.01, 200)
+    assert acquired.wait(2)
+    assert limiter.get_stats()["t"]["waits"] == 1
+    print("并发等待测试通过")
+
+
+def test_retry_after():
+    """过载响应带有Retry-After时暂停发送新请求，等待时间有上限"""
+    assert host_limiter.parse_retry_after("3") == 3
+    assert 8 <= host_limiter.parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert host_limiter.parse_retry_after("soon") is None
+
+    limiter = host_limiter.HostLimiter()
+    release(limiter, 429, retry_after="1")
+    assert limiter.get_stats()["t"]["blocked_for"] > 0
+    started = time.time()
+    limiter.acquire("t")
+    assert time.time() - started >= 0.8
+    limiter.release("t", 0.01, 200)
+
+    # 非过载状态码的Retry-After不生效
+    release(limiter, 200, retry_after="30")
+    assert limiter.get_stats()["t"]["blocked_for"] == 0
+    with mock.patch.object(config, "HOST_LIMIT_MAX_RETRY_AFTER", 0.5):
+        release(limiter, 503, retry_after="3600")
+    assert limiter.get_stats()["t"]["blocked_for"] <= 0.5
+    print("Retry-After测试通过")
+
+
+if __name__ == '__main__':
+    test_increase_decrease()
+    test_limit_blocks()
+    test_retry_after()
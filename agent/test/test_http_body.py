@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+测试响应体解压和二进制内容判断
+"""
+
+import gzip
+import os
+import sys
+import zlib
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from utils import http_body
+
+text = b"<html><body>" + b"hello world " * 1000 + b"</body></html>"
+
+
+def test_decode_body():
+    """gzip、带头和不带头的deflate都能解压，超过上限时截断，无法解压时返回原始数据"""
+    assert http_body.decode_body(gzip.compress(text), "gzip") == (text, False)
+    assert http_body.decode_body(zlib.compress(text), "deflate") == (text, False)
+    raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    assert http_body.decode_body(raw.compress(text) + raw.flush(), "Deflate") == (text, False)
+    assert http_body.decode_body(text, "") == (text, False)
+    assert http_body.decode_body(text, "identity", max_size=100) == (text[:100], True)
+
+    # 压缩炸弹只解压到上限
+    bomb = gzip.compress(b"\x00" * 50 * 1024 * 1024)
+    body, truncated = http_body.decode_body(bomb, "gzip", max_size=1024 * 1024)
+    assert truncated and len(body) == 1024 * 1024
+    assert http_body.decode_body(b"not gzip", "gzip") == (b"not gzip", False)
+    print("响应体解压测试通过")
+
+
+def test_is_binary():
+    """按类型和文件头判断二进制内容，以BM、MZ开头的文本不误判"""
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+    assert http_body.is_binary(png)
+    assert http_body.is_binary(b"anything", "image/png")
+    assert not http_body.is_binary(png, "text/plain")
+    assert not http_body.is_binary(text, "")
+
+    bmp = b"BM" + (70).to_bytes(4, "little") + b"\x00" * 4 + (54).to_bytes(4, "little") + (40).to_bytes(4, "little") + b"\x01" * 52
+    assert http_body.is_binary(bmp)
+    pe = bytearray(b"MZ" + b"\x90" * 126)
+    pe[60:64] = (64).to_bytes(4, "little")
+    pe[64:68] = b"PE\x00\x00"
+    assert http_body.is_binary(bytes(pe))
+
+    # 类型不明确时检查内容，UTF-8文本按文本处理
+    assert not http_body.is_binary(b"flag{plain_text_download}\n", "application/octet-stream")
+    assert not http_body.is_binary("root:x:0:0:根用户:/root:/bin/bash\n".encode(), "application/octet-stream")
+    assert not http_body.is_binary(b'{"data": []}', "application/vnd.api+json; charset=utf-8")
+    assert not http_body.is_binary(b'<feed/>', "application/atom+xml")
+    assert not http_body.is_binary("中文".encode()[:-1], "application/octet-stream")
+    assert http_body.is_binary(png, "application/octet-stream")
+    assert http_body.is_binary(b"\xff\xfe\x00\x01data", "application/octet-stream")
+    assert http_body.is_binary(b"\xc3\x28 invalid utf-8", "application/vnd.ms-excel")
+
+    assert not http_body.is_binary(b"BMW owners club: welcome to the forum, " * 5)
+    assert not http_body.is_binary(b"MZ-series manual, chapter one. " * 10)
+    print("二进制判断测试通过")
+
+
+if __name__ == '__main__':
+    test_decode_body()
+    test_is_binary()
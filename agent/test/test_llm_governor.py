@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+测试LLM并发准入：名额用完时按阶段轮转准入，密钥退避等待时不占用名额
+使用模拟的模型调用，不访问服务商
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from utils import chatbot, llm_dispatcher
+
+endpoint = llm_dispatcher.Endpoint("fake", "http://fake", "key", "fake-model")
+reply = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=None)
+
+
+def test_stage_fairness():
+    """名额用完时各阶段轮流准入，排队多的阶段不会挤占其他阶段"""
+    admitted = []
+    lock = threading.Lock()
+
+    def worker(name, stage):
+        with chatbot.llm_slot(stage):
+            with lock:
+                admitted.append(name)
+
+    def queued():
+        with chatbot._governor_lock:
+            return sum(len(queue) for queue in chatbot._governor_queues.values())
+
+    with mock.patch.object(config, "LLM_MAX_IN_FLIGHT", 1):
+        threads = []
+        with chatbot.llm_slot("holder"):
+            # 探索阶段先排入3个请求，保存阶段后排入1个
+            for name, stage in (("e1", "explore"), ("e2", "explore"), ("e3", "explore"), ("s1", "save_page")):
+                thread = threading.Thread(target=worker, args=(name, stage))
+                thread.start()
+                threads.append(thread)
+                deadline = time.time() + 2
+                while queued() < len(threads) and time.time() < deadline:
+                    time.sleep(0.01)
+            assert queued() == 4
+        for thread in threads:
+            thread.join(5)
+    assert admitted == ["e1", "s1", "e2", "e3"], admitted
+    assert chatbot._governor_in_flight == 0 and not chatbot._governor_queues
+    print("阶段公平准入测试通过")
+
+
+def test_backoff_outside_slot():
+    """一个阶段的密钥都在退避时，其他阶段的请求不被阻塞"""
+    finished = {}
+
+    def acquire(type, stage, attempt):
+        if stage == "backoff":
+            # 模拟所有密钥都在退避期
+            time.sleep(1)
+        return endpoint
+
+    def worker(stage):
+        chatbot._complete("prompt", [], stage=stage)
+        finished[stage] = time.time()
+
+    with mock.patch.object(config, "LLM_MAX_IN_FLIGHT", 1), \
+            mock.patch.object(llm_dispatcher, "acquire", acquire), \
+            mock.patch.object(llm_dispatcher, "release"), \
+            mock.patch.object(chatbot, "_create", return_value=(reply, endpoint)):
+        started = time.time()
+        slow = threading.Thread(target=worker, args=("backoff",))
+        slow.start()
+        time.sleep(0.1)
+        worker("fast")
+        slow.join(5)
+    assert finished["fast"] - started < 0.5
+    assert finished["backoff"] >= finished["fast"]
+    print("退避等待不占用名额测试通过")
+
+
+if __name__ == '__main__':
+    test_stage_fairness()
+    test_backoff_outside_slot()
@@ -10,6 +10,7 @@ from typing import List
 import tqdm
 
 from config.config import DB_PATH
+from utils import blob_store
 
 def get_connection() -> sqlite3.Connection:
     conn = sqlite3.connect(DB_PATH)
@@ -43,7 +44,8 @@ def pair_messages(rows: List[sqlite3.Row]) -> List[dict]:
     pending_user = None
     for m in rows:
         role = (m["role"] or "").strip()
-        content = m["content"] or ""
+        # 较长的消息在消息表中保存为内容存储的引用，导出时还原为原文
+        content = blob_store.resolve(m["content"] or "")
         if role == "user":
             pending_user = content
         elif role == "assistant":
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试响应精简：保留表单、链接、脚本和flag，移除样式等模板内容
+"""
+
+import os
+import sys
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from addons.request import minimize_response
+
+PAGE = """<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width">
+    <link rel="stylesheet" href="/static/app.css" integrity="sha384-abc" crossorigin="anonymous">
+    <style>
+      body { margin: 0; }
+    </style>
+    <script src="/static/app.js"></script>
+  </head>
+  <body style="background: #fff">
+    <!-- TODO: remove /admin/debug before release -->
+    <svg viewBox="0 0 10 10"><path d="M0 0L10 10"/></svg>
+    <img src="data:image/png;base64,%s">
+    <a href="/profile?id=1" aria-label="profile">Profile</a>
+    <form action="/login" method="post">
+      <input type="text" name="username">
+      <input type="hidden" name="csrf" value="t0ken">
+    </form>
+    <script>
+      var api = "/api/v1/users";
+    </script>
+    <pre>
+  uid=33(www-data)   gid=33(www-data)
+    </pre>
+    <table>
+%s
+    </table>
+  </body>
+</html>""" % ("A" * 200, "\n".join(f"      <tr><td>{i}</td><td>user{i}</td></tr>" for i in range(10)))
+
+
+def test_minimize_response():
+    """保留表单、链接、注释、脚本和pre中的原始内容，移除svg、样式、data URI和资源引用"""
+    with mock.patch.object(config, "MINIMIZE_ENABLE", True), mock.patch.object(config, "MINIMIZE_MAX_SIMILAR_ROWS", 3):
+        result = minimize_response(PAGE)
+
+    for kept in ['<a href="/profile?id=1">Profile</a>', '<form action="/login" method="post">',
+                 '<input type="hidden" name="csrf" value="t0ken">', '<script src="/static/app.js"></script>',
+                 'var api = "/api/v1/users";', '<!-- TODO: remove /admin/debug before release -->',
+                 '<pre>\n  uid=33(www-data)   gid=33(www-data)\n    </pre>', 'data:image/png;base64,...']:
+        assert kept in result, kept
+    for removed in ['<svg', '<style', 'style=', 'stylesheet', 'viewport', 'charset', 'aria-label', 'integrity', "A" * 64]:
+        assert removed not in result, removed
+    assert "\n  " not in result.split("<pre>")[0]
+    assert len(result) < len(PAGE)
+    print("响应精简测试通过")
+
+
+def test_dedupe_rows():
+    """合并只有数字不同的连续表格行，包含flag的行始终保留"""
+    with mock.patch.object(config, "MINIMIZE_ENABLE", True), mock.patch.object(config, "MINIMIZE_MAX_SIMILAR_ROWS", 3):
+        result = minimize_response(PAGE)
+        assert "<tr><td>0</td><td>user0</td></tr>" in result and "<tr><td>1</td><td>user1</td></tr>" in result
+        assert "<tr><td>9</td><td>user9</td></tr>" in result and "user5" not in result
+        assert "省略7行相似的表格行" in result
+
+        # 只有数字不同的候选flag列表不能被合并
+        rows = "".join(f"<tr><td>{i}</td><td>flag{{{1000 + i}}}</td></tr>" for i in range(10))
+        result = minimize_response(f"<table>{rows}</table>")
+        assert all(f"flag{{{1000 + i}}}" in result for i in range(10))
+
+    with mock.patch.object(config, "MINIMIZE_ENABLE", False):
+        assert minimize_response(PAGE) == PAGE
+    print("表格行合并测试通过")
+
+
+if __name__ == '__main__':
+    test_minimize_response()
+    test_dedupe_rows()
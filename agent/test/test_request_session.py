@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试request工具的会话：按任务、身份和主机保存cookie和认证头
+"""
+
+import os
+import sys
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from addons import request
+
+
+def test_apply_session():
+    """会话中的cookie和认证头加入请求，请求中显式设置的值优先并保存到会话"""
+    with mock.patch.object(config, "TASK_ID", "session-test"):
+        url = "http://example.com:8080/a"
+        headers = {"Cookie": "session=abc; theme=dark", "Authorization": "Bearer one"}
+        request._apply_session("default", url, headers)
+        assert request.get_session("default", url) == {
+            "cookies": {"session": "abc", "theme": "dark"}, "auth": {"Authorization": "Bearer one"}}
+
+        # cookie不区分端口
+        headers = {}
+        request._apply_session("default", "http://example.com/b", headers)
+        assert headers == {"Cookie": "session=abc; theme=dark", "Authorization": "Bearer one"}
+
+        # 显式设置的值覆盖会话中的值，大小写不同的认证头不重复添加
+        headers = {"cookie": "theme=light", "authorization": "Bearer two"}
+        request._apply_session("default", url, headers)
+        assert headers["Cookie"] == "session=abc; theme=light"
+        assert headers["authorization"] == "Bearer two" and "Authorization" not in headers
+
+        # 不同身份和不同主机互不影响
+        headers = {}
+        request._apply_session("userB", url, headers)
+        request._apply_session("default", "http://other.com/", headers)
+        assert headers == {}
+        request.clear_sessions()
+        assert request.get_session("default") == {}
+    print("会话请求头测试通过")
+
+
+def test_capture_session():
+    """保存响应设置的cookie，Max-Age=0或值为空时删除"""
+    with mock.patch.object(config, "TASK_ID", "session-test"):
+        url = "http://example.com/login"
+        request._capture_session("default", url, ["session=abc; Path=/; HttpOnly", "theme=dark", "invalid"])
+        assert request.get_session("default", url)["cookies"] == {"session": "abc", "theme": "dark"}
+        request._capture_session("default", url, ["session=def; Path=/", "theme=dark; Max-Age = 0"])
+        assert request.get_session("default", url)["cookies"] == {"session": "def"}
+        request._capture_session("default", url, ["session=; Expires=Thu, 01 Jan 1970 00:00:00 GMT"])
+        assert request.get_session("default", url)["cookies"] == {}
+
+        # 其他任务看不到本任务的会话，清除只影响指定任务
+        request._capture_session("default", url, ["session=abc"])
+        with mock.patch.object(config, "TASK_ID", "other-task"):
+            assert request.get_session("default") == {}
+        request.clear_sessions("other-task")
+        assert request.get_session("default", url)["cookies"] == {"session": "abc"}
+        request.clear_sessions("session-test")
+        assert "session-test" not in request._sessions
+    print("会话cookie测试通过")
+
+
+if __name__ == '__main__':
+    test_apply_session()
+    test_capture_session()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+测试请求工具的响应缓存，使用本地HTTP服务统计实际到达服务端的请求
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from addons import request
+from utils import response_cache
+
+hits = Counter()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self):
+        path = self.path.split("?")[0]
+        hits[path] += 1
+        body = f"{path} {hits[path]}".encode()
+        self.send_response(503 if path == "/busy" else 200)
+        if path == "/nostore":
+            self.send_header("Cache-Control", "no-store")
+        if path == "/login":
+            self.send_header("Set-Cookie", "session=abc")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply()
+
+
+def test_response_cache():
+    """重复的GET请求命中缓存，no-store、Set-Cookie、503响应和POST请求不缓存，写请求使缓存失效"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    config.TASK_ID = "response-cache-test"
+
+    def send(path, **params):
+        return request.run(dict({"url": base + path, "history": False}, **params))["content"]
+
+    try:
+        with mock.patch.object(config, "RESPONSE_CACHE_ENABLE", True), \
+                mock.patch.dict(os.environ, {"no_proxy": "*"}, clear=False):
+            assert send("/page") == send("/page") == "/page 1"
+            # 请求方主动跳过缓存
+            assert send("/page", no_cache=True) == "/page 2"
+            # cookie不同的请求不共用响应
+            assert send("/page", header={"Cookie": "session=other"}) == "/page 3"
+
+            for path in ("/nostore", "/login", "/busy"):
+                send(path)
+                send(path)
+                assert hits[path] == 2, path
+            send("/page", method="POST", param={"a": "1"})
+            send("/page", method="POST", param={"a": "1"})
+            assert hits["/page"] == 5
+
+            stats = response_cache.get_stats()
+            assert stats["stages"]["default"]["hit"] == 1
+            response_cache.clear()
+            assert response_cache.get_stats()["entries"] == 0
+            assert send("/page") == "/page 6"
+            print("缓存绕过测试通过")
+
+            # 写请求之后再读取，不能返回写之前缓存的响应
+            assert send("/profile") == send("/profile") == "/profile 1"
+            send("/profile", method="POST", param={"name": "admin"})
+            assert send("/profile") == "/profile 3"
+            # 同一主机上其他路径的缓存也失效
+            assert send("/page") == "/page 7"
+    finally:
+        response_cache.clear()
+        config.TASK_ID = None
+        server.shutdown()
+    print("响应缓存测试通过")
+
+
+if __name__ == '__main__':
+    test_response_cache()
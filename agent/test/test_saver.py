@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+测试页面批量分析：多个页面合并为一次对话，缺少结果的页面单独分析且失败只影响该页面
+使用模拟的对话结果，不调用模型
+"""
+
+import os
+import re
+import sys
+import threading
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from agents import saver
+
+pages = [{"request": {"url": f"http://example.com/p{i}"}, "response": {"content": f"page {i}"}} for i in range(1, 4)]
+
+
+class FakeChat:
+    """批量对话不返回page 2的结果，page 2单独分析时出错"""
+
+    def __init__(self):
+        self.messages = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def add_message(self, message, session_id=""):
+        with self.lock:
+            session_id = session_id or f"s{len(self.messages)}"
+            self.messages.setdefault(session_id, []).append(message)
+        return session_id
+
+    def chat(self, prompt, session_id, **kwargs):
+        with self.lock:
+            self.calls.append(session_id)
+        batch = [(int(re.search(r"第(\d+)个页面", m).group(1)), re.search(r"page (\d+)", m).group(1))
+                 for m in self.messages[session_id] if "个页面" in m]
+        if batch:
+            return "".join(f"<result><index>{i}</index><name>页面{page}</name></result>" for i, page in batch if page != "2")
+        if "page 2" in self.messages[session_id][0]:
+            raise RuntimeError("model error")
+        return "<result><name>单独分析</name></result>"
+
+
+def test_save_pages():
+    """缺少结果的页面单独分析失败时为None，其他页面结果不受影响"""
+    fake = FakeChat()
+    with mock.patch.object(saver, "chat", fake.chat), mock.patch.object(saver, "add_message", fake.add_message), \
+            mock.patch.object(config, "SAVE_BATCH_ENABLE", True):
+        results = saver.save_pages(pages)
+    assert [r and r["name"] for r in results] == ["页面1", None, "页面3"]
+    # 一次批量对话加一次单独分析
+    assert len(fake.calls) == 2
+    print("批量保存页面测试通过")
+
+
+def test_save_pages_single():
+    """关闭批量分析时每个页面单独对话，失败的页面为None"""
+    fake = FakeChat()
+    with mock.patch.object(saver, "chat", fake.chat), mock.patch.object(saver, "add_message", fake.add_message), \
+            mock.patch.object(config, "SAVE_BATCH_ENABLE", False):
+        results = saver.save_pages(pages)
+    assert [r and r["name"] for r in results] == ["单独分析", None, "单独分析"]
+    assert len(fake.calls) == 3
+    assert not any("个页面" in "".join(messages) for messages in fake.messages.values())
+    print("逐个保存页面测试通过")
+
+
+def test_save_page_merge():
+    """多个线程同时保存页面时合并为一次对话，每个线程拿到自己的结果"""
+    fake = FakeChat()
+    results = {}
+
+    def worker(index):
+        try:
+            results[index] = saver.save_page(pages[index])["name"]
+        except Exception as e:
+            results[index] = e
+
+    with mock.patch.object(saver, "chat", fake.chat), mock.patch.object(saver, "add_message", fake.add_message), \
+            mock.patch.object(config, "SAVE_BATCH_ENABLE", True), mock.patch.object(config, "SAVE_BATCH_SIZE", 3), \
+            mock.patch.object(config, "SAVE_BATCH_WINDOW", 5):
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+    assert results[0] == "页面1" and results[2] == "页面3"
+    assert isinstance(results[1], RuntimeError)
+    assert len(fake.calls) == 2
+    print("合并分析测试通过")
+
+
+if __name__ == '__main__':
+    test_save_pages()
+    test_save_pages_single()
+    test_save_page_merge()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+测试漏洞检测思路的超时从线程开始执行时计算
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from agents.scanner import run_in_worker
+
+
+def test_queue_time_not_counted():
+    """排队等待线程的时间不计入超时，开始执行后超时仍然生效"""
+    async def main():
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            blocker = run_in_worker(executor, 1, time.sleep, 0.5)
+            queued = run_in_worker(executor, 0.3, lambda: "done")
+            slow = run_in_worker(executor, 0.2, time.sleep, 1)
+            results = await asyncio.gather(blocker, queued, slow, return_exceptions=True)
+        finally:
+            executor.shutdown(wait=False)
+        assert results[0] is None and results[1] == "done"
+        assert isinstance(results[2], asyncio.TimeoutError)
+
+    asyncio.run(main())
+    print("检测思路超时测试通过")
+
+
+if __name__ == '__main__':
+    test_queue_time_not_counted()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试页面近似去重，只有令牌、时间戳不同的页面作为已有页面的变体
+"""
+
+import os
+import random
+import sys
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from utils import simhash
+
+layout = """<html><head><title>{title}</title><script>var renderedAt = {ts};</script></head><body>
+<nav><ul><li><a href="/">Home</a></li><li><a href="/profile">Profile</a></li><li><a href="/logout">Logout</a></li></ul></nav>
+<div class="container"><h1>{title}</h1>{body}
+<form method="post"><input type="hidden" name="csrf" value="{csrf}"><input name="q"><button>Search</button></form>
+</div><footer>Copyright Example Corp. Rendered at {ts}, session {session}</footer></body></html>"""
+orders = "<table>" + "".join(f"<tr><td>Order {i}</td><td>Widget model {i}</td><td>{i * 3}.00</td></tr>" for i in range(10)) + "</table>"
+
+
+def render(title, body):
+    return layout.format(title=title, body=body, csrf="%032x" % random.getrandbits(128),
+                         ts=random.randint(10 ** 9, 2 * 10 ** 9), session="%040x" % random.getrandbits(160))
+
+
+def make_page(url, content, status=200):
+    return {"method": "GET", "url": url, "params": {}}, {"status": status, "content": content}
+
+
+def test_simhash_distance():
+    """令牌和时间戳不同的页面SimHash相同，内容不同的页面距离较大"""
+    a = simhash.simhash(simhash.extract_features(render("Orders", orders)))
+    b = simhash.simhash(simhash.extract_features(render("Orders", orders)))
+    c = simhash.simhash(simhash.extract_features(render("Search", "<p>No results were found, try another keyword.</p>")))
+    assert simhash.hamming(a, b) == 0
+    assert simhash.hamming(a, c) > config.PAGE_SIMHASH_THRESHOLD
+    print("SimHash距离测试通过")
+
+
+def test_page_index():
+    """同一请求的近似页面记录为变体，不同参数、短响应和包含flag的页面不合并"""
+    with mock.patch.object(config, "TASK_ID", "simhash-test"), mock.patch.object(config, "PAGE_SIMHASH_ENABLE", True):
+        index = simhash.PageIndex()
+        assert index.add("p1", *make_page("http://example.com/orders", render("Orders", orders))) is None
+        assert index.add("p2", *make_page("http://example.com/orders", render("Orders", orders))) == "p1"
+        # 易变的查询参数（时间戳）不影响分桶
+        assert index.add("p3", *make_page("http://example.com/orders?_=1718000000123", render("Orders", orders))) == "p1"
+        # 参数值不同的请求不合并
+        assert index.add("p4", *make_page("http://example.com/orders?id=2", render("Orders", orders))) is None
+        assert index.add("p5", *make_page("http://example.com/orders", render("Orders", orders), status=500)) is None
+        # 包含flag的页面和短响应始终作为新页面
+        assert index.add("p6", *make_page("http://example.com/orders", render("Orders", orders + "flag{abc}"))) is None
+        assert index.add("p7", *make_page("http://example.com/api", '{"ok": true}')) is None
+        assert index.add("p8", *make_page("http://example.com/api", '{"ok": true}')) is None
+        index.count_duplicate()
+
+        stats = index.get_stats()
+        assert stats == {"pages": 9, "duplicates": 1, "variants": 2, "dedup_ratio": round(3 / 9, 4)}
+        index.clear()
+        assert index.get_stats()["pages"] == 0 and not index.buckets
+    print("页面索引测试通过")
+
+
+if __name__ == '__main__':
+    test_simhash_distance()
+    test_page_index()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试LLM录制/回放替身服务，不依赖真实服务商
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+import openai
+
+from utils import llm_standin
+
+messages = [
+    {"role": "system", "content": "你是一个网络安全专家"},
+    {"role": "user", "content": "访问提供的初始url"}
+]
+reply = "<step><tool>request</tool><value><url>http://127.0.0.1/</url></value></step>"
+usage = {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+
+
+def test_record_replay():
+    """录制一次回复后回放，并验证注入延迟和流式输出"""
+    fixture_dir = tempfile.mkdtemp()
+
+    # 上游服务：预先写入夹具的回放服务，模拟真实服务商
+    upstream_path = os.path.join(fixture_dir, "upstream.db")
+    store = llm_standin.FixtureStore(upstream_path)
+    store.put(llm_standin.FixtureStore.make_key({"model": "deepseek-chat", "messages": messages}), "deepseek-chat", reply, usage, 0.2)
+    upstream = llm_standin.start("replay", upstream_path)
+
+    # 录制
+    record_path = os.path.join(fixture_dir, "record.db")
+    recorder = llm_standin.start("record", record_path, upstream_url=upstream.url, upstream_key="sk-test")
+    client = openai.OpenAI(base_url=recorder.url, api_key="sk-test", max_retries=0)
+    response = client.chat.completions.create(model="deepseek-chat", messages=messages)
+    assert response.choices[0].message.content == reply
+    assert recorder.stats["recorded"] == 1
+    recorder.shutdown()
+
+    # 回放，按录制耗时注入延迟
+    replayer = llm_standin.start("replay", record_path, latency=0.1)
+    client = openai.OpenAI(base_url=replayer.url, api_key="sk-test", max_retries=0)
+    started = time.time()
+    response = client.chat.completions.create(model="deepseek-chat", messages=messages)
+    assert response.choices[0].message.content == reply
+    assert response.usage.total_tokens == 30
+    assert time.time() - started >= 0.1
+
+    stream = client.chat.completions.create(model="deepseek-chat", messages=messages, stream=True)
+    assert "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices) == reply
+
+    # 未录制的请求返回404
+    try:
+        client.chat.completions.create(model="deepseek-chat", messages=messages[:1])
+        assert False, "未录制的请求应该失败"
+    except openai.NotFoundError:
+        pass
+    assert replayer.stats == {"requests": 3, "hits": 2, "misses": 1, "recorded": 0}
+
+    replayer.shutdown()
+    upstream.shutdown()
+    print("录制/回放测试通过")
+
+
+if __name__ == '__main__':
+    test_record_replay()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试心跳和任务结束时上报的LLM统计
+"""
+
+import os
+import sys
+import types
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from utils import llm_cache, llm_stats
+from utils.agent_manager import AgentManager
+from utils.llm_dispatcher import Endpoint
+
+
+class FakeHunter:
+    def __init__(self, url, description):
+        pass
+
+    def hunt(self):
+        # FlagHunter会把TASK_ID换成自己的任务ID
+        config.TASK_ID = "hunter-task"
+        llm_stats.record("explore", Endpoint("default", "", "", "model"), latency=1.0)
+
+
+def test_final_llm_stats():
+    """任务结束时通过任务状态接口上报LLM统计，之后才清除TASK_ID"""
+    updates = []
+
+    def fake_put(url, json, timeout):
+        updates.append((url, json))
+        return mock.Mock(status_code=200, json=lambda: {"success": True})
+
+    hunter_module = types.SimpleNamespace(FlagHunter=FakeHunter)
+    with mock.patch.dict(sys.modules, {"flaghunter": hunter_module}), \
+            mock.patch("utils.agent_manager.requests.put", side_effect=fake_put), \
+            mock.patch.object(config, "TASK_ID", None), mock.patch.object(config, "FLAG", None):
+        AgentManager().process_task({"id": "server-task", "target": "http://127.0.0.1/"})
+        assert config.TASK_ID is None
+
+    stats = [data["llm_stats"] for url, data in updates if "llm_stats" in data]
+    assert len(stats) == 1 and updates[-1][0].endswith("/api/tasks/server-task")
+    assert [(item["task_id"], item["stage"], item["calls"]) for item in stats[0]] == [("hunter-task", "explore", 1)]
+    print("任务LLM统计上报测试通过")
+
+
+def test_heartbeat_llm_cache():
+    """心跳携带LLM响应缓存的命中统计"""
+    sent = []
+
+    def fake_post(url, json, timeout):
+        sent.append(json)
+        return mock.Mock(status_code=200, json=lambda: {"success": True})
+
+    manager = AgentManager()
+    manager.agent_id = "agent"
+    with mock.patch("utils.agent_manager.requests.post", side_effect=fake_post), \
+            mock.patch.dict(llm_cache._stats, {"hit": 3, "miss": 1}):
+        assert manager.send_heartbeat()
+    stats = sent[0]["metadata"]["llm_cache"]
+    assert stats["hit"] == 3 and stats["miss"] == 1 and stats["hit_rate"] == 0.75
+    print("心跳LLM缓存统计测试通过")
+
+
+if __name__ == '__main__':
+    test_final_llm_stats()
+    test_heartbeat_llm_cache()
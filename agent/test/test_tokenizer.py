@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试本地token估算和按模型上下文预算装入提示词
+"""
+
+import os
+import sys
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from config import config
+from utils import tokenizer
+
+
+def test_estimate_tokens():
+    """中文按字计算，英文单词、数字、标点按长度折算"""
+    assert tokenizer.estimate_tokens("") == 0
+    assert tokenizer.estimate_tokens("你好世界") == 4
+    assert tokenizer.estimate_tokens("password") == 2
+    assert tokenizer.estimate_tokens("123456") == 2
+    assert tokenizer.estimate_tokens("a = b") == 3
+    print("token估算测试通过")
+
+
+def test_truncate():
+    """截断后不超过上限，保留开头和结尾"""
+    text = "HEAD " + "filler words " * 500 + " TAIL"
+    result = tokenizer.truncate(text, 100)
+    assert tokenizer.estimate_tokens(result) <= 100
+    assert result.startswith("HEAD") and result.endswith("TAIL") and "已省略" in result
+    assert tokenizer.truncate("short", 100) == "short"
+    assert tokenizer.truncate(text, 0) == ""
+    print("截断测试通过")
+
+
+def test_pack_messages():
+    """装入预算：保留开头的上下文和最新消息，较早的消息截断或省略"""
+    context = {"role": "user", "content": "任务描述"}
+    middle = [{"role": "user" if i % 2 else "assistant", "content": f"message {i} " + "word " * 400} for i in range(40)]
+    last = {"role": "user", "content": "最新的消息"}
+    messages = [context] + middle + [last]
+
+    with mock.patch.dict(config.LLM_CONTEXT_TOKENS, {"test-model": 12000}), \
+            mock.patch.object(config, "LLM_REPLY_RESERVE_TOKENS", 2000):
+        budget = tokenizer.context_budget("test-model")
+        assert budget == 10000
+        packed = tokenizer.pack_messages("system prompt", messages, "test-model")
+        assert packed[0] == context and packed[-1] == last
+        assert tokenizer.estimate_messages_tokens(packed) + tokenizer.estimate_tokens("system prompt") <= budget
+        assert any("较早的" in m["content"] for m in packed)
+        # 最新的消息原样保留，较早的消息先被省略
+        assert packed[-2] == middle[-1]
+        assert "message 0 " not in "".join(m["content"] for m in packed)
+
+        # 预算足够时原样返回
+        short = [context, middle[0], last]
+        assert tokenizer.pack_messages("system prompt", short, "test-model") == short
+
+        # 单条消息上限不作用于最新的消息
+        limited = tokenizer.pack_messages("system prompt", short + [dict(middle[1])], "test-model", message_limit=50)
+        assert tokenizer.estimate_tokens(limited[2]["content"]) <= 50
+        assert limited[-1] == middle[1]
+    print("提示词装箱测试通过")
+
+
+if __name__ == '__main__':
+    test_estimate_tokens()
+    test_truncate()
+    test_pack_messages()
@@ -78,13 +78,29 @@ class AgentManager:
             return False
             
         try:
+            from utils.chatbot import get_pool_stats, get_governor_stats, get_hedge_stats
+            from utils import async_http, blob_store, host_limiter, http_pool, llm_cache, llm_dispatcher, llm_stats, response_cache, simhash
+            from addons.request import get_minimize_stats
             heartbeat_data = {
                 "status": config.AGENT_STATUS,
                 "metadata": {
                     "last_seen": datetime.now().isoformat(),
                     "current_task": self.current_task_id,
                     "uptime": str(datetime.now() - self.start_time),
-                    "explored_pages": len(getattr(config, 'EXPLORED_PAGES', []))
+                    "explored_pages": len(getattr(config, 'EXPLORED_PAGES', [])),
+                    "llm_pool": get_pool_stats(),
+                    "llm_keys": llm_dispatcher.get_stats(),
+                    "llm_governor": get_governor_stats(),
+                    "llm_stats": llm_stats.get_stats(config.TASK_ID or ""),
+                    "llm_cache": llm_cache.get_stats(),
+                    "llm_hedge": get_hedge_stats(),
+                    "response_minimize": get_minimize_stats(),
+                    "blob_store": blob_store.get_stats(),
+                    "http_pool": http_pool.get_stats(),
+                    "http_async": async_http.get_stats(),
+                    "http_limiter": host_limiter.limiter.get_stats(),
+                    "response_cache": response_cache.get_stats(),
+                    "page_dedup": simhash.page_index.get_stats()
                 }
             }
             
@@ -155,8 +171,11 @@ class AgentManager:
             logger.error(f"获取任务异常: {str(e)}")
             return []
 
-    def update_task_status(self, task_id, status=None, is_running=None, flag=None):
-        """更新任务状态"""
+    def update_task_status(self, task_id, status=None, is_running=None, flag=None, llm_stats=None):
+        """
+        更新任务状态
+        :param llm_stats: 任务的LLM调用统计，任务结束时上报
+        """
         try:
             update_data = {}
             
@@ -168,6 +187,9 @@ class AgentManager:
                 
             if flag is not None:
                 update_data["flag"] = flag
+
+            if llm_stats is not None:
+                update_data["llm_stats"] = llm_stats
             
             if not update_data:
                 return True
@@ -463,7 +485,23 @@ class AgentManager:
         except Exception as e:
             pass
         finally:
-            # 清理当前任务状态
+            # 清理当前任务状态，输出并释放本任务的响应缓存和页面索引
+            # FlagHunter会把config.TASK_ID换成自己的任务ID，任务内的缓存都以它为作用范围
+            from addons.request import clear_sessions
+            from agents.poc import clear_scanned_targets
+            from utils import blob_store, llm_stats, response_cache, simhash
+            scope = config.TASK_ID or task_id
+            # 心跳只携带进行中任务的统计，任务结束时单独上报最终的LLM调用统计
+            self.update_task_status(task_id, llm_stats=llm_stats.get_stats(scope))
+            response_cache.log_stats()
+            response_cache.clear(scope)
+            dedup_stats = simhash.page_index.get_stats(scope)
+            logger.info(f"页面去重：共 {dedup_stats['pages']} 个页面，重复 {dedup_stats['duplicates']} 个，"
+                        f"近似 {dedup_stats['variants']} 个，去重率 {dedup_stats['dedup_ratio'] * 100:.1f}%")
+            simhash.page_index.clear(scope)
+            clear_scanned_targets(scope)
+            clear_sessions(scope)
+            blob_store.collect(scope)
             self.current_task_id = None
             config.TASK_ID = None
             config.AGENT_STATUS = "idle"
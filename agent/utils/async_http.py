@@ -0,0 +1,233 @@
+import asyncio
+import http.client
+import re
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+from config import config
+from utils.http_pool import IDEMPOTENT_METHODS, PooledResponse
+
+# 与http.client一致，请求路径中不允许出现控制字符和空格
+_invalid_path = re.compile(r'[\x00-\x20\x7f]')
+
+_ssl_context = ssl.create_default_context()
+_ssl_context.check_hostname = False
+_ssl_context.verify_mode = ssl.CERT_NONE
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "reused": 0,
+    "created": 0,
+    "stale_retries": 0,
+    "timeouts": 0,
+    "cancelled": 0
+}
+
+
+def count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def get_stats():
+    """获取异步请求统计"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["hit_rate"] = round((stats["reused"] - stats["stale_retries"]) / stats["requests"], 4) if stats["requests"] else 0
+    return stats
+
+
+def encode_request(method, host, port, scheme, selector, headers, body):
+    """
+    按http.client的规则编码请求：补全Host、Accept-Encoding和Content-Length，请求头原样发送
+    :return: 请求报文（bytes）
+    """
+    if _invalid_path.search(selector):
+        raise http.client.InvalidURL(f"URL can't contain control characters. {selector!r}")
+    names = {name.lower() for name in headers}
+    lines = [f"{method} {selector} HTTP/1.1"]
+    if "host" not in names:
+        host_header = f"[{host}]" if ":" in host else host
+        if port != (443 if scheme == "https" else 80):
+            host_header += f":{port}"
+        lines.append(f"Host: {host_header}")
+    if "accept-encoding" not in names:
+        lines.append("Accept-Encoding: identity")
+    if "content-length" not in names and "transfer-encoding" not in names:
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        elif method.upper() in ("POST", "PUT", "PATCH"):
+            lines.append("Content-Length: 0")
+    for name, value in headers.items():
+        lines.append(f"{name}: {value}")
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return head + (body or b"")
+
+
+async def read_response(reader, method, max_body):
+    """
+    读取一个完整的响应，支持Content-Length、chunked和读到连接关闭三种响应体
+    响应体超过max_body字节时只读取前max_body字节，并要求关闭连接
+    :return: (状态码, 原因, 响应头, 响应体, 是否需要关闭连接, 是否被截断)
+    """
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        version, _, rest = status_line.decode("latin-1").strip().partition(" ")
+        status_text, _, reason = rest.partition(" ")
+        if not version.startswith("HTTP/") or not status_text.isdigit():
+            raise http.client.BadStatusLine(status_line.decode("latin-1", errors="ignore"))
+        status = int(status_text)
+
+        headers = http.client.HTTPMessage()
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip()] = value.strip()
+        # 跳过100 Continue等临时响应
+        if 100 <= status < 200 and status != 101:
+            continue
+        break
+
+    connection = (headers.get("Connection") or "").lower()
+    will_close = "close" in connection or (version == "HTTP/1.0" and "keep-alive" not in connection)
+    if method.upper() == "HEAD" or status in (204, 304) or status < 200:
+        return status, reason, headers, b"", will_close, False
+
+    truncated = False
+    if "chunked" in (headers.get("Transfer-Encoding") or "").lower():
+        chunks = []
+        received = 0
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # 跳过trailer
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            if received + size > max_body:
+                chunks.append(await reader.readexactly(max_body - received))
+                truncated = True
+                break
+            chunks.append(await reader.readexactly(size))
+            received += size
+            await reader.readline()
+        body = b"".join(chunks)
+    elif headers.get("Content-Length") is not None:
+        length = int(headers.get("Content-Length"))
+        truncated = length > max_body
+        body = await reader.readexactly(min(length, max_body))
+    else:
+        chunks = []
+        received = 0
+        while received <= max_body:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            received += len(chunk)
+        truncated = received > max_body
+        body = b"".join(chunks)[:max_body]
+        will_close = True
+    return status, reason, headers, body, will_close or truncated, truncated
+
+
+class AsyncConnectionPool:
+    """
+    异步版本的长连接池，只在创建它的事件循环内使用
+    每个主机最多保留max_per_host个空闲连接，空闲超过idle_timeout秒的连接不再复用
+    """
+
+    def __init__(self, max_per_host=10, idle_timeout=30):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        # (scheme, host, port) -> [(reader, writer, 归还时间)]
+        self.idle = {}
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(host, port, ssl=_ssl_context if scheme == "https" else None,
+                                                       limit=2 ** 20)
+        count("created")
+        return reader, writer
+
+    def _take_idle(self, key):
+        conns = self.idle.get(key, [])
+        now = time.time()
+        while conns:
+            reader, writer, released_at = conns.pop()
+            if now - released_at <= self.idle_timeout and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _release(self, key, reader, writer):
+        conns = self.idle.setdefault(key, [])
+        conns.append((reader, writer, time.time()))
+        if len(conns) > self.max_per_host:
+            conns.pop(0)[1].close()
+
+    async def request(self, method, url, headers=None, body=None, max_body=None):
+        """
+        发送请求并读取完整响应，不处理重定向，超时由调用方控制
+        :param max_body: 响应体最大读取字节数，默认为config.REQUEST_MAX_BODY
+        :return: PooledResponse
+        """
+        max_body = max_body or config.REQUEST_MAX_BODY
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower() or "http"
+        if scheme not in ("http", "https"):
+            raise ValueError(f"不支持的协议: {scheme}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        selector = parts.path or "/"
+        if parts.query:
+            selector += "?" + parts.query
+        data = encode_request(method, parts.hostname, port, scheme, selector, headers or {}, body)
+
+        count("requests")
+        conn = self._take_idle(key)
+        reused = conn is not None
+        if reused:
+            count("reused")
+        else:
+            conn = await self._connect(key)
+        while True:
+            reader, writer = conn
+            try:
+                writer.write(data)
+                await writer.drain()
+                status, reason, response_headers, response_body, will_close, truncated = \
+                    await read_response(reader, method, max_body)
+            except (http.client.RemoteDisconnected, ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused or method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                # 服务端已关闭空闲连接，换新连接重试一次
+                count("stale_retries")
+                conn, reused = await self._connect(key), False
+                continue
+            except BaseException:
+                writer.close()
+                raise
+            break
+
+        if will_close:
+            writer.close()
+        else:
+            self._release(key, reader, writer)
+        return PooledResponse(url, status, reason, response_headers, response_body, truncated)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        for conns in self.idle.values():
+            for _, writer, _ in conns:
+                writer.close()
+        self.idle = {}
@@ -0,0 +1,291 @@
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from config import config
+from utils.logger import logger
+
+# 引用格式：blob:sha256:<摘要>，写入页面文件和消息表时代替完整的响应内容
+REF_PREFIX = "blob:sha256:"
+_ref_pattern = re.compile(re.escape(REF_PREFIX) + r"([0-9a-f]{64})")
+
+_lock = threading.Lock()
+_initialized = False
+# 最近使用的内容，摘要 -> 原文
+_memory = OrderedDict()
+_memory_bytes = 0
+# 任务ID -> 该任务写入或复用过的摘要，任务结束时据此回收
+_task_digests = {}
+_stats = {
+    "put": 0,
+    "dedup": 0,
+    "get": 0,
+    "memory_hit": 0,
+    "missing": 0,
+    "bytes_raw": 0,
+    "bytes_stored": 0,
+    "collected": 0
+}
+
+
+def _get_connection():
+    conn = sqlite3.connect(config.BLOB_STORE_PATH, timeout=30)
+    return conn, conn.cursor()
+
+
+def _init_store():
+    """初始化内容表，只在第一次使用时执行"""
+    global _initialized
+    if _initialized:
+        return
+    with _lock:
+        if _initialized:
+            return
+        conn, cursor = _get_connection()
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER,
+                    data BLOB,
+                    created_at REAL
+                )
+            ''')
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        _initialized = True
+
+
+def _remember(digest, content):
+    """放入内存缓存，超出大小限制时淘汰最久未使用的内容"""
+    global _memory_bytes
+    with _lock:
+        if digest in _memory:
+            _memory.move_to_end(digest)
+            return
+        _memory[digest] = content
+        _memory_bytes += len(content)
+        while _memory_bytes > config.BLOB_MEMORY_MAX_BYTES and len(_memory) > 1:
+            _, evicted = _memory.popitem(last=False)
+            _memory_bytes -= len(evicted)
+
+
+def put(content: str) -> str:
+    """
+    保存内容，相同内容只保存一份
+    :param content: 响应内容
+    :return: sha256摘要
+    """
+    data = content.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    with _lock:
+        _stats["put"] += 1
+        _task_digests.setdefault(config.TASK_ID or "", set()).add(digest)
+        known = digest in _memory
+    if known:
+        with _lock:
+            _stats["dedup"] += 1
+        return digest
+
+    _init_store()
+    compressed = zlib.compress(data)
+    conn, cursor = _get_connection()
+    try:
+        cursor.execute("INSERT OR IGNORE INTO blobs (digest, size, data, created_at) VALUES (?, ?, ?, ?)",
+                       (digest, len(data), compressed, time.time()))
+        conn.commit()
+        stored = cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.warn(f"写入内容存储失败: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    with _lock:
+        if stored:
+            _stats["bytes_raw"] += len(data)
+            _stats["bytes_stored"] += len(compressed)
+        else:
+            _stats["dedup"] += 1
+    _remember(digest, content)
+    return digest
+
+
+def get(digest: str):
+    """
+    读取内容
+    :param digest: sha256摘要
+    :return: 原文，不存在时返回None
+    """
+    with _lock:
+        _stats["get"] += 1
+        content = _memory.get(digest)
+        if content is not None:
+            _stats["memory_hit"] += 1
+            _memory.move_to_end(digest)
+            return content
+
+    _init_store()
+    conn, cursor = _get_connection()
+    try:
+        cursor.execute("SELECT data FROM blobs WHERE digest = ?", (digest,))
+        row = cursor.fetchone()
+    except sqlite3.Error as e:
+        logger.warn(f"读取内容存储失败: {e}")
+        row = None
+    finally:
+        cursor.close()
+        conn.close()
+    if not row:
+        with _lock:
+            _stats["missing"] += 1
+        return None
+    content = zlib.decompress(row[0]).decode("utf-8")
+    _remember(digest, content)
+    return content
+
+
+def ref_of(content):
+    """
+    计算ref会返回的值，不写入内容存储
+    :param content: 响应内容或消息内容
+    :return: 引用或原文
+    """
+    if not isinstance(content, str) or len(content) < config.BLOB_INLINE_BYTES:
+        return content
+    return REF_PREFIX + hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def ref(content):
+    """
+    超过BLOB_INLINE_BYTES的内容保存到内容存储并返回引用，较短的内容原样返回
+    :param content: 响应内容或消息内容
+    :return: 引用或原文
+    """
+    if not isinstance(content, str) or len(content) < config.BLOB_INLINE_BYTES:
+        return content
+    try:
+        return REF_PREFIX + put(content)
+    except sqlite3.Error:
+        return content
+
+
+def resolve(value):
+    """
+    将引用还原为原文，不是引用时原样返回
+    :param value: ref返回的值
+    :return: 原文，内容丢失时返回引用本身
+    """
+    if not isinstance(value, str) or not value.startswith(REF_PREFIX):
+        return value
+    content = get(value[len(REF_PREFIX):])
+    if content is None:
+        logger.warn(f"内容存储中找不到 {value}")
+        return value
+    return content
+
+
+def dehydrate_page(page: dict) -> dict:
+    """
+    将页面的响应内容替换为引用，用于写入页面文件
+    :param page: 页面
+    :return: 新的页面字典，原页面不变
+    """
+    response = page.get("response")
+    if not isinstance(response, dict) or "content" not in response:
+        return page
+    return dict(page, response=dict(response, content=ref(response["content"])))
+
+
+def hydrate_page(page: dict) -> dict:
+    """
+    dehydrate_page的逆操作，读取页面文件后还原响应内容
+    :param page: 页面
+    :return: 页面，响应内容为原文
+    """
+    response = page.get("response")
+    if isinstance(response, dict) and "content" in response:
+        response["content"] = resolve(response["content"])
+    return page
+
+
+def _message_refs():
+    """消息表中引用的全部摘要"""
+    conn = sqlite3.connect(config.DB_PATH, timeout=30)
+    try:
+        rows = conn.execute("SELECT DISTINCT content FROM messages WHERE content LIKE ?", (REF_PREFIX + "%",)).fetchall()
+    finally:
+        conn.close()
+    return {row[0][len(REF_PREFIX):] for row in rows}
+
+
+def _page_refs():
+    """所有任务的页面文件（tasks/<任务ID>/pages/*.json）中引用的全部摘要"""
+    digests = set()
+    for path in glob.glob(os.path.join(config.TASK_PATH, "*", "pages", "*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            digests.update(_ref_pattern.findall(f.read()))
+    return digests
+
+
+def collect(task_id=None):
+    """
+    回收某个任务（默认为当前任务）用过、且消息表、页面文件和其他进行中的任务都不再引用的内容
+    :param task_id: 任务ID
+    :return: 删除的内容数量
+    """
+    task_id = (config.TASK_ID or "") if task_id is None else task_id
+    with _lock:
+        candidates = _task_digests.pop(task_id, set())
+        for digests in _task_digests.values():
+            candidates -= digests
+    if not candidates:
+        return 0
+
+    _init_store()
+    try:
+        candidates -= _message_refs()
+        candidates -= _page_refs()
+        if not candidates:
+            return 0
+        conn, cursor = _get_connection()
+        try:
+            cursor.executemany("DELETE FROM blobs WHERE digest = ?", [(digest,) for digest in candidates])
+            conn.commit()
+            deleted = cursor.rowcount
+        finally:
+            cursor.close()
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        # 无法确认引用时不删除任何内容
+        logger.warn(f"回收内容存储失败: {e}")
+        return 0
+
+    global _memory_bytes
+    with _lock:
+        for digest in candidates:
+            content = _memory.pop(digest, None)
+            if content is not None:
+                _memory_bytes -= len(content)
+        _stats["collected"] += deleted
+    return deleted
+
+
+def get_stats():
+    """获取内容存储统计"""
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_items"] = len(_memory)
+        stats["memory_bytes"] = _memory_bytes
+    stats["dedup_rate"] = round(stats["dedup"] / stats["put"], 4) if stats["put"] else 0
+    stats["compression_ratio"] = round(stats["bytes_stored"] / stats["bytes_raw"], 4) if stats["bytes_raw"] else 0
+    return stats
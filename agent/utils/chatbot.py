@@ -1,12 +1,17 @@
+import asyncio
 import sqlite3
-from turtle import st
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait as futures_wait
+from contextlib import contextmanager, asynccontextmanager
 from typing import List, Dict
 import uuid
 from config import config
+from utils import blob_store, llm_cache, llm_dispatcher, llm_stats, tokenizer
 from utils.logger import logger
 from utils.sql_helper import SQLiteHelper
+import httpx
 import openai
-from config import config
 
 
 import re
@@ -14,6 +19,257 @@ import requests
 import json
 import time
 
+_clients = {}
+_clients_lock = threading.Lock()
+_pool_stats = {}
+
+
+def get_client(base_url: str, api_key: str) -> openai.OpenAI:
+    """
+    获取进程内共享的OpenAI客户端，相同(base_url, api_key)复用同一个连接池
+    :param base_url: 接口地址
+    :param api_key: 接口密钥
+    :return: OpenAI客户端
+    """
+    key = (base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            stats = {
+                "requests": 0,
+                "new_connections": 0,
+                "reused_connections": 0,
+                "seen_streams": set()
+            }
+
+            def on_response(response):
+                # 通过底层网络流判断连接是否被复用
+                stream = response.extensions.get("network_stream")
+                with _clients_lock:
+                    stats["requests"] += 1
+                    if stream is None:
+                        return
+                    if id(stream) in stats["seen_streams"]:
+                        stats["reused_connections"] += 1
+                    else:
+                        stats["seen_streams"].add(id(stream))
+                        stats["new_connections"] += 1
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=config.LLM_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=config.LLM_POOL_KEEPALIVE_EXPIRY
+                ),
+                timeout=openai.DEFAULT_TIMEOUT,
+                follow_redirects=True,
+                event_hooks={"response": [on_response]}
+            )
+            client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            _clients[key] = client
+            _pool_stats[key] = (stats, http_client)
+    return client
+
+
+def get_pool_stats() -> List[Dict]:
+    """获取所有共享客户端的连接池统计"""
+    result = []
+    with _clients_lock:
+        for (base_url, api_key), (stats, http_client) in _pool_stats.items():
+            try:
+                open_connections = len(http_client._transport._pool.connections)
+            except AttributeError:
+                open_connections = -1
+            result.append({
+                "base_url": base_url,
+                "api_key": api_key[-4:] if api_key else "",
+                "requests": stats["requests"],
+                "new_connections": stats["new_connections"],
+                "reused_connections": stats["reused_connections"],
+                "open_connections": open_connections
+            })
+    return result
+
+
+class _Waiter:
+    """准入队列中的等待者，同步调用使用Event唤醒，异步调用通过事件循环唤醒Future"""
+
+    def __init__(self, loop=None):
+        self.admitted = False
+        self.enqueued_at = time.time()
+        self.loop = loop
+        if loop:
+            self.future = loop.create_future()
+        else:
+            self.event = threading.Event()
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+        else:
+            self.event.set()
+
+
+# 全局LLM并发准入控制，所有线程池和事件循环共享
+_governor_lock = threading.Lock()
+_governor_queues = OrderedDict()  # 阶段 -> 等待队列，按阶段轮转出队保证公平
+_governor_in_flight = 0
+_governor_stats = {}
+
+
+def _stage_stats(stage):
+    if stage not in _governor_stats:
+        _governor_stats[stage] = {"requests": 0, "queued": 0, "wait_total": 0.0, "wait_max": 0.0}
+    return _governor_stats[stage]
+
+
+def _record_wait(stage, wait):
+    stats = _stage_stats(stage)
+    stats["requests"] += 1
+    stats["wait_total"] += wait
+    stats["wait_max"] = max(stats["wait_max"], wait)
+
+
+def _try_admit(stage, waiter):
+    """有空闲名额且没有排队的请求时直接准入，否则加入该阶段的等待队列"""
+    global _governor_in_flight
+    with _governor_lock:
+        if _governor_in_flight < config.LLM_MAX_IN_FLIGHT and not _governor_queues:
+            _governor_in_flight += 1
+            _record_wait(stage, 0)
+            return True
+        _governor_queues.setdefault(stage, deque()).append(waiter)
+        _stage_stats(stage)["queued"] += 1
+        return False
+
+
+def _release_slot():
+    """释放名额，按阶段轮转将名额直接交给下一个等待者"""
+    global _governor_in_flight
+    with _governor_lock:
+        waiter = None
+        if _governor_in_flight <= config.LLM_MAX_IN_FLIGHT and _governor_queues:
+            stage, queue = next(iter(_governor_queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                _governor_queues.move_to_end(stage)
+            else:
+                del _governor_queues[stage]
+            waiter.admitted = True
+            _stage_stats(stage)["queued"] -= 1
+            _record_wait(stage, time.time() - waiter.enqueued_at)
+        else:
+            _governor_in_flight -= 1
+    if waiter:
+        waiter.wake()
+
+
+def _cancel_wait(stage, waiter):
+    """等待被取消时移出队列，如果名额已经交给该等待者则归还"""
+    with _governor_lock:
+        if not waiter.admitted:
+            queue = _governor_queues.get(stage)
+            if queue and waiter in queue:
+                queue.remove(waiter)
+                _stage_stats(stage)["queued"] -= 1
+                if not queue:
+                    del _governor_queues[stage]
+            return
+    _release_slot()
+
+
+@contextmanager
+def llm_slot(stage="default"):
+    """
+    获取一个LLM请求名额，超过LLM_MAX_IN_FLIGHT时按阶段公平排队
+    :param stage: 调用阶段
+    """
+    waiter = _Waiter()
+    if not _try_admit(stage, waiter):
+        waiter.event.wait()
+    try:
+        yield
+    finally:
+        _release_slot()
+
+
+@asynccontextmanager
+async def allm_slot(stage="default"):
+    """llm_slot的异步版本，排队时不阻塞事件循环"""
+    waiter = _Waiter(asyncio.get_running_loop())
+    if not _try_admit(stage, waiter):
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            _cancel_wait(stage, waiter)
+            raise
+    try:
+        yield
+    finally:
+        _release_slot()
+
+
+def get_governor_stats():
+    """获取并发准入统计：当前进行中的请求数以及各阶段的排队数量和等待时间"""
+    with _governor_lock:
+        stages = {}
+        for stage, stats in _governor_stats.items():
+            stages[stage] = {
+                "requests": stats["requests"],
+                "queued": stats["queued"],
+                "wait_avg": round(stats["wait_total"] / stats["requests"], 3) if stats["requests"] else 0,
+                "wait_max": round(stats["wait_max"], 3)
+            }
+        return {
+            "in_flight": _governor_in_flight,
+            "max_in_flight": config.LLM_MAX_IN_FLIGHT,
+            "stages": stages
+        }
+
+
+_async_clients = {}
+
+# 会话历史缓存：session_id -> [(role, content)]，SQLite只做写穿透持久化
+_history = OrderedDict()
+_history_lock = threading.Lock()
+
+
+def get_async_client(base_url: str, api_key: str) -> openai.AsyncOpenAI:
+    """
+    获取当前事件循环共享的异步OpenAI客户端
+    异步连接池绑定事件循环，因此按(事件循环, base_url, api_key)区分
+    :param base_url: 接口地址
+    :param api_key: 接口密钥
+    :return: AsyncOpenAI客户端
+    """
+    key = (id(asyncio.get_running_loop()), base_url, api_key)
+    with _clients_lock:
+        client = _async_clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=config.LLM_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=config.LLM_POOL_KEEPALIVE_EXPIRY
+                ),
+                timeout=openai.DEFAULT_TIMEOUT,
+                follow_redirects=True
+            )
+            client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            _async_clients[key] = client
+    return client
+
+
+async def close_async_clients():
+    """关闭当前事件循环上创建的异步客户端，需要在事件循环关闭前调用"""
+    loop_id = id(asyncio.get_running_loop())
+    with _clients_lock:
+        keys = [k for k in _async_clients if k[0] == loop_id]
+        clients = [_async_clients.pop(k) for k in keys]
+    for client in clients:
+        await client.close()
+
+
 def interact_with_server(action_type: str,process_id=None, data: dict = None):
     """
     与服务器进行交互
@@ -98,21 +354,71 @@ def generate_sessionid(session_id=""):
             "session_id": new_session_id,
             "parent_id": None
         })
-    
+
+    # 新会话没有历史消息，直接放入缓存，避免首次对话时查询数据库
+    with _history_lock:
+        _cache_history(new_session_id, [])
+
     return new_session_id
 
 
+def _cache_history(session_id: str, history: list):
+    """放入会话历史缓存并按LRU淘汰空闲会话，调用方需持有_history_lock"""
+    _history[session_id] = history
+    _history.move_to_end(session_id)
+    while len(_history) > config.HISTORY_CACHE_MAX_SESSIONS:
+        evicted_id, _ = _history.popitem(last=False)
+        with _compactions_lock:
+            _compactions.pop(evicted_id, None)
+
+
+def get_history(session_id: str) -> list:
+    """
+    获取会话历史，缓存未命中时从SQLite加载一次
+    :param session_id: 会话ID
+    :return: [(role, content)]列表的副本
+    """
+    with _history_lock:
+        history = _history.get(session_id)
+        if history is None:
+            result = SQLiteHelper.execute_query('''
+                SELECT role, content 
+                FROM messages 
+                WHERE session_id = ? 
+                ORDER BY created_at ASC, id ASC
+            ''', (session_id,))
+            history = [(role, blob_store.resolve(content)) for role, content in result]
+            _cache_history(session_id, history)
+        else:
+            _history.move_to_end(session_id)
+        return list(history)
+
+
+def append_history(session_id: str, role: str, content: str, status: str="default"):
+    """
+    追加一条消息：写入SQLite并同步追加到缓存
+    写库和追加在同一把锁内完成，避免与并发的缓存加载产生重复或遗漏
+    较长的消息（通常是工具返回的响应内容）在消息表中只保存内容存储的引用，引用在加锁前写入，避免各会话等待磁盘写入
+    """
+    stored = blob_store.ref(content)
+    with _history_lock:
+        SQLiteHelper.insert_record("messages", {
+            "session_id": session_id,
+            "role": role,
+            "content": stored,
+            "status": status
+        })
+        history = _history.get(session_id)
+        if history is not None:
+            history.append((role, content))
+
+
 def add_message(message: str, session_id:str="", status: str="default"):
     if not session_id:
         session_id = generate_sessionid("")
 
     check_process_status(session_id)
-    SQLiteHelper.insert_record("messages", {
-        "session_id": session_id,
-        "role": "user",
-        "content": message,
-        "status": status
-    })
+    append_history(session_id, "user", message, status)
     
     # 与服务器交互 - 更新历史记录
     history_data = {
@@ -128,117 +434,551 @@ def add_message(message: str, session_id:str="", status: str="default"):
 
 
 
-def chat(prompt: str, session_id: str, status: str="default", _type="action", type="normal", limit=10000) -> str:
+def load_messages(session_id: str) -> List[Dict[str, str]]:
+    """
+    获取会话的历史消息，长度由_prepare_chat按模型的上下文预算控制
+    :param session_id: 会话ID
+    :return: 消息列表
+    """
+    return [{"role": role, "content": content} for role, content in get_history(session_id)]
+
+
+def save_reply(ai_response: str, session_id: str, status: str="default", _type="action", token_count=0):
+    """
+    保存AI回复并同步到服务器
+    :param ai_response: AI的回复
+    :param session_id: 会话ID
+    """
+    append_history(session_id, "assistant", ai_response, status)
+
+    # 与服务器交互 - 更新历史记录
+    history_data = {
+        "session_id": session_id,
+        "content": ai_response,
+        "timestamp": int(time.time()),
+        "token_count": token_count,
+        "type": _type
+    }
+
+    interact_with_server("history_update", session_id, history_data)
+
+
+compact_prompt = """
+你负责压缩一段渗透测试对话的早期历史，后续对话只能看到你输出的摘要，因此需要保留继续测试所需的全部信息：
+1. 已获取的关键信息：url、接口、参数、用户名密码、cookie、token等，必须保留原值
+2. 已经发送过的请求和载荷以及对应的结果，哪些成功、哪些失败
+3. 已经确认或排除的漏洞、发现的过滤和限制，以及当前的测试进度
+不需要保留原始的html响应内容，直接输出摘要，不要输出任何工具调用xml
+"""
+
+compact_message = """
+之前的对话摘要如下：
+{summary}
+""".strip()
+
+# 会话压缩状态：session_id -> (已压缩的消息数量, 摘要)
+_compactions = {}
+_compactions_lock = threading.Lock()
+
+
+def _summarize(previous_summary: str, messages: List[Dict[str, str]]) -> str:
+    """调用模型将之前的摘要和需要压缩的消息合并为新的摘要"""
+    history = []
+    if previous_summary:
+        history.append({"role": "user", "content": compact_message.format(summary=previous_summary)})
+    history.extend(messages)
+    history.append({"role": "user", "content": "请输出以上对话的摘要"})
+
+    model = llm_dispatcher.get_endpoints("normal", "compact")[0].model
+    cache_key = llm_cache.make_key(model, compact_prompt, history) if config.LLM_CACHE_ENABLE else None
+    cached = llm_cache.get(cache_key) if cache_key else None
+    if cached:
+        return cached[0]
+
+    started = time.time()
+    summary, usage, endpoint, retries = _complete(compact_prompt, history, "normal", "compact", max_retries=0)
+    llm_stats.record("compact", endpoint, usage, time.time() - started, retries, failed=not summary)
+    if cache_key:
+        llm_cache.put(cache_key, model, summary, usage.total_tokens if usage else 0)
+    return summary
+
+
+def compact_messages(prompt: str, session_id: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    会话压缩：超过token预算时，将较早的消息替换为摘要，只保留最近的消息原文
+    压缩结果按会话缓存，之后的对话复用同一份摘要，超出预算时再继续滚动压缩
+    :param prompt: 系统提示词
+    :param session_id: 会话ID
+    :param messages: 完整的历史消息
+    :return: 压缩后的消息列表
+    """
+    with _compactions_lock:
+        compacted, summary = _compactions.get(session_id, (0, ""))
+    if compacted > len(messages):
+        compacted, summary = 0, ""
+
+    def build(count, text):
+        if not count:
+            return messages
+        return [{"role": "user", "content": compact_message.format(summary=text)}] + messages[count:]
+
+    current = build(compacted, summary)
+    budget = config.COMPACT_TOKEN_BUDGET - tokenizer.estimate_tokens(prompt)
+    if tokenizer.estimate_messages_tokens(current) <= budget:
+        return current
+
+    # 保留最近的消息原文，压缩边界落在用户消息上，避免保留部分以孤立的assistant回复开头
+    boundary = len(messages) - config.COMPACT_KEEP_MESSAGES
+    while boundary > compacted and messages[boundary]["role"] != "user":
+        boundary -= 1
+    if boundary <= compacted:
+        return current
+
+    try:
+        new_summary = _summarize(summary, messages[compacted:boundary])
+    except Exception as e:
+        logger.warn(f"会话压缩失败: {e}")
+        return current
+    if not new_summary:
+        return current
+
+    with _compactions_lock:
+        _compactions[session_id] = (boundary, new_summary)
+    logger.info(f"会话 {session_id} 超出token预算，已压缩前 {boundary} 条消息")
+    return build(boundary, new_summary)
+
+
+def _prepare_chat(prompt: str, session_id: str, type="normal", limit=4000, cache=False, stage="default", context=None):
+    """
+    加载历史消息、按需压缩会话并查询响应缓存
+    上下文消息放在系统提示词之后、历史消息之前，不保存到对话历史
+    系统提示词和上下文保持不变时，请求的前缀在多轮对话和并行会话之间保持一致，可以命中服务商的提示词前缀缓存
+    :param limit: 单条历史消息的最大token数
+    :param context: 上下文消息列表，按顺序作为user消息发送
+    :return: (消息列表, 缓存键, 缓存结果)
+    """
+    context = context or []
+    messages = load_messages(session_id)
+    if config.COMPACT_ENABLE and type == "normal":
+        messages = compact_messages("\n".join([prompt] + context), session_id, messages)
+    messages = [{"role": "user", "content": content} for content in context] + messages
+
+    # 按模型的上下文预算装入消息，上下文和第一条消息（任务描述或会话摘要）固定保留
+    model = llm_dispatcher.get_endpoints(type, stage)[0].model
+    messages = tokenizer.pack_messages(prompt, messages, model, limit if type == "normal" else None, len(context) + 1)
+
+    # 查询响应缓存，系统提示词和消息历史完全一致时直接复用之前的回复
+    cache_key = None
+    cached = None
+    if cache and config.LLM_CACHE_ENABLE:
+        cache_key = llm_cache.make_key(model, prompt, messages)
+        cached = llm_cache.get(cache_key)
+    return messages, cache_key, cached
+
+
+def _finish_chat(ai_response: str, token_count, session_id: str, status: str, _type, cache_key=None, model=""):
+    """写入响应缓存、记录日志并保存AI回复"""
+    if cache_key:
+        llm_cache.put(cache_key, model, ai_response, token_count)
+
+    # 获取本次对话的token数量
+    logger.info(f"本次对话使用token数: {token_count}")
+
+    logger.info(ai_response)
+
+    save_reply(ai_response, session_id, status, _type, token_count)
+
+
+def _create_kwargs(endpoint, prompt: str, messages: List[Dict[str, str]]):
+    """构造单次请求的参数，路由配置了超时时间时覆盖客户端默认超时"""
+    return {
+        "model": endpoint.model,
+        "messages": [
+            {"role": "system", "content": prompt}
+        ] + messages,
+        "timeout": endpoint.timeout or openai.NOT_GIVEN
+    }
+
+
+# 对冲请求统计，按调用阶段记录主请求耗时用于计算截止时间
+_hedge_lock = threading.Lock()
+_hedge_latencies = {}
+_hedge_stats = {}
+_hedge_executor = None
+
+
+def _hedge_deadline(stage):
+    """对冲截止时间：该阶段最近请求耗时的分位数，样本不足时使用默认值"""
+    with _hedge_lock:
+        samples = sorted(_hedge_latencies.get(stage, ()))
+    if len(samples) < config.LLM_HEDGE_MIN_SAMPLES:
+        return config.LLM_HEDGE_DEFAULT_DELAY
+    index = min(len(samples) - 1, int(len(samples) * config.LLM_HEDGE_PERCENTILE / 100))
+    return max(samples[index], config.LLM_HEDGE_MIN_DELAY)
+
+
+def _hedge_stage_stats(stage):
+    return _hedge_stats.setdefault(stage, {"requests": 0, "hedged": 0, "hedge_wins": 0, "saved": 0.0})
+
+
+def _record_hedge(stage, latency, hedged=False, hedge_won=False, estimate_saved=False):
+    """
+    记录一次请求的对冲情况
+    :param estimate_saved: 主请求已被取消时，节省的时间按该阶段耗时样本的最大值估算
+    """
+    with _hedge_lock:
+        stats = _hedge_stage_stats(stage)
+        samples = _hedge_latencies.setdefault(stage, deque(maxlen=200))
+        stats["requests"] += 1
+        if hedged:
+            stats["hedged"] += 1
+        if hedge_won:
+            stats["hedge_wins"] += 1
+            if estimate_saved and samples:
+                stats["saved"] += max(max(samples) - latency, 0)
+        else:
+            samples.append(latency)
+
+
+def _record_saved(stage, saved):
+    """记录对冲请求胜出后，落后的主请求实际完成时多等待的时间"""
+    with _hedge_lock:
+        _hedge_stage_stats(stage)["saved"] += max(saved, 0)
+
+
+def get_hedge_stats():
+    """获取各阶段的对冲率、对冲胜出次数和节省的时间（同步请求为实测值，异步请求为估算值）"""
+    with _hedge_lock:
+        return {stage: {
+            "requests": stats["requests"],
+            "hedged": stats["hedged"],
+            "hedge_rate": round(stats["hedged"] / stats["requests"], 4) if stats["requests"] else 0,
+            "hedge_wins": stats["hedge_wins"],
+            "saved": round(stats["saved"], 3)
+        } for stage, stats in _hedge_stats.items()}
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=config.LLM_MAX_IN_FLIGHT * 2, thread_name_prefix="llm-hedge")
+        return _hedge_executor
+
+
+def _create(endpoint, prompt: str, messages: List[Dict[str, str]], stage="default"):
+    """
+    单次请求，开启对冲时主接口超过截止时间未返回，则向备用服务商发起相同请求，使用先完成的结果
+    同步请求无法中断，落后的请求在线程中继续执行，结果直接丢弃
+    :return: (响应, 实际返回结果的接口)
+    """
+    def create(e):
+        return get_client(e.url, e.key).chat.completions.create(**_create_kwargs(e, prompt, messages))
+
+    if not config.LLM_HEDGE_ENABLE:
+        return create(endpoint), endpoint
+
+    executor = _get_hedge_executor()
+    started = time.time()
+    primary = executor.submit(create, endpoint)
+    try:
+        response = primary.result(timeout=_hedge_deadline(stage))
+        _record_hedge(stage, time.time() - started)
+        return response, endpoint
+    except FutureTimeoutError:
+        pass
+
+    hedge_endpoint = llm_dispatcher.try_acquire_provider(config.LLM_HEDGE_PROVIDER, exclude=endpoint)
+    if not hedge_endpoint:
+        response = primary.result()
+        _record_hedge(stage, time.time() - started)
+        return response, endpoint
+
+    logger.info(f"主请求超过截止时间，向 {hedge_endpoint.name} 发起对冲请求")
+    secondary = executor.submit(create, hedge_endpoint)
+    secondary.add_done_callback(lambda f: llm_dispatcher.release(hedge_endpoint, f.exception()))
+    pending = {primary, secondary}
+    error = None
+    while pending:
+        done, pending = futures_wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                latency = time.time() - started
+                _record_hedge(stage, latency, hedged=True, hedge_won=future is secondary)
+                if future is primary:
+                    return future.result(), endpoint
+                primary.add_done_callback(lambda f: _record_saved(stage, time.time() - started - latency))
+                return future.result(), hedge_endpoint
+            if future is primary or error is None:
+                error = future.exception()
+    raise error
+
+
+async def _acreate(endpoint, prompt: str, messages: List[Dict[str, str]], stage="default"):
+    """_create的异步版本，对冲请求胜出后取消落后的请求"""
+    def create(e):
+        return get_async_client(e.url, e.key).chat.completions.create(**_create_kwargs(e, prompt, messages))
+
+    if not config.LLM_HEDGE_ENABLE:
+        return await create(endpoint), endpoint
+
+    started = time.time()
+    primary = asyncio.ensure_future(create(endpoint))
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=_hedge_deadline(stage))
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    hedge_endpoint = None
+    if not done:
+        hedge_endpoint = llm_dispatcher.try_acquire_provider(config.LLM_HEDGE_PROVIDER, exclude=endpoint)
+    if not hedge_endpoint:
+        try:
+            response = await primary
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        _record_hedge(stage, time.time() - started)
+        return response, endpoint
+
+    logger.info(f"主请求超过截止时间，向 {hedge_endpoint.name} 发起对冲请求")
+    secondary = asyncio.ensure_future(create(hedge_endpoint))
+    tasks = {primary: endpoint, secondary: hedge_endpoint}
+    pending = set(tasks)
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    _record_hedge(stage, time.time() - started, hedged=True, hedge_won=task is secondary, estimate_saved=True)
+                    return task.result(), tasks[task]
+                if task is primary or error is None:
+                    error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+        llm_dispatcher.release(hedge_endpoint, secondary.exception() if secondary.done() and not secondary.cancelled() else None)
+
+
+def _complete(prompt: str, messages: List[Dict[str, str]], type="normal", stage="default", max_retries=20):
+    """
+    调用模型获取回复，由调度器按路由选择密钥，失败的密钥单独退避，重试时可切换到备用路由
+    :return: (AI回复, usage, 最后使用的接口, 重试次数)，超过重试次数时回复为空
+    """
+    chat_count = 0
+    while True:
+        # 先选择接口再申请名额，所有密钥都在退避时在名额外等待，不占用其他阶段的名额
+        endpoint = llm_dispatcher.acquire(type, stage, chat_count)
+        try:
+            with llm_slot(stage):
+                response, winner = _create(endpoint, prompt, messages, stage)
+            llm_dispatcher.release(endpoint)
+            return response.choices[0].message.content, response.usage, winner, chat_count
+        except Exception as e:
+            logger.warning(f"调用模型 {endpoint.model} 失败: {e}")
+            llm_dispatcher.release(endpoint, e)
+        if chat_count >= max_retries:
+            return "", None, endpoint, chat_count
+        chat_count += 1
+
+
+async def _acomplete(prompt: str, messages: List[Dict[str, str]], type="normal", stage="default", max_retries=20):
+    """_complete的异步版本"""
+    chat_count = 0
+    while True:
+        endpoint = await llm_dispatcher.aacquire(type, stage, chat_count)
+        try:
+            async with allm_slot(stage):
+                response, winner = await _acreate(endpoint, prompt, messages, stage)
+            llm_dispatcher.release(endpoint)
+            return response.choices[0].message.content, response.usage, winner, chat_count
+        except Exception as e:
+            logger.warning(f"调用模型 {endpoint.model} 失败: {e}")
+            llm_dispatcher.release(endpoint, e)
+        except BaseException:
+            # 任务被取消
+            llm_dispatcher.release(endpoint)
+            raise
+        if chat_count >= max_retries:
+            return "", None, endpoint, chat_count
+        chat_count += 1
+
+
+def chat(prompt: str, session_id: str, status: str="default", _type="action", type="normal", limit=4000, cache=False, stage="default", context=None) -> str:
     """
     与AI进行对话，并保存对话历史
     :param prompt: 用户输入的提示词
     :param session_id: 会话ID
+    :param limit: normal类型单条历史消息的最大token数，最新的消息不受限制
+    :param cache: 是否使用LLM响应缓存，需同时开启config.LLM_CACHE_ENABLE
+    :param stage: 调用阶段，用于并发准入的公平排队和模型路由
+    :param context: 上下文消息列表，放在系统提示词之后且不保存到对话历史，用于保持请求前缀稳定
     :return: AI的回复
     """
-    
-    # 连接数据库
-    conn = sqlite3.connect(config.DB_PATH)
-    cursor = conn.cursor()
-    session_ids = [session_id]
-
-    # 获取所有相关的session_id，从父到子排序
 
     try:
-        messages: List[Dict[str, str]] = []
-        for s in session_ids:
-        # 获取历史消息
-            if s != session_id:
-                result = SQLiteHelper.execute_query('''
-                     SELECT role, content 
-                     FROM messages 
-                     WHERE session_id = ? and status = 'default' 
-                     ORDER BY created_at ASC
-                 ''', (s,))
-            else:
-                result = SQLiteHelper.execute_query('''
-                    SELECT role, content 
-                    FROM messages 
-                    WHERE session_id = ? 
-                    ORDER BY created_at ASC
-                ''', (s,))
-            
-            # 构建消息历史
-            for role, content in result:
-
-                if len(content) < limit:
-                    messages.append({
-                        "role": role,
-                        "content": content
-                    })
-                else:
-                    messages.append({
-                        "role": role,
-                        "content": content[:limit] + "...(内容过长，无法全部输出)" if type == "normal" else content
-                    })
+        started = time.time()
+        messages, cache_key, cached = _prepare_chat(prompt, session_id, type, limit, cache, stage, context)
+
+        if cached:
+            ai_response, token_count = cached
+            cache_key = None
+            usage, endpoint, chat_count = None, llm_dispatcher.get_endpoints(type, stage)[0], 0
+            logger.info("命中LLM响应缓存")
+        else:
+            # 调用OpenAI API获取回复
+            ai_response, usage, endpoint, chat_count = _complete(prompt, messages, type, stage)
+            token_count = usage.total_tokens if usage else 0
+
+        llm_stats.record(stage, endpoint, usage, time.time() - started, chat_count, cache_hit=bool(cached), failed=not ai_response)
+        _finish_chat(ai_response, token_count, session_id, status, _type, cache_key, endpoint.model)
+
+        return ai_response
         
-        # 调用OpenAI API获取回复
-        client = openai.OpenAI(
-            api_key=config.API_KEY if type == "normal" else config.GLM_API_KEY,
-            base_url=config.API_URL if type == "normal" else config.GLM_URL
-        )
-        chat_count = 0
-        while True:
-            if chat_count > 20:
-                ai_response = ""
-                token_count = 0
-                break
-            try:
-            
-                response = client.chat.completions.create(
-                    model=config.API_MODEL_ACTION if type == "normal" else config.GLM_MODEL,
-                    messages=[
-                        {"role": "system", "content": prompt}
-                    ] + messages
-                )
-                ai_response = response.choices[0].message.content
-                token_count = response.usage.total_tokens
+    except Exception as e:
+        logger.warn(e)
+        raise e
 
 
-                break
-            except Exception as e:
-                print(e)
-                time.sleep(10)
-                chat_count += 1
+class XmlBlockParser:
+    """
+    流式回复的增量xml解析器，某个标签的闭合标签到达后立即返回完整的xml块
+    tags中的标签需要是回复中的顶层标签，不能互相嵌套，CDATA中的内容（包括闭合标签）原样跳过
+    """
 
-        # 获取AI回复
-        # 获取本次对话的token数量
-        logger.info(f"本次对话使用token数: {token_count}")
+    def __init__(self, tags=("step",)):
+        # CDATA未闭合时不匹配，等待后续内容到达
+        self.pattern = re.compile("(<(%s)>(?:<!\\[CDATA\\[.*?\\]\\]>|(?!<!\\[CDATA\\[).)*?</\\2>)" % "|".join(tags), re.DOTALL)
+        self.buffer = ""
+        self.pos = 0
 
-        logger.info(ai_response)
+    def feed(self, text: str) -> List[str]:
+        """
+        追加一段回复内容
+        :param text: 新收到的回复内容
+        :return: 本次新完成的xml块列表
+        """
+        self.buffer += text
+        blocks = []
+        for match in self.pattern.finditer(self.buffer, self.pos):
+            blocks.append(match.group(1))
+            self.pos = match.end()
+        return blocks
 
-        cursor.execute('''
-            INSERT INTO messages (session_id, role, content, status) 
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, "assistant", ai_response, status))
 
-        conn.commit()
+async def achat_stream(prompt: str, session_id: str, status: str="default", _type="action", type="normal", limit=4000, cache=False, stage="default", context=None, tags=("step",)):
+    """
+    流式对话，每个xml块的闭合标签到达后立即返回，调用方可以在模型生成后续内容的同时执行已完成的步骤
+    回复在生成结束或调用方提前停止迭代时保存到对话历史
+    :param prompt: 用户输入的提示词
+    :param session_id: 会话ID
+    :param limit: normal类型单条历史消息的最大token数，最新的消息不受限制
+    :param cache: 是否使用LLM响应缓存，需同时开启config.LLM_CACHE_ENABLE
+    :param stage: 调用阶段，用于并发准入的公平排队和模型路由
+    :param context: 上下文消息列表，放在系统提示词之后且不保存到对话历史，用于保持请求前缀稳定
+    :param tags: 需要提取的xml标签
+    :return: 异步生成器，依次返回完整的xml块
+    """
+    started = time.time()
+    parser = XmlBlockParser(tags)
+    messages, cache_key, cached = await asyncio.to_thread(_prepare_chat, prompt, session_id, type, limit, cache, stage, context)
+    usage = None
+    chat_count = 0
+    endpoint = llm_dispatcher.get_endpoints(type, stage)[0]
+    chunks = []
+    token_count = 0
+    complete = False
 
-        # 与服务器交互 - 更新历史记录
-        history_data = {
-            "session_id": session_id,
-            "content": ai_response,
-            "timestamp": int(time.time()),
-            "token_count": token_count,
-            "type": _type
-        }
+    try:
+        if cached:
+            ai_response, token_count = cached
+            cache_key = None
+            logger.info("命中LLM响应缓存")
+            chunks.append(ai_response)
+            for block in parser.feed(ai_response):
+                yield block
+        else:
+            while chat_count <= 20:
+                # 先选择接口再申请名额，密钥退避等待时不占用名额
+                endpoint = await llm_dispatcher.aacquire(type, stage, chat_count)
+                try:
+                    async with allm_slot(stage):
+                        stream = await get_async_client(endpoint.url, endpoint.key).chat.completions.create(
+                            **_create_kwargs(endpoint, prompt, messages),
+                            stream=True,
+                            stream_options={"include_usage": True}
+                        )
+                        async for chunk in stream:
+                            if chunk.usage:
+                                token_count = chunk.usage.total_tokens
+                                usage = chunk.usage
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                chunks.append(chunk.choices[0].delta.content)
+                                for block in parser.feed(chunk.choices[0].delta.content):
+                                    yield block
+                    llm_dispatcher.release(endpoint)
+                    complete = True
+                    break
+                except Exception as e:
+                    logger.warning(f"流式调用模型 {endpoint.model} 失败: {e}")
+                    llm_dispatcher.release(endpoint, e)
+                    if chunks:
+                        # 已经返回过部分xml块，无法重试，保留已收到的内容
+                        break
+                    chat_count += 1
+                except BaseException:
+                    # 调用方提前停止迭代或任务被取消
+                    llm_dispatcher.release(endpoint)
+                    raise
+    finally:
+        # 调用方提前停止迭代时，已收到的回复同样保存到对话历史，不完整的回复不写入缓存
+        ai_response = "".join(chunks)
+        if not complete:
+            cache_key = None
+        llm_stats.record(stage, endpoint, usage, time.time() - started, chat_count, cache_hit=bool(cached), failed=not ai_response)
+        await asyncio.to_thread(_finish_chat, ai_response, token_count, session_id, status, _type, cache_key, endpoint.model)
+
+
+async def aadd_message(message: str, session_id: str="", status: str="default"):
+    """add_message的异步版本，数据库写入和服务器交互在线程中执行，不阻塞事件循环"""
+    return await asyncio.to_thread(add_message, message, session_id, status)
 
-        interact_with_server("history_update", session_id, history_data)
-        
+
+async def achat(prompt: str, session_id: str, status: str="default", _type="action", type="normal", limit=4000, cache=False, stage="default", context=None) -> str:
+    """
+    chat的异步版本，使用异步OpenAI客户端，同一事件循环上可以同时进行多个对话
+    :param prompt: 用户输入的提示词
+    :param session_id: 会话ID
+    :param limit: normal类型单条历史消息的最大token数，最新的消息不受限制
+    :param cache: 是否使用LLM响应缓存，需同时开启config.LLM_CACHE_ENABLE
+    :param stage: 调用阶段，用于并发准入的公平排队和模型路由
+    :param context: 上下文消息列表，放在系统提示词之后且不保存到对话历史，用于保持请求前缀稳定
+    :return: AI的回复
+    """
+
+    try:
+        started = time.time()
+        messages, cache_key, cached = await asyncio.to_thread(_prepare_chat, prompt, session_id, type, limit, cache, stage, context)
+
+        if cached:
+            ai_response, token_count = cached
+            cache_key = None
+            usage, endpoint, chat_count = None, llm_dispatcher.get_endpoints(type, stage)[0], 0
+            logger.info("命中LLM响应缓存")
+        else:
+            ai_response, usage, endpoint, chat_count = await _acomplete(prompt, messages, type, stage)
+            token_count = usage.total_tokens if usage else 0
+
+        llm_stats.record(stage, endpoint, usage, time.time() - started, chat_count, cache_hit=bool(cached), failed=not ai_response)
+        await asyncio.to_thread(_finish_chat, ai_response, token_count, session_id, status, _type, cache_key, endpoint.model)
 
         return ai_response
-        
+
     except Exception as e:
         logger.warn(e)
         raise e
-        return str(e)
-        
-    finally:
-        conn.close()
 
 def update_message_status(message: str, session_id: str) -> str:
     """
@@ -254,8 +994,8 @@ def update_message_status(message: str, session_id: str) -> str:
         cursor.execute('''
             UPDATE messages 
             SET status = 'temp' 
-            WHERE session_id = ? AND content = ?
-        ''', (session_id, message))
+            WHERE session_id = ? AND content IN (?, ?)
+        ''', (session_id, message, blob_store.ref_of(message)))
         conn.commit()
     finally:
         conn.close()
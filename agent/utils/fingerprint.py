@@ -0,0 +1,192 @@
+import json
+from hashlib import md5
+from urllib.parse import parse_qsl, urlsplit
+
+from config import config
+
+# 每次请求都可能不同、但不影响服务端处理结果的请求头，去重时不参与指纹计算
+_VOLATILE_HEADERS = {"user-agent", "accept", "accept-encoding", "accept-language", "connection", "content-length",
+                     "host", "referer", "origin", "cache-control", "pragma", "upgrade-insecure-requests", "dnt", "te",
+                     "keep-alive", "if-none-match", "if-modified-since", "priority", "x-requested-with"}
+# 由请求本身决定的请求头，严格模式下也不参与计算
+_TRANSPORT_HEADERS = {"connection", "content-length", "host", "keep-alive", "te"}
+
+
+def _normalize_url(url):
+    """
+    协议和主机名转小写，去掉默认端口和锚点，空路径补为/
+    路径保持原样，路径穿越等载荷中的../和编码字符都有意义
+    :return: (scheme://host[:port]路径, 查询字符串)
+    """
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != (443 if scheme == "https" else 80):
+        host += f":{port}"
+    return f"{scheme}://{host}{parts.path or '/'}", parts.query
+
+
+def _split_query(query, strict):
+    """查询字符串拆分为参数列表，同名参数保持原有先后顺序"""
+    if strict:
+        pairs = [tuple(item.split("=", 1)) if "=" in item else (item, "") for item in query.split("&") if item]
+    else:
+        pairs = parse_qsl(query, keep_blank_values=True)
+    return sorted(pairs, key=lambda pair: pair[0])
+
+
+def _param_pairs(params):
+    """
+    把request工具的各种参数格式（字典、x-param列表）统一为参数列表
+    """
+    if not params:
+        return []
+    if isinstance(params, dict) and "x-param" in params:
+        params = params["x-param"]
+    if isinstance(params, dict) and "x-name" in params:
+        params = [params]
+    pairs = []
+    if isinstance(params, dict):
+        for key, value in params.items():
+            for v in (value if isinstance(value, list) else [value]):
+                pairs.append((str(key), "" if v is None else str(v)))
+    elif isinstance(params, list):
+        for item in params:
+            if isinstance(item, dict) and "x-name" in item:
+                pairs.append((str(item["x-name"]), "" if item.get("x-value") is None else str(item.get("x-value"))))
+    return pairs
+
+
+def _normalize_headers(headers, strict):
+    """
+    请求头名称转小写后排序
+    非严格模式下去掉易变的请求头，Cookie按名称排序，Content-Type去掉boundary等参数
+    Cookie和Authorization的值在两种模式下都保留，越权测试中替换身份的请求不能被当成重复请求
+    """
+    result = []
+    for name, value in (headers or {}).items():
+        name = str(name).strip().lower()
+        value = "" if value is None else str(value).strip()
+        if name in _TRANSPORT_HEADERS:
+            continue
+        if not strict:
+            if name in _VOLATILE_HEADERS or name.startswith("sec-"):
+                continue
+            if name == "cookie":
+                value = ";".join(sorted(item.strip() for item in value.split(";") if item.strip()))
+            elif name == "content-type":
+                value = value.split(";", 1)[0].strip().lower()
+        result.append((name, value))
+    return sorted(result)
+
+
+def _normalize_body(body, content_type, strict):
+    """json和表单请求体按键排序，其他请求体原样保留"""
+    if body is None or body == "" or body == {}:
+        return ""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="backslashreplace")
+    if not isinstance(body, str):
+        return json.dumps(body, ensure_ascii=False, sort_keys=True, default=str)
+    text = body.strip()
+    if "json" in content_type or text[:1] in ("{", "["):
+        try:
+            return json.dumps(json.loads(text), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        except ValueError:
+            pass
+    if "x-www-form-urlencoded" in content_type:
+        return _split_query(text, strict)
+    return body
+
+
+def canonical_request(method, url, headers=None, params=None, body=None, files=None, strict=False):
+    """
+    生成规范化的请求表示，等价的请求得到相同的结果
+    :param method: 请求方法
+    :param url: 请求URL
+    :param headers: 请求头
+    :param params: 请求参数，GET请求合并到查询参数，其他请求作为表单参数
+    :param body: 请求体（raw）
+    :param files: 上传文件配置
+    :param strict: 严格模式用于判断两个请求的响应是否可以互相替代（响应缓存），
+                   保留全部请求头和查询参数的原始编码；非严格模式用于页面去重，忽略User-Agent等易变请求头
+    :return: 规范化后的字典
+    """
+    method = str(method or "GET").upper()
+    base, query = _normalize_url(url)
+    query_pairs = _split_query(query, strict)
+    param_pairs = _param_pairs(params)
+    form_pairs = []
+    if param_pairs:
+        if method == "GET":
+            # 与request工具一致：params中的参数覆盖URL中的同名参数
+            names = {name for name, _ in param_pairs}
+            query_pairs = sorted([pair for pair in query_pairs if pair[0] not in names] + param_pairs,
+                                 key=lambda pair: pair[0])
+        else:
+            # 页面记录的params中混有URL中的查询参数，去掉后剩下的才是表单参数
+            form_pairs = sorted(set(param_pairs) - set(query_pairs))
+    normalized_headers = _normalize_headers(headers, strict)
+    content_type = dict(normalized_headers).get("content-type", "").lower()
+
+    file_items = []
+    if isinstance(files, dict) and files.get("item"):
+        items = files["item"] if isinstance(files["item"], list) else [files["item"]]
+        for item in items:
+            file_items.append([str(item.get("name", "")), str(item.get("filename", "")),
+                               md5(str(item.get("content", "")).encode("utf-8")).hexdigest()])
+        file_items.sort()
+
+    return {
+        "method": method,
+        "url": base,
+        "query": [list(pair) for pair in query_pairs],
+        "header": [list(pair) for pair in normalized_headers],
+        "form": [list(pair) for pair in form_pairs],
+        "body": _normalize_body(body, content_type, strict),
+        "files": file_items
+    }
+
+
+def fingerprint(method, url, headers=None, params=None, body=None, files=None, strict=False, scope=None):
+    """
+    计算请求指纹，参数见canonical_request
+    :param scope: 指纹的作用范围，默认为当前任务ID，不同任务的相同请求指纹不同
+    :return: md5摘要
+    """
+    canonical = canonical_request(method, url, headers, params, body, files, strict)
+    canonical["scope"] = (config.TASK_ID or "") if scope is None else scope
+    payload = json.dumps(canonical, ensure_ascii=False, sort_keys=True, default=str)
+    return md5(payload.encode("utf-8")).hexdigest()
+
+
+def request_fingerprint(request, strict=False, scope=None):
+    """
+    计算request工具参数或页面记录中请求的指纹
+    :param request: 包含url、method、header、params、raw、files的字典
+    :return: md5摘要
+    """
+    return fingerprint(request.get("method", "GET"), request.get("url", ""), request.get("header") or {},
+                       request.get("params") or request.get("param"), request.get("raw"), request.get("files"),
+                       strict, scope)
+
+
+def page_fingerprint(request, content, scope=None):
+    """
+    按请求方法、参数和响应内容计算页面指纹，不同路径返回相同内容的页面（如统一的错误页）视为同一页面
+    :param request: 页面记录中的请求
+    :param content: 响应内容
+    :return: md5摘要
+    """
+    canonical = canonical_request(request.get("method", "GET"), request.get("url", ""), request.get("header") or {},
+                                  request.get("params") or request.get("param"), request.get("raw"), request.get("files"))
+    payload = json.dumps([canonical["method"], canonical["query"], canonical["form"], canonical["body"],
+                          canonical["files"], str(content), (config.TASK_ID or "") if scope is None else scope],
+                         ensure_ascii=False, default=str)
+    return md5(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from config import config
+from utils.logger import logger
+
+
+def parse_retry_after(value):
+    """
+    解析Retry-After响应头
+    :param value: 秒数或HTTP日期
+    :return: 需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class _HostState:
+    def __init__(self):
+        self.limit = float(config.HOST_LIMIT_INITIAL)
+        self.in_flight = 0
+        self.latency = 0.0  # 延迟的指数移动平均（秒）
+        self.baseline = 0.0  # 健康时的延迟基线
+        self.requests = 0
+        self.overloads = 0
+        self.waits = 0
+        self.last_decrease = 0.0
+        self.blocked_until = 0.0  # 按Retry-After暂停发送新请求，直到该时间
+
+
+class HostLimiter:
+    """
+    按目标主机自适应调整并发上限（AIMD）
+    响应正常且延迟没有明显升高时每个窗口并发上限加1，出现config.HOST_LIMIT_OVERLOAD_STATUS中的状态码、
+    超时或连接错误时上限减半，同一时间窗口内的多次失败只减一次，避免一次突发把上限降到最低
+    普通的500通常是请求触发了程序错误（注入测试时很常见），不代表目标过载，默认不降低上限
+    过载响应带有Retry-After时，在指定时间内不再向该主机发送新请求
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.hosts = {}
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = _HostState()
+        return state
+
+    def _try_acquire(self, host):
+        state = self._state(host)
+        if state.blocked_until and time.time() < state.blocked_until:
+            return False
+        if state.in_flight < int(state.limit):
+            state.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, host):
+        """获取一个并发名额，达到上限时阻塞等待"""
+        with self.condition:
+            if not self._try_acquire(host):
+                self._state(host).waits += 1
+                while not self._try_acquire(host):
+                    self.condition.wait(1)
+
+    async def aacquire(self, host):
+        """acquire的异步版本，等待时不阻塞事件循环"""
+        with self.lock:
+            if self._try_acquire(host):
+                return
+            self._state(host).waits += 1
+        while True:
+            await asyncio.sleep(0.02)
+            with self.lock:
+                if self._try_acquire(host):
+                    return
+
+    def release(self, host, latency, status=None, error=None, retry_after=None):
+        """
+        释放名额并根据本次请求结果调整并发上限
+        :param host: 目标主机
+        :param latency: 请求耗时（秒）
+        :param status: 响应状态码，请求失败时为None
+        :param error: 请求异常，超时和连接错误视为过载，状态码和异常都为None时（请求被取消）不调整
+        :param retry_after: Retry-After响应头，只在过载状态码时生效
+        """
+        message = None
+        with self.condition:
+            state = self._state(host)
+            state.in_flight -= 1
+            if status is None and error is None:
+                self.condition.notify_all()
+                return
+            state.requests += 1
+            overloaded = status in config.HOST_LIMIT_OVERLOAD_STATUS or isinstance(error, (TimeoutError, ConnectionError))
+            if error is None:
+                state.latency = latency if not state.latency else state.latency * 0.8 + latency * 0.2
+                if not state.baseline or state.latency < state.baseline:
+                    state.baseline = state.latency
+                else:
+                    # 基线缓慢跟随，适应目标本身变慢的情况
+                    state.baseline = state.baseline * 0.99 + state.latency * 0.01
+
+            previous = int(state.limit)
+            now = time.time()
+            if overloaded:
+                state.overloads += 1
+                wait = parse_retry_after(retry_after) if status else None
+                if wait:
+                    wait = min(wait, config.HOST_LIMIT_MAX_RETRY_AFTER)
+                    state.blocked_until = max(state.blocked_until, now + wait)
+                    message = f"目标 {host} 要求 {wait:.0f} 秒后重试（状态码 {status}），暂停发送新请求"
+                # 同一个延迟窗口内只减一次
+                if now - state.last_decrease > max(state.latency, 1.0):
+                    state.limit = max(config.HOST_LIMIT_MIN, state.limit * config.HOST_LIMIT_DECREASE)
+                    state.last_decrease = now
+            elif error is None and state.latency <= state.baseline * config.HOST_LIMIT_LATENCY_FACTOR:
+                state.limit = min(config.HOST_LIMIT_MAX, state.limit + 1 / state.limit)
+
+            current = int(state.limit)
+            # 下调时都记录日志，上调只在每增加4时记录
+            if current < previous or (current > previous and current % 4 == 0):
+                reason = f"状态码 {status}" if status else type(error).__name__ if error else "响应正常"
+                limit_message = f"目标 {host} 并发上限 {previous} -> {current}（{reason}，平均延迟 {state.latency * 1000:.0f}ms）"
+                message = f"{message}；{limit_message}" if message else limit_message
+            self.condition.notify_all()
+        if message:
+            if current < previous or overloaded:
+                logger.warn(message)
+            else:
+                logger.info(message)
+
+    def get_stats(self):
+        """获取各目标主机的并发上限和延迟"""
+        with self.lock:
+            return {host: {
+                "limit": int(state.limit),
+                "in_flight": state.in_flight,
+                "latency_ms": round(state.latency * 1000, 1),
+                "baseline_ms": round(state.baseline * 1000, 1),
+                "requests": state.requests,
+                "overloads": state.overloads,
+                "waits": state.waits,
+                "blocked_for": round(max(0.0, state.blocked_until - time.time()), 1)
+            } for host, state in self.hosts.items()}
+
+
+limiter = HostLimiter()
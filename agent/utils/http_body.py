@@ -0,0 +1,149 @@
+import codecs
+import hashlib
+import os
+import zlib
+
+from config import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 请求时声明支持的压缩格式，安装了brotli时才声明br
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+
+# 解压时每次输入的数据块大小
+_CHUNK = 64 * 1024
+
+_binary_types = ("image/", "audio/", "video/", "font/", "application/zip",
+                 "application/x-zip", "application/gzip", "application/x-gzip", "application/x-tar",
+                 "application/x-7z", "application/x-rar", "application/pdf", "application/wasm",
+                 "application/x-executable", "application/x-sharedlib", "application/java-archive")
+# 下载的文本文件、文件包含读取的内容、vnd.api+json等接口也会使用这些类型，需要检查内容
+_ambiguous_types = ("application/octet-stream", "application/vnd.")
+# 文本类型优先于魔数判断，避免把以特殊字节开头的文本误判为二进制
+_text_types = ("text/", "application/json", "application/javascript", "application/xml", "application/xhtml",
+               "image/svg", "application/x-www-form-urlencoded")
+_text_suffixes = ("+json", "+xml")
+# 检查是否为文本时读取的字节数
+_SNIFF_BYTES = 8192
+_magic = (b"\x89PNG", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"%PDF", b"PK\x03\x04", b"\x1f\x8b", b"\x7fELF",
+          b"7z\xbc\xaf\x27\x1c", b"Rar!\x1a\x07", b"\x00asm", b"\xca\xfe\xba\xbe", b"wOFF", b"wOF2")
+# BMP信息头的长度
+_bmp_header_sizes = (12, 40, 52, 56, 64, 108, 124)
+
+
+def _decompress(decompressor, data, max_size):
+    """
+    按块解压，输出超过max_size时停止
+    :return: (解压后的数据, 是否被截断)
+    """
+    output = []
+    size = 0
+    for i in range(0, len(data), _CHUNK):
+        chunk = decompressor.decompress(data[i:i + _CHUNK], max_size - size + 1)
+        output.append(chunk)
+        size += len(chunk)
+        if size > max_size or getattr(decompressor, "unconsumed_tail", b""):
+            return b"".join(output)[:max_size], True
+    return b"".join(output), False
+
+
+def decode_body(data, content_encoding, max_size=None):
+    """
+    按Content-Encoding解压响应体，不支持的编码或解压失败时返回原始数据
+    :param data: 原始响应体
+    :param content_encoding: Content-Encoding响应头
+    :param max_size: 解压后的最大字节数，默认为config.REQUEST_MAX_BODY
+    :return: (响应体, 是否被截断)
+    """
+    max_size = max_size or config.REQUEST_MAX_BODY
+    encoding = (content_encoding or "").strip().lower()
+    if not data or encoding in ("", "identity"):
+        return data[:max_size], len(data) > max_size
+    try:
+        if encoding in ("gzip", "x-gzip"):
+            return _decompress(zlib.decompressobj(16 + zlib.MAX_WBITS), data, max_size)
+        if encoding == "deflate":
+            # deflate可能带zlib头，也可能是裸数据
+            try:
+                return _decompress(zlib.decompressobj(zlib.MAX_WBITS), data, max_size)
+            except zlib.error:
+                return _decompress(zlib.decompressobj(-zlib.MAX_WBITS), data, max_size)
+        if encoding == "br" and brotli:
+            decompressor = brotli.Decompressor()
+            output = []
+            size = 0
+            for i in range(0, len(data), _CHUNK):
+                chunk = decompressor.process(data[i:i + _CHUNK])
+                output.append(chunk)
+                size += len(chunk)
+                if size > max_size:
+                    return b"".join(output)[:max_size], True
+            return b"".join(output), False
+    except (zlib.error, ValueError):
+        pass
+    return data[:max_size], len(data) > max_size
+
+
+def _is_bmp(data):
+    """BM开头不足以判断，还要求保留字段为0且信息头长度合法"""
+    return (len(data) >= 26 and data.startswith(b"BM") and data[6:10] == b"\x00\x00\x00\x00"
+            and int.from_bytes(data[14:18], "little") in _bmp_header_sizes)
+
+
+def _is_pe(data):
+    """MZ开头不足以判断，还要求e_lfanew指向PE\\0\\0签名"""
+    if len(data) < 64 or not data.startswith(b"MZ"):
+        return False
+    offset = int.from_bytes(data[60:64], "little")
+    return data[offset:offset + 4] == b"PE\x00\x00"
+
+
+def _is_text(data):
+    """开头部分没有NUL字节且是合法的UTF-8（允许末尾被截断的多字节字符）"""
+    sample = data[:_SNIFF_BYTES]
+    if b"\x00" in sample:
+        return False
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _has_magic(data):
+    return data.startswith(_magic) or _is_bmp(data) or _is_pe(data)
+
+
+def is_binary(data, content_type=""):
+    """
+    根据Content-Type和文件头判断响应体是否为二进制内容
+    :param data: 响应体
+    :param content_type: Content-Type响应头
+    """
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if mime.startswith(_text_types) or mime.endswith(_text_suffixes):
+        return False
+    if mime.startswith(_ambiguous_types):
+        return _has_magic(data) or not _is_text(data)
+    if mime.startswith(_binary_types):
+        return True
+    if _has_magic(data):
+        return True
+    # 没有类型信息时，前1KB中包含NUL字节视为二进制
+    return b"\x00" in data[:1024]
+
+
+def save_binary(data):
+    """
+    将二进制响应体按内容摘要保存到临时目录，相同内容只保存一份
+    :return: 文件路径
+    """
+    os.makedirs(config.TEMP_PATH, exist_ok=True)
+    path = os.path.join(config.TEMP_PATH, hashlib.sha256(data).hexdigest()[:32] + ".bin")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
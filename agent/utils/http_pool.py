@@ -0,0 +1,234 @@
+import base64
+import http.client
+import ssl
+import threading
+import time
+import urllib.request
+from urllib.parse import unquote, urlsplit
+
+from config import config
+
+# 复用空闲连接时服务端可能已经关闭连接，这些异常出现时换一个新连接重试一次
+_STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+# 服务端可能已经处理了失效连接上的请求，只有幂等的请求方法可以重发（RFC 7230 6.3.1）
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"))
+
+_ssl_context = ssl.create_default_context()
+_ssl_context.check_hostname = False
+_ssl_context.verify_mode = ssl.CERT_NONE
+
+
+def get_proxy(url):
+    """
+    按http_proxy、https_proxy和no_proxy环境变量获取URL使用的代理，与urllib默认的ProxyHandler一致
+    :return: 代理URL，不使用代理时返回None
+    """
+    parts = urlsplit(url)
+    proxy = urllib.request.getproxies().get((parts.scheme or "http").lower())
+    if not proxy or urllib.request.proxy_bypass(parts.hostname or ""):
+        return None
+    return proxy if "://" in proxy else "http://" + proxy
+
+
+def _proxy_auth(proxy_parts):
+    """代理URL中带有用户名密码时生成Proxy-Authorization请求头"""
+    if proxy_parts.username is None:
+        return {}
+    credential = f"{unquote(proxy_parts.username)}:{unquote(proxy_parts.password or '')}"
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(credential.encode()).decode()}
+
+
+class PooledResponse:
+    """已读取完整响应体的响应，连接在读取后立即归还连接池"""
+
+    def __init__(self, url, status, reason, headers, body, truncated=False):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.truncated = truncated  # 响应体超过上限，只读取了前max_body字节
+
+
+class ConnectionPool:
+    """
+    按(协议, 主机, 端口)分组的HTTP长连接池
+    每个主机最多保留max_per_host个空闲连接，空闲超过idle_timeout秒的连接在下次取用时关闭
+    """
+
+    def __init__(self, max_per_host=10, idle_timeout=30):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        # (scheme, host, port, 代理) -> [(连接, 归还时间)]，后归还的在末尾
+        self.idle = {}
+        self.stats = {
+            "requests": 0,
+            "reused": 0,
+            "created": 0,
+            "expired": 0,
+            "discarded": 0,
+            "stale_retries": 0
+        }
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def _acquire(self, key, timeout):
+        """
+        取一个空闲连接，没有时新建连接
+        :return: (连接, 是否复用)
+        """
+        now = time.time()
+        expired = []
+        conn = None
+        with self.lock:
+            conns = self.idle.get(key, [])
+            while conns:
+                candidate, released_at = conns.pop()
+                if now - released_at > self.idle_timeout:
+                    expired.append(candidate)
+                    continue
+                conn = candidate
+                break
+            self.stats["expired"] += len(expired)
+        for candidate in expired:
+            candidate.close()
+
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            self._count("reused")
+            return conn, True
+
+        return self._connect(key, timeout), False
+
+    def _connect(self, key, timeout):
+        """新建连接，https不校验证书，经过代理的https请求通过CONNECT建立隧道"""
+        scheme, host, port, proxy = key
+        if proxy:
+            proxy_parts = urlsplit(proxy)
+            proxy_host, proxy_port = proxy_parts.hostname, proxy_parts.port or 8080
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=timeout, context=_ssl_context)
+                conn.set_tunnel(host, port, headers=_proxy_auth(proxy_parts))
+            else:
+                conn = http.client.HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+        elif scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=_ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        self._count("created")
+        return conn
+
+    def _release(self, key, conn):
+        """归还连接，超出每个主机的空闲连接上限时关闭最早归还的连接"""
+        closed = None
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            conns.append((conn, time.time()))
+            if len(conns) > self.max_per_host:
+                closed = conns.pop(0)[0]
+                self.stats["discarded"] += 1
+        if closed is not None:
+            closed.close()
+
+    def request(self, method, url, headers=None, body=None, timeout=60, max_body=None):
+        """
+        发送请求并读取完整响应，不处理重定向
+        :param method: 请求方法
+        :param url: 完整URL
+        :param headers: 请求头字典，原样发送
+        :param body: 请求体（bytes）
+        :param timeout: 连接和读取超时（秒）
+        :param max_body: 响应体最大读取字节数，默认为config.REQUEST_MAX_BODY，超出时截断并关闭连接
+        :return: PooledResponse
+        """
+        max_body = max_body or config.REQUEST_MAX_BODY
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower() or "http"
+        if scheme not in ("http", "https"):
+            raise ValueError(f"不支持的协议: {scheme}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        proxy = get_proxy(url)
+        key = (scheme, parts.hostname, port, proxy)
+        selector = parts.path or "/"
+        if parts.query:
+            selector += "?" + parts.query
+        headers = dict(headers or {})
+        if proxy and scheme == "http":
+            # 经过代理的http请求使用完整URL作为请求路径
+            selector = f"http://{parts.netloc.rpartition('@')[2]}{selector}"
+            headers.update(_proxy_auth(urlsplit(proxy)))
+
+        self._count("requests")
+        conn, reused = self._acquire(key, timeout)
+        while True:
+            try:
+                conn.request(method, selector, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read(max_body + 1)
+            except _STALE_ERRORS:
+                conn.close()
+                if not reused or method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                # 服务端已关闭空闲连接，换新连接重试一次
+                self._count("stale_retries")
+                conn, reused = self._connect(key, timeout), False
+                continue
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        truncated = len(data) > max_body
+        if truncated:
+            # 剩余响应体没有读取，连接不能复用
+            data = data[:max_body]
+            conn.close()
+        elif response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return PooledResponse(url, response.status, response.reason, response.headers, data, truncated)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self.lock:
+            conns = [conn for items in self.idle.values() for conn, _ in items]
+            self.idle = {}
+        for conn in conns:
+            conn.close()
+
+    def get_stats(self):
+        """获取连接池统计，命中率为成功复用空闲连接的请求比例（不含复用失败后重试的请求）"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["hosts"] = len([conns for conns in self.idle.values() if conns])
+            stats["idle"] = sum(len(conns) for conns in self.idle.values())
+        stats["hit_rate"] = round((stats["reused"] - stats["stale_retries"]) / stats["requests"], 4) if stats["requests"] else 0
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """获取进程内共享的连接池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(config.HTTP_POOL_MAX_PER_HOST, config.HTTP_POOL_IDLE_TIMEOUT)
+        return _pool
+
+
+def request(method, url, headers=None, body=None, timeout=60, max_body=None):
+    """使用共享连接池发送请求，参数见ConnectionPool.request"""
+    return get_pool().request(method, url, headers, body, timeout, max_body)
+
+
+def get_stats():
+    return get_pool().get_stats()
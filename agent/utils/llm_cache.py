@@ -0,0 +1,182 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from config import config
+from utils.logger import logger
+
+_lock = threading.Lock()
+_initialized = False
+_put_count = 0
+_stats = {
+    "hit": 0,
+    "miss": 0,
+    "store": 0,
+    "evict": 0
+}
+
+
+def make_key(model, prompt, messages):
+    """
+    根据模型、系统提示词和消息历史生成缓存键
+    :param model: 模型名称
+    :param prompt: 系统提示词
+    :param messages: 消息历史列表
+    :return: sha256摘要
+    """
+    payload = json.dumps({
+        "model": model,
+        "system": prompt,
+        "messages": messages
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _get_connection():
+    conn = sqlite3.connect(config.LLM_CACHE_PATH, timeout=30)
+    return conn, conn.cursor()
+
+
+def _init_cache():
+    """初始化缓存表，只在第一次使用时执行"""
+    global _initialized
+    if _initialized:
+        return
+    with _lock:
+        if _initialized:
+            return
+        conn, cursor = _get_connection()
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT,
+                    token_count INTEGER,
+                    size INTEGER,
+                    created_at REAL,
+                    last_hit REAL,
+                    hits INTEGER DEFAULT 0
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_hit ON llm_cache (last_hit)")
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        _initialized = True
+
+
+def get(cache_key):
+    """
+    查询缓存
+    :param cache_key: 缓存键
+    :return: (回复内容, token数)，未命中返回None
+    """
+    _init_cache()
+    now = time.time()
+    conn, cursor = _get_connection()
+    try:
+        cursor.execute("SELECT response, token_count, created_at FROM llm_cache WHERE cache_key = ?", (cache_key,))
+        row = cursor.fetchone()
+        if row and now - row[2] > config.LLM_CACHE_MAX_AGE:
+            # 过期的缓存直接删除
+            cursor.execute("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,))
+            conn.commit()
+            row = None
+        if not row:
+            with _lock:
+                _stats["miss"] += 1
+            return None
+        cursor.execute("UPDATE llm_cache SET last_hit = ?, hits = hits + 1 WHERE cache_key = ?", (now, cache_key))
+        conn.commit()
+        with _lock:
+            _stats["hit"] += 1
+        return row[0], row[1]
+    except sqlite3.Error as e:
+        logger.warn(f"读取LLM缓存失败: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def put(cache_key, model, response, token_count=0):
+    """
+    写入缓存，空回复不缓存
+    :param cache_key: 缓存键
+    :param model: 模型名称
+    :param response: AI回复
+    :param token_count: 本次对话使用的token数
+    """
+    global _put_count
+    if not response:
+        return
+    _init_cache()
+    now = time.time()
+    conn, cursor = _get_connection()
+    try:
+        cursor.execute('''
+            INSERT OR REPLACE INTO llm_cache (cache_key, model, response, token_count, size, created_at, last_hit, hits)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+        ''', (cache_key, model, response, token_count, len(response.encode("utf-8")), now, now))
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warn(f"写入LLM缓存失败: {e}")
+        return
+    finally:
+        cursor.close()
+        conn.close()
+
+    with _lock:
+        _stats["store"] += 1
+        _put_count += 1
+        need_evict = _put_count % 50 == 0
+    if need_evict:
+        evict()
+
+
+def evict():
+    """按过期时间、条目数和总大小淘汰缓存，优先淘汰最久未命中的条目"""
+    _init_cache()
+    conn, cursor = _get_connection()
+    try:
+        cursor.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - config.LLM_CACHE_MAX_AGE,))
+        evicted = cursor.rowcount
+
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache")
+        count, total_size = cursor.fetchone()
+        if count > config.LLM_CACHE_MAX_ENTRIES or total_size > config.LLM_CACHE_MAX_BYTES:
+            cursor.execute("SELECT cache_key, size FROM llm_cache ORDER BY last_hit ASC")
+            remove_keys = []
+            for cache_key, size in cursor.fetchall():
+                if count <= config.LLM_CACHE_MAX_ENTRIES and total_size <= config.LLM_CACHE_MAX_BYTES:
+                    break
+                remove_keys.append((cache_key,))
+                count -= 1
+                total_size -= size
+            cursor.executemany("DELETE FROM llm_cache WHERE cache_key = ?", remove_keys)
+            evicted += len(remove_keys)
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warn(f"淘汰LLM缓存失败: {e}")
+        return
+    finally:
+        cursor.close()
+        conn.close()
+
+    if evicted:
+        with _lock:
+            _stats["evict"] += evicted
+        logger.info(f"LLM缓存淘汰 {evicted} 条记录")
+
+
+def get_stats():
+    """获取缓存命中统计"""
+    with _lock:
+        stats = dict(_stats)
+    total = stats["hit"] + stats["miss"]
+    stats["hit_rate"] = round(stats["hit"] / total, 4) if total else 0
+    return stats
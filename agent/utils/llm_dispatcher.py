@@ -0,0 +1,214 @@
+import asyncio
+import random
+import threading
+import time
+from collections import namedtuple
+
+import openai
+
+from config import config
+from utils.logger import logger
+
+Endpoint = namedtuple("Endpoint", ["name", "url", "key", "model", "timeout"], defaults=[None])
+
+_lock = threading.Lock()
+# (url, key) -> 密钥状态，重新读取配置后依然保留
+_states = {}
+
+
+def _new_state(endpoint):
+    return {
+        "name": endpoint.name,
+        "in_flight": 0,
+        "requests": 0,
+        "errors": 0,
+        "rate_limited": 0,
+        "failures": 0,
+        "backoff_until": 0
+    }
+
+
+def _provider_endpoints(provider):
+    """
+    获取某个服务商下所有配置了密钥的接口
+    :param provider: 服务商名称，default为当前配置的接口（开启调度时为调度池）
+    :return: Endpoint列表
+    """
+    if provider == "default":
+        return _default_endpoints()
+    if provider == "glm":
+        return [Endpoint("glm", config.GLM_URL, config.GLM_API_KEY, config.GLM_MODEL)]
+    if provider == "deepseek":
+        keys = [config.DEEPSEEK_API_KEY]
+        url, model = config.DEEPSEEK_API_URL, config.DEEPSEEK_API_MODEL_ACTION
+    elif provider == "tencent":
+        keys = [config.TENCENT_API_KEY] + config.API_KEYS
+        url, model = config.TENCENT_API_URL, config.TENCENT_API_MODEL_ACTION
+    elif provider == "silcon":
+        keys = [config.SILCON_API_KEY]
+        url, model = config.SILCON_API_URL, config.SILCON_API_MODEL_ACTION
+    else:
+        logger.warn(f"未知的LLM服务商: {provider}")
+        return []
+    return [Endpoint(provider, url, key, model) for key in dict.fromkeys(keys) if key]
+
+
+def _default_endpoints():
+    """未开启调度时只返回当前配置的接口，开启后返回LLM_DISPATCH_PROVIDERS中所有配置了密钥的接口"""
+    default = [Endpoint("default", config.API_URL, config.API_KEY, config.API_MODEL_ACTION)]
+    if not config.LLM_DISPATCH_ENABLE:
+        return default
+    endpoints = []
+    for provider in config.LLM_DISPATCH_PROVIDERS:
+        endpoints.extend(_provider_endpoints(provider))
+    return endpoints or default
+
+
+def get_endpoints(type="normal", stage="default", attempt=0):
+    """
+    获取可用的接口列表
+    large类型固定使用GLM长上下文模型，normal类型优先按LLM_ROUTES中该阶段的路由选择，重试时切换到备用路由
+    :param type: 模型类型，normal或large
+    :param stage: 调用阶段
+    :param attempt: 第几次尝试，从0开始
+    :return: Endpoint列表
+    """
+    if type != "normal":
+        return _provider_endpoints("glm")
+
+    route = config.LLM_ROUTES.get(stage)
+    if route:
+        if attempt and route.get("fallback"):
+            endpoints = _provider_endpoints(route["fallback"])
+        else:
+            endpoints = _provider_endpoints(route.get("provider", "default"))
+            if route.get("model"):
+                endpoints = [endpoint._replace(model=route["model"]) for endpoint in endpoints]
+        if endpoints:
+            return [endpoint._replace(timeout=route.get("timeout")) for endpoint in endpoints]
+
+    return _default_endpoints()
+
+
+def _get_state(endpoint):
+    state = _states.get((endpoint.url, endpoint.key))
+    if state is None:
+        state = _states[(endpoint.url, endpoint.key)] = _new_state(endpoint)
+    return state
+
+
+def _try_acquire(type, stage, attempt):
+    """
+    选择一个不在退避期且进行中请求最少的接口
+    :return: (接口, 需要等待的秒数)，有可用接口时等待时间为0
+    """
+    endpoints = get_endpoints(type, stage, attempt)
+    now = time.time()
+    with _lock:
+        states = [(endpoint, _get_state(endpoint)) for endpoint in endpoints]
+        available = [(endpoint, state) for endpoint, state in states if state["backoff_until"] <= now]
+        if not available:
+            return None, min(state["backoff_until"] for _, state in states) - now
+        least = min(state["in_flight"] for _, state in available)
+        endpoint, state = random.choice([item for item in available if item[1]["in_flight"] == least])
+        state["in_flight"] += 1
+        state["requests"] += 1
+        return endpoint, 0
+
+
+def acquire(type="normal", stage="default", attempt=0):
+    """
+    获取一个接口，所有接口都在退避期时等待最早结束退避的接口
+    使用完成后必须调用release
+    :param type: 模型类型
+    :param stage: 调用阶段，用于选择路由
+    :param attempt: 第几次尝试，重试时使用备用路由
+    :return: Endpoint
+    """
+    while True:
+        endpoint, wait = _try_acquire(type, stage, attempt)
+        if endpoint:
+            return endpoint
+        time.sleep(wait)
+
+
+async def aacquire(type="normal", stage="default", attempt=0):
+    """acquire的异步版本，等待时不阻塞事件循环"""
+    while True:
+        endpoint, wait = _try_acquire(type, stage, attempt)
+        if endpoint:
+            return endpoint
+        await asyncio.sleep(wait)
+
+
+def try_acquire_provider(provider, exclude=None):
+    """
+    不等待地获取某个服务商下的一个接口，用于对冲请求
+    :param provider: 服务商名称
+    :param exclude: 需要排除的接口（主请求正在使用的接口）
+    :return: Endpoint，没有可用接口时返回None
+    """
+    now = time.time()
+    with _lock:
+        available = []
+        for endpoint in _provider_endpoints(provider):
+            if exclude and (endpoint.url, endpoint.key) == (exclude.url, exclude.key):
+                continue
+            state = _get_state(endpoint)
+            if state["backoff_until"] <= now:
+                available.append((endpoint, state))
+        if not available:
+            return None
+        least = min(state["in_flight"] for _, state in available)
+        endpoint, state = random.choice([item for item in available if item[1]["in_flight"] == least])
+        state["in_flight"] += 1
+        state["requests"] += 1
+        return endpoint._replace(timeout=exclude.timeout if exclude else None)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def release(endpoint, error=None):
+    """
+    释放接口，请求失败时对该密钥进行指数退避（带随机抖动），429时优先使用Retry-After
+    :param endpoint: acquire返回的接口
+    :param error: 请求异常，成功时为None
+    """
+    with _lock:
+        state = _get_state(endpoint)
+        state["in_flight"] -= 1
+        if error is None:
+            state["failures"] = 0
+            return
+        state["errors"] += 1
+        state["failures"] += 1
+        delay = random.uniform(0, min(config.LLM_BACKOFF_MAX, config.LLM_BACKOFF_BASE * 2 ** state["failures"]))
+        if isinstance(error, openai.RateLimitError):
+            state["rate_limited"] += 1
+            delay = max(delay, _retry_after(error))
+        state["backoff_until"] = max(state["backoff_until"], time.time() + delay)
+    logger.warn(f"LLM接口 {endpoint.name}(****{endpoint.key[-4:]}) 请求失败，退避 {delay:.1f} 秒: {error}")
+
+
+def get_stats():
+    """获取各密钥的调度统计，密钥只保留后4位"""
+    now = time.time()
+    with _lock:
+        return [{
+            "name": state["name"],
+            "url": url,
+            "key": f"****{key[-4:]}" if key else "",
+            "in_flight": state["in_flight"],
+            "requests": state["requests"],
+            "errors": state["errors"],
+            "rate_limited": state["rate_limited"],
+            "backoff": round(max(state["backoff_until"] - now, 0), 1)
+        } for (url, key), state in _states.items()]
@@ -0,0 +1,263 @@
+# OpenAI兼容的本地LLM替身服务，用于离线压测和回归测试
+# record模式：将请求转发到真实服务商，并把(提示词摘要 -> 回复)保存到夹具库
+# replay模式：只从夹具库返回回复，可以注入固定延迟或按录制时的耗时回放，未录制的请求返回404
+# 使用方式：
+#   python -m utils.llm_standin --mode record --upstream-url https://api.deepseek.com --upstream-key sk-xxx
+#   python -m utils.llm_standin --mode replay --latency 0.5
+# 然后将config.API_URL指向 http://127.0.0.1:8765/v1
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+
+from config import config
+from utils import llm_cache
+from utils.logger import logger
+
+
+class FixtureStore:
+    """基于SQLite的夹具库，键与LLM响应缓存相同，由模型、系统提示词和消息历史计算"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_fixtures (
+                    fixture_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT,
+                    usage TEXT,
+                    latency REAL,
+                    created_at REAL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(body):
+        """
+        根据请求体计算夹具键，第一条system消息作为系统提示词
+        :param body: chat.completions请求体
+        :return: 夹具键
+        """
+        messages = body.get("messages", [])
+        prompt = ""
+        if messages and messages[0].get("role") == "system":
+            prompt = messages[0].get("content", "")
+            messages = messages[1:]
+        return llm_cache.make_key(body.get("model", ""), prompt, messages)
+
+    def get(self, key):
+        """
+        :return: {"content", "usage", "latency"}，未录制返回None
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            row = conn.execute("SELECT content, usage, latency FROM llm_fixtures WHERE fixture_key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return {"content": row[0], "usage": json.loads(row[1]), "latency": row[2]}
+
+    def put(self, key, model, content, usage, latency=0.0):
+        with self.lock:
+            conn = sqlite3.connect(self.path)
+            try:
+                conn.execute('''
+                    INSERT OR REPLACE INTO llm_fixtures (fixture_key, model, content, usage, latency, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (key, model, content, json.dumps(usage), latency, time.time()))
+                conn.commit()
+            finally:
+                conn.close()
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store, mode="replay", upstream_url=None, upstream_key=None, latency=0.0, latency_scale=0.0):
+        super().__init__(address, _Handler)
+        self.store = store
+        self.mode = mode
+        self.upstream = openai.OpenAI(base_url=upstream_url, api_key=upstream_key) if mode == "record" else None
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "recorded": 0}
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def complete(self, body):
+        """
+        获取请求对应的回复，record模式下未命中时转发到真实服务商并保存
+        :return: (夹具, 是否命中)，replay模式未命中时夹具为None
+        """
+        key = FixtureStore.make_key(body)
+        fixture = self.store.get(key)
+        if fixture:
+            return fixture, True
+        if self.mode != "record":
+            return None, False
+
+        started = time.time()
+        response = self.upstream.chat.completions.create(model=body.get("model"), messages=body.get("messages", []))
+        fixture = {
+            "content": response.choices[0].message.content,
+            "usage": response.usage.model_dump() if response.usage else {},
+            "latency": time.time() - started
+        }
+        self.store.put(key, body.get("model"), fixture["content"], fixture["usage"], fixture["latency"])
+        self.count("recorded")
+        return fixture, False
+
+    def delay(self, fixture, hit):
+        """注入的延迟：固定延迟加上按比例回放的录制耗时，刚录制的请求已经产生了真实耗时"""
+        return self.latency + (self.latency_scale * fixture["latency"] if hit else 0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.server.stats_lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+
+        self.server.count("requests")
+        try:
+            fixture, hit = self.server.complete(body)
+        except Exception as e:
+            logger.warn(f"转发LLM请求失败: {e}")
+            self._send_json(502, {"error": {"message": str(e), "type": "upstream_error"}})
+            return
+        if not fixture:
+            self.server.count("misses")
+            self._send_json(404, {"error": {"message": "fixture not found", "type": "fixture_not_found"}})
+            return
+        if hit:
+            self.server.count("hits")
+
+        delay = self.server.delay(fixture, hit)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        if body.get("stream"):
+            self._send_stream(completion_id, body.get("model"), fixture, delay)
+            return
+        time.sleep(delay)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": fixture["content"]},
+                "finish_reason": "stop"
+            }],
+            "usage": fixture["usage"]
+        })
+
+    def _send_stream(self, completion_id, model, fixture, delay):
+        """按SSE格式分块返回回复，注入的延迟平均分布到每个分块上"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+
+        def chunk(delta, finish_reason=None, usage=None):
+            return json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": usage
+            }, ensure_ascii=False)
+
+        content = fixture["content"] or ""
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            send_event(chunk({"content": piece}))
+        send_event(chunk({}, "stop", fixture["usage"]))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start(mode="replay", path=None, host="127.0.0.1", port=0, upstream_url=None, upstream_key=None, latency=0.0, latency_scale=0.0):
+    """
+    在后台线程中启动替身服务
+    :param mode: record或replay
+    :param path: 夹具库路径，默认为config.LLM_STANDIN_PATH
+    :param port: 监听端口，0为随机端口
+    :param latency: 每次回复注入的固定延迟（秒）
+    :param latency_scale: 按录制耗时的比例注入延迟，1为按原速回放
+    :return: StandinServer，url属性可直接用作config.API_URL
+    """
+    store = FixtureStore(path or config.LLM_STANDIN_PATH)
+    server = StandinServer((host, port), store, mode, upstream_url, upstream_key, latency, latency_scale)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"LLM替身服务已启动（{mode}）：{server.url}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI兼容的LLM录制/回放替身服务")
+    parser.add_argument("--mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--path", default=config.LLM_STANDIN_PATH, help="夹具库路径")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upstream-url", default=config.API_URL, help="record模式转发的服务商地址")
+    parser.add_argument("--upstream-key", default=config.API_KEY, help="record模式转发的服务商密钥")
+    parser.add_argument("--latency", type=float, default=0.0, help="注入的固定延迟（秒）")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="按录制耗时的比例注入延迟")
+    args = parser.parse_args()
+
+    server = start(args.mode, args.path, args.host, args.port, args.upstream_url, args.upstream_key, args.latency, args.latency_scale)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import deque
+
+from config import config
+
+_lock = threading.Lock()
+# (任务ID, 调用阶段, 服务商, 模型) -> 统计数据
+_stats = {}
+
+
+def _new_entry():
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "retries": 0,
+        "cache_hits": 0,
+        "failures": 0,
+        "latency_total": 0.0,
+        "latencies": deque(maxlen=config.LLM_STATS_MAX_SAMPLES),
+        "updated_at": time.time()
+    }
+
+
+def record(stage, endpoint, usage=None, latency=0.0, retries=0, cache_hit=False, failed=False, task_id=None):
+    """
+    记录一次LLM调用
+    :param stage: 调用阶段
+    :param endpoint: 实际使用的接口，按服务商和模型分组统计路由
+    :param usage: 接口返回的usage，缓存命中时为None
+    :param latency: 调用耗时（秒），包含排队和重试
+    :param retries: 重试次数
+    :param cache_hit: 是否命中响应缓存
+    :param failed: 是否最终失败
+    :param task_id: 任务ID，默认为当前任务
+    """
+    key = (task_id if task_id is not None else config.TASK_ID or "", stage, endpoint.name, endpoint.model)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = _new_entry()
+        entry["calls"] += 1
+        entry["retries"] += retries
+        entry["latency_total"] += latency
+        entry["latencies"].append(latency)
+        entry["updated_at"] = time.time()
+        if cache_hit:
+            entry["cache_hits"] += 1
+        if failed:
+            entry["failures"] += 1
+        if usage:
+            entry["prompt_tokens"] += usage.prompt_tokens or 0
+            entry["completion_tokens"] += usage.completion_tokens or 0
+            # OpenAI兼容接口在prompt_tokens_details中返回，DeepSeek使用prompt_cache_hit_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            entry["cached_tokens"] += getattr(details, "cached_tokens", None) or getattr(usage, "prompt_cache_hit_tokens", None) or 0
+
+        # 只保留最近的任务
+        if len(_stats) > config.LLM_STATS_MAX_KEYS:
+            oldest = min(_stats, key=lambda k: _stats[k]["updated_at"])
+            del _stats[oldest]
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+def get_stats(task_id=None):
+    """
+    获取调用统计汇总
+    :param task_id: 任务ID，为None时返回所有任务
+    :return: 按任务、阶段、服务商和模型分组的统计列表
+    """
+    with _lock:
+        items = [(key, dict(entry, latencies=list(entry["latencies"]))) for key, entry in _stats.items()
+                 if task_id is None or key[0] == task_id]
+
+    result = []
+    for (task, stage, provider, model), entry in items:
+        latencies = entry["latencies"]
+        result.append({
+            "task_id": task,
+            "stage": stage,
+            "provider": provider,
+            "model": model,
+            "calls": entry["calls"],
+            "prompt_tokens": entry["prompt_tokens"],
+            "completion_tokens": entry["completion_tokens"],
+            "cached_tokens": entry["cached_tokens"],
+            "cached_ratio": round(entry["cached_tokens"] / entry["prompt_tokens"], 3) if entry["prompt_tokens"] else 0,
+            "retries": entry["retries"],
+            "cache_hits": entry["cache_hits"],
+            "failures": entry["failures"],
+            "latency_avg": round(entry["latency_total"] / entry["calls"], 3),
+            "latency_p50": _percentile(latencies, 50),
+            "latency_p90": _percentile(latencies, 90),
+            "latency_p99": _percentile(latencies, 99)
+        })
+    return result
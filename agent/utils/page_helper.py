@@ -1,6 +1,7 @@
 import json
 import os
 
+from utils import blob_store
 from utils.sql_helper import SQLiteHelper
 
 
@@ -27,7 +28,7 @@ def get_parent_page(page_id: str) -> dict:
     result = SQLiteHelper.fetch_one(sql, (page_id,))
     if result:
         page = json.loads(open(result[0], "r").read())
-        return page
+        return blob_store.hydrate_page(page)
     else:
         return {}
 
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from config import config
+from utils import fingerprint
+from utils.logger import logger
+
+# 只缓存不改变服务端状态的请求
+CACHEABLE_METHODS = ("GET", "HEAD", "OPTIONS")
+# 这些状态码说明目标暂时不可用，响应不缓存
+_TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+_lock = threading.Lock()
+# 缓存键 -> (任务ID, 响应, 大小, 过期时间, 主机)，最近使用的在末尾
+_entries = OrderedDict()
+_total_size = 0
+_lookups = 0
+_evicted = 0
+# 阶段 -> 命中统计
+_stats = {}
+
+
+def make_key(method, url, headers, body=None):
+    """
+    使用严格模式的请求指纹作为缓存键，cookie和认证头不同的请求不会共用响应
+    :return: 当前任务内的请求指纹
+    """
+    return fingerprint.fingerprint(method, url, headers, body=body, strict=True)
+
+
+def _cache_control(headers):
+    for name, value in headers.items():
+        if str(name).lower() == "cache-control":
+            return str(value).lower()
+    return ""
+
+
+def _count(stage, name):
+    stats = _stats.setdefault(stage, {"hit": 0, "miss": 0, "bypass": 0, "store": 0})
+    stats[name] += 1
+
+
+def lookup(method, url, headers, body=None, stage="default", no_cache=False):
+    """
+    查询请求的缓存响应
+    :param method: 请求方法
+    :param url: 完整URL
+    :param headers: 最终发送的请求头
+    :param body: 请求体
+    :param stage: 发起请求的阶段，用于分别统计命中率
+    :param no_cache: 为True时不使用也不写入缓存
+    :return: (缓存键, 响应)，请求不可缓存时缓存键为None，未命中时响应为None
+    """
+    if not config.RESPONSE_CACHE_ENABLE:
+        return None, None
+    if method.upper() not in CACHEABLE_METHODS:
+        # 参考RFC 7234 4.4，会改变服务端状态的请求使缓存失效，登录、上传后的页面可能已经变化，整个主机的缓存都失效
+        invalidate(url)
+        return None, None
+    global _lookups
+    control = _cache_control(headers)
+    with _lock:
+        _lookups += 1
+        need_log = _lookups % config.RESPONSE_CACHE_LOG_INTERVAL == 0
+        if no_cache or "no-store" in control or "no-cache" in control:
+            _count(stage, "bypass")
+            key, response = None, None
+        else:
+            key = make_key(method, url, headers, body)
+            entry = _entries.get(key)
+            if entry and entry[3] < time.time():
+                _remove(key)
+                entry = None
+            if entry:
+                _entries.move_to_end(key)
+                _count(stage, "hit")
+                response = entry[1]
+            else:
+                _count(stage, "miss")
+                response = None
+    if need_log:
+        log_stats()
+    return key, response
+
+
+def store(key, response, stage="default"):
+    """
+    写入缓存，响应声明no-store、设置了cookie或目标暂时不可用时不缓存
+    :param key: lookup返回的缓存键
+    :param response: PooledResponse
+    """
+    global _total_size
+    if key is None or response.status in _TRANSIENT_STATUS or "no-store" in _cache_control(response.headers):
+        return
+    if response.headers.get("Set-Cookie") is not None:
+        return
+    size = len(response.body) + 512
+    if size > config.RESPONSE_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        if key in _entries:
+            _remove(key)
+        _entries[key] = (config.TASK_ID or "", response, size, time.time() + config.RESPONSE_CACHE_TTL, _host(response.url))
+        _total_size += size
+        _count(stage, "store")
+        _evict()
+
+
+def _remove(key):
+    global _total_size
+    _total_size -= _entries.pop(key)[2]
+
+
+def _evict():
+    """超出条目数或总大小时淘汰最久未使用的缓存，调用方需持有锁"""
+    global _evicted
+    while _entries and (len(_entries) > config.RESPONSE_CACHE_MAX_ENTRIES or _total_size > config.RESPONSE_CACHE_MAX_BYTES):
+        _remove(next(iter(_entries)))
+        _evicted += 1
+
+
+def _host(url):
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    return scheme, (parts.hostname or "").lower(), parts.port or (443 if scheme == "https" else 80)
+
+
+def invalidate(url):
+    """删除当前任务中与url同一主机的缓存响应"""
+    task_id, host = config.TASK_ID or "", _host(url)
+    with _lock:
+        for key in [key for key, entry in _entries.items() if entry[0] == task_id and entry[4] == host]:
+            _remove(key)
+
+
+def clear(task_id=None):
+    """清除某个任务（默认为当前任务）的缓存响应"""
+    task_id = (config.TASK_ID or "") if task_id is None else task_id
+    with _lock:
+        for key in [key for key, entry in _entries.items() if entry[0] == task_id]:
+            _remove(key)
+
+
+def get_stats():
+    """获取各阶段的缓存命中统计"""
+    with _lock:
+        stages = {stage: dict(stats) for stage, stats in _stats.items()}
+        stats = {"entries": len(_entries), "size": _total_size, "evicted": _evicted}
+    for item in stages.values():
+        total = item["hit"] + item["miss"]
+        item["hit_rate"] = round(item["hit"] / total, 4) if total else 0
+    stats["stages"] = stages
+    return stats
+
+
+def log_stats():
+    """输出各阶段的缓存命中率"""
+    stats = get_stats()
+    if not stats["stages"]:
+        return
+    rates = "，".join(f"{stage} {item['hit_rate'] * 100:.1f}%({item['hit']}/{item['hit'] + item['miss']})"
+                     for stage, item in stats["stages"].items())
+    logger.info(f"响应缓存命中率：{rates}，缓存 {stats['entries']} 条，{stats['size'] / 1024:.0f}KB")
@@ -0,0 +1,169 @@
+import re
+import threading
+from collections import Counter
+from hashlib import blake2b
+
+from config import config
+from utils import fingerprint
+from utils.logger import logger
+
+_hidden_pattern = re.compile(r'<(script|style|noscript)\b[^>]*>.*?</\1\s*>|<!--.*?-->', re.DOTALL | re.IGNORECASE)
+_tag_pattern = re.compile(r'<\s*(/?)\s*([a-zA-Z][\w:-]*)[^>]*?(/?)\s*>')
+_word_pattern = re.compile(r'\w+')
+# CSRF令牌、会话ID、时间戳等每次请求都会变化的内容，统一替换后再计算特征
+_volatile_pattern = re.compile(r'^(?:[0-9a-fA-F]{16,}|[A-Za-z0-9_\-]{24,}|\d{6,})$')
+# 包含flag的页面始终作为新页面处理
+_flag_pattern = re.compile(r'flag\{', re.IGNORECASE)
+_void_tags = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+def extract_features(content):
+    """
+    提取页面特征：可见文本的词和相邻词对，以及DOM结构中的父子标签路径
+    :param content: 响应内容
+    :return: 特征 -> 出现次数
+    """
+    content = _hidden_pattern.sub(" ", str(content or ""))
+    features = Counter()
+
+    # DOM结构特征
+    stack = []
+    for closing, tag, self_closing in _tag_pattern.findall(content):
+        tag = tag.lower()
+        if closing:
+            if tag in stack:
+                while stack and stack.pop() != tag:
+                    pass
+            continue
+        features["dom:" + ">".join(stack[-2:] + [tag])] += 1
+        if not self_closing and tag not in _void_tags:
+            stack.append(tag)
+
+    # 可见文本特征
+    words = []
+    for word in _word_pattern.findall(_tag_pattern.sub(" ", content)):
+        words.append("<var>" if _volatile_pattern.match(word) else word.lower())
+    for word in words:
+        features["w:" + word] += 1
+    for first, second in zip(words, words[1:]):
+        features["b:" + first + " " + second] += 1
+    return features
+
+
+def simhash(features):
+    """
+    计算64位SimHash，相似的特征集合得到汉明距离较小的结果
+    :param features: 特征 -> 权重
+    """
+    vector = [0] * 64
+    for feature, weight in features.items():
+        value = int.from_bytes(blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(64):
+            if value >> i & 1:
+                vector[i] += weight
+            else:
+                vector[i] -= weight
+    result = 0
+    for i in range(64):
+        if vector[i] > 0:
+            result |= 1 << i
+    return result
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _bucket_key(request, status):
+    """
+    按请求方法、主机、路径、状态码和参数分桶，值为令牌、时间戳的参数（如防缓存的_=时间戳）不参与分桶
+    参数值不同的请求（如?id=1和?id=2）响应内容再相似也不合并，避免漏掉越权等只有少量差异的页面
+    """
+    canonical = fingerprint.canonical_request(request.get("method", "GET"), request.get("url", ""), {},
+                                              request.get("params") or request.get("param"), request.get("raw"))
+    params = tuple((name, value) for name, value in canonical["query"] + canonical["form"]
+                   if not _volatile_pattern.match(value))
+    return config.TASK_ID or "", canonical["method"], canonical["url"], status, params, str(canonical["body"])
+
+
+class PageIndex:
+    """
+    按任务和请求分桶的SimHash索引
+    同一个桶内与已有页面汉明距离不超过config.PAGE_SIMHASH_THRESHOLD的页面视为该页面的变体
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (任务ID, 方法, URL路径, 状态码, 参数, 请求体) -> [(simhash, 页面ID, URL)]
+        self.buckets = {}
+        # 任务ID -> 去重统计
+        self.stats = {}
+
+    def _stats(self, task_id):
+        stats = self.stats.get(task_id)
+        if stats is None:
+            stats = self.stats[task_id] = {"pages": 0, "duplicates": 0, "variants": 0}
+        return stats
+
+    def count_duplicate(self):
+        """记录一个与已有页面完全相同的页面"""
+        with self.lock:
+            stats = self._stats(config.TASK_ID or "")
+            stats["pages"] += 1
+            stats["duplicates"] += 1
+
+    def add(self, page_id, request, response):
+        """
+        查找近似页面，没有找到时把页面加入索引
+        :param page_id: 页面ID
+        :param request: 页面记录中的请求
+        :param response: 页面记录中的响应
+        :return: 近似的已有页面ID，没有时返回None
+        """
+        task_id = config.TASK_ID or ""
+        content = str(response.get("content", ""))
+        features = extract_features(content) if config.PAGE_SIMHASH_ENABLE else {}
+        # 特征太少的页面（如简短的接口响应）少量差异就是全部内容，不做近似判断
+        comparable = len(features) >= config.PAGE_SIMHASH_MIN_FEATURES and not _flag_pattern.search(content)
+        value = simhash(features) if comparable else None
+        bucket_key = _bucket_key(request, response.get("status")) if comparable else None
+
+        match = None
+        with self.lock:
+            stats = self._stats(task_id)
+            stats["pages"] += 1
+            if value is None:
+                return None
+            bucket = self.buckets.setdefault(bucket_key, [])
+            for existing, existing_id, existing_url in bucket:
+                distance = hamming(value, existing)
+                if distance <= config.PAGE_SIMHASH_THRESHOLD:
+                    match = (existing_id, existing_url, distance)
+                    break
+            if match:
+                stats["variants"] += 1
+            else:
+                bucket.append((value, page_id, request.get("url", "")))
+        if match:
+            logger.info(f"页面 {request.get('url', '')} 与已有页面 {match[1]} 近似（汉明距离 {match[2]}），作为变体不再重复分析")
+            return match[0]
+        return None
+
+    def clear(self, task_id=None):
+        """清除某个任务（默认为当前任务）的索引和统计"""
+        task_id = (config.TASK_ID or "") if task_id is None else task_id
+        with self.lock:
+            self.buckets = {key: bucket for key, bucket in self.buckets.items() if key[0] != task_id}
+            self.stats.pop(task_id, None)
+
+    def get_stats(self, task_id=None):
+        """获取某个任务（默认为当前任务）的页面去重统计，去重率为重复和近似页面占全部页面的比例"""
+        task_id = (config.TASK_ID or "") if task_id is None else task_id
+        with self.lock:
+            stats = dict(self.stats.get(task_id, {"pages": 0, "duplicates": 0, "variants": 0}))
+        skipped = stats["duplicates"] + stats["variants"]
+        stats["dedup_ratio"] = round(skipped / stats["pages"], 4) if stats["pages"] else 0
+        return stats
+
+
+page_index = PageIndex()
@@ -0,0 +1,144 @@
+import re
+from typing import List, Dict
+
+from config import config
+from utils.logger import logger
+
+# 按BPE分词器的预分词规则近似切分文本：中日韩字符、英文单词、数字、空白、标点符号
+_pieces = re.compile(r"(?P<cjk>[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]+)"
+                     r"|(?P<word>[A-Za-z]+)"
+                     r"|(?P<digit>[0-9]+)"
+                     r"|(?P<space>\s+)"
+                     r"|(?P<punct>[\x21-\x2f\x3a-\x40\x5b-\x60\x7b-\x7e]+)"
+                     r"|(?P<other>.)", re.S)
+
+# 每条消息的角色和分隔符额外占用的token数
+MESSAGE_OVERHEAD = 4
+
+truncate_marker = "\n...(内容过长，已省略约{tokens}个token)...\n"
+omitted_message = "(较早的{count}条消息因长度限制已省略)"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的token数，不依赖服务商的分词器，结果略微偏大以避免超出上下文
+    中日韩字符每个字符按1个token计算，英文单词每4个字母1个token，数字每3位1个token，
+    连续的标点符号每2个字符1个token，连续空白按1个token计算
+    :param text: 文本
+    :return: 估算的token数
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for match in _pieces.finditer(text):
+        kind = match.lastgroup
+        length = match.end() - match.start()
+        if kind == "cjk" or kind == "other":
+            tokens += length
+        elif kind == "word":
+            tokens += (length + 3) // 4
+        elif kind == "digit":
+            tokens += (length + 2) // 3
+        elif kind == "space":
+            tokens += 1 if length > 1 else 0
+        else:
+            tokens += (length + 1) // 2
+    return tokens
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def context_budget(model: str) -> int:
+    """
+    获取模型可用于提示词的token预算：上下文窗口减去为回复预留的token
+    :param model: 模型名称
+    """
+    window = config.LLM_CONTEXT_TOKENS.get(model, config.LLM_DEFAULT_CONTEXT_TOKENS)
+    return window - config.LLM_REPLY_RESERVE_TOKENS
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """
+    将文本截断到指定token数以内，保留开头和结尾，中间替换为省略标记
+    开头通常是状态行、响应头和页面结构，结尾通常是工具的执行结果，都比中间内容更重要
+    :param text: 文本
+    :param max_tokens: 最大token数
+    :return: 截断后的文本
+    """
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    keep = int(len(text) * max_tokens / total)
+    while keep > 0:
+        head = keep * 2 // 3
+        tail = keep - head
+        result = text[:head] + truncate_marker.format(tokens=total - max_tokens) + (text[-tail:] if tail else "")
+        if estimate_tokens(result) <= max_tokens:
+            return result
+        keep = int(keep * 0.9)
+    return ""
+
+
+def pack_messages(prompt: str, messages: List[Dict[str, str]], model: str, message_limit=None, pinned=1) -> List[Dict[str, str]]:
+    """
+    将系统提示词和消息列表装入模型的上下文预算
+    固定保留开头的pinned条消息（上下文、任务描述或会话摘要）和最新的一条消息，
+    其余消息从新到旧依次放入，放不下的较早消息截断为简短的片段，预算用完后更早的消息替换为省略说明
+    :param prompt: 系统提示词
+    :param messages: 消息列表
+    :param model: 模型名称，用于确定上下文预算
+    :param message_limit: 单条消息的最大token数，不限制最新的一条消息，为None时不限制
+    :param pinned: 固定保留的开头消息数量
+    :return: 装入预算后的消息列表
+    """
+    if not messages:
+        return messages
+    budget = context_budget(model) - estimate_tokens(prompt)
+    pinned = min(pinned, len(messages) - 1)
+    head, middle, last = messages[:pinned], messages[pinned:-1], messages[-1]
+
+    def cap(message, limit):
+        content = truncate(message["content"], limit)
+        return message if content is message["content"] else {"role": message["role"], "content": content}
+
+    if message_limit:
+        head = [cap(m, message_limit) for m in head]
+        middle = [cap(m, message_limit) for m in middle]
+
+    # 固定保留的消息超出预算时平分预算，最新的消息至少保留一半预算
+    head_tokens = estimate_messages_tokens(head)
+    if head and head_tokens > budget // 2:
+        share = budget // 2 // len(head) - MESSAGE_OVERHEAD
+        head = [cap(m, share) for m in head]
+        head_tokens = estimate_messages_tokens(head)
+    last = cap(last, budget - head_tokens - MESSAGE_OVERHEAD)
+    remaining = budget - head_tokens - estimate_messages_tokens([last])
+
+    # 为省略说明预留空间
+    remaining -= estimate_tokens(omitted_message) + MESSAGE_OVERHEAD
+    packed = []
+    truncated = 0
+    for message in reversed(middle):
+        tokens = estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+        if tokens <= remaining:
+            packed.append(message)
+            remaining -= tokens
+            continue
+        stub = min(config.PACK_STUB_TOKENS, remaining - MESSAGE_OVERHEAD)
+        if stub < config.PACK_STUB_TOKENS // 4:
+            break
+        packed.append(cap(message, stub))
+        remaining -= stub + MESSAGE_OVERHEAD
+        truncated += 1
+
+    omitted = len(middle) - len(packed)
+    if omitted:
+        packed.append({"role": "user", "content": omitted_message.format(count=omitted)})
+    if truncated or omitted:
+        logger.info(f"提示词超出{model}的上下文预算，截断{truncated}条消息，省略{omitted}条消息")
+    return head + packed[::-1] + [last]